@@ -1,20 +1,23 @@
 from __future__ import annotations
 import graphlib
-from operator import le
-from pprint import pprint
-from turtle import color
 import typing
-from matplotlib import use
 import networkx as nx
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
+import numpy as np
 import random
 import itertools 
 import copy
 import sys
+import os
 import json
-
-import settings
+import hashlib
+import math
+import time
+import contextlib
+import functools
+import gc
+import heapq
+import concurrent.futures
+from fractions import Fraction
 
 from typing import Callable, Optional,Union,Any
 import yaml
@@ -22,28 +25,370 @@ import yaml
 from typing import TYPE_CHECKING
 
 
-sys.setrecursionlimit(10**7) 
+# libyaml is used for reading and writing .yml files if PyYAML is built with it.
+_YAML_LOADER = getattr(yaml,"CSafeLoader",yaml.SafeLoader)
+_YAML_DUMPER = getattr(yaml,"CDumper",yaml.Dumper)
 
 
-def _attach_scc_id(self)->tuple[Union[nx.MultiDiGraph,nx.DiGraph],int]:
+def _attach_scc_id(graph:Union[nx.MultiDiGraph,nx.DiGraph])->tuple[Union[nx.MultiDiGraph,nx.DiGraph],int]:
         """attach scc_id to nx.Digraph and nx.MultiDigraph
         
         Attach scc_id (same value for same scc) as an attribute to the graph.
 
+        Args:
+            graph (Union[nx.MultiDiGraph,nx.DiGraph]): graph
+
         Returns:
             tuple[Union[nx.MultiDiGraph,nx.DiGraph],int]: Graph after scc_id is assigned, Number of SCCs.
         """
-        assert(isinstance(self,nx.MultiDiGraph) or isinstance(self,nx.DiGraph))
+        assert(isinstance(graph,nx.MultiDiGraph) or isinstance(graph,nx.DiGraph))
 
         scc_id = 1
         
-        for comp in sorted(nx.strongly_connected_components(self), key=len, reverse=True):
+        for comp in sorted(nx.strongly_connected_components(graph), key=len, reverse=True):
             for node in comp:
-                self.nodes[node]["scc_id"] = scc_id
+                graph.nodes[node]["scc_id"] = scc_id
             scc_id += 1
 
-        return self,scc_id-1
+        return graph,scc_id-1
+
+
+class Profile:
+    """
+    Statistics recorded while MAModel.profile is active.
+
+    Attributes:
+        phases(dict): {phase name : [seconds,calls]}. The phases nest, e.g. predict_labels includes split_predecessors and make_a_judge.
+        counters(dict): {counter name : count}, e.g. conditions_evaluated, judges_folded.
+        edges_scanned(dict): {vertex : number of in-edges scanned to predict it}
+        node_seconds(dict): {vertex : seconds spent to predict it} (per-vertex predictions only)
+        num_slowest_nodes(int): number of the slowest vertices reported by as_dict.
+    """
+
+    def __init__(self,num_slowest_nodes:int = 10):
+        self.phases : dict[str,list] = {}
+        self.counters : dict[str,int] = {}
+        self.edges_scanned : dict = {}
+        self.node_seconds : dict = {}
+        self.num_slowest_nodes = num_slowest_nodes
+
+        return
+
+    def add(self,name:str,seconds:float,calls:int = 1):
+        """Add the wall time of a phase."""
+        phase = self.phases.setdefault(name,[0.0,0])
+        phase[0] += seconds
+        phase[1] += calls
+
+        return
+
+    def count(self,name:str,n:int = 1):
+        """Increment a counter."""
+        self.counters[name] = self.counters.get(name,0) + n
+
+        return
+
+    def add_edges_scanned(self,node:Any,n:int):
+        """Add the number of in-edges scanned for a vertex."""
+        self.edges_scanned[node] = self.edges_scanned.get(node,0) + n
+
+        return
+
+    def add_node_seconds(self,node:Any,seconds:float):
+        """Add the time spent to predict a vertex."""
+        self.node_seconds[node] = self.node_seconds.get(node,0.0) + seconds
+
+        return
+
+    @contextlib.contextmanager
+    def phase(self,name:str):
+        """Context manager measuring the wall time of a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name,time.perf_counter() - start)
+
+    def as_dict(self)->dict:
+        """
+        Returns:
+            dict: phases, counters, summary of edges_scanned and the slowest vertices. The values are JSON serializable.
+        """
+        edges = list(self.edges_scanned.values())
+        slowest = sorted(self.node_seconds.items(),key=lambda item:item[1],reverse=True)[:self.num_slowest_nodes]
+
+        return {
+            "phases" : {name:{"seconds":seconds,"calls":calls} for name,(seconds,calls) in self.phases.items()},
+            "counters" : dict(self.counters),
+            "edges_scanned" : {
+                "nodes" : len(edges),
+                "total" : sum(edges),
+                "max" : max(edges,default=0),
+                "mean" : sum(edges) / len(edges) if edges else 0,
+            },
+            "slowest_nodes" : [
+                {"node":_json_value(node),"seconds":seconds,"edges_scanned":self.edges_scanned.get(node,0)}
+                for node,seconds in slowest
+            ],
+        }
+
+    def to_json(self,**kwargs)->str:
+        """as_dict as JSON. kwargs are passed to json.dumps."""
+        return json.dumps(self.as_dict(),**kwargs)
+
+
+def _json_value(value:Any)->Any:
+    """value as is if JSON can represent it, otherwise str(value)."""
+    if isinstance(value,(int,float,str,bool)) or value is None:
+        return value
+    return str(value)
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    """
+    Pause the cyclic garbage collector while millions of objects are made, none of which is garbage.
+    Otherwise the collector runs again and again over all the objects made so far.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _profiled(name:str,per_node:bool = False):
+    """
+    Decorator recording the wall time of a MAModel method as a phase while the model is profiled.
+    When the model is not profiled, the only overhead is a check of self._profile.
+
+    Args:
+        name (str): phase name
+        per_node (bool, optional): whether the first argument is a vertex whose time is also recorded. Defaults to False.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self,*args,**kwargs):
+            prof = self._profile
+            if prof is None:
+                return method(self,*args,**kwargs)
+
+            start = time.perf_counter()
+            try:
+                return method(self,*args,**kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                prof.add(name,seconds)
+                if per_node:
+                    prof.add_node_seconds(args[0] if args else next(iter(kwargs.values())),seconds)
+        return wrapper
+    return decorator
+
+
+class JudgeTrace:
+    """
+    Judges of the conditions recorded by the predictions while MAModel.trace_judges is True.
+    The entries are kept in arrays allocated once for all the conditions of the graph.
+    The conditions of the vertex at position i in nodes are cond_ptr[i]:cond_ptr[i+1].
+
+    Attributes:
+        nodes(list): vertices in the order of graph.nodes.
+        index(dict): vertex -> position in nodes.
+        cond_ptr(np.ndarray): see above.
+        A_weight,B_weight(np.ndarray): A_weight and B_weight of each condition.
+        code(np.ndarray): judge code of each condition (1 for S1, ..., 8 for S8). 0 if not recorded yet.
+        no_weight(np.ndarray): whether all_weight was 0 (A_weight and B_weight are the integer 0).
+    """
+
+    def __init__(self,graph:nx.MultiDiGraph):
+        """Allocate the arrays for the conditions of graph.
+
+        Args:
+            graph (nx.MultiDiGraph): graph of the model
+        """
+        self.nodes = list(graph.nodes)
+        self.index = {node:i for i,node in enumerate(self.nodes)}
+        self.cond_ptr = np.zeros(len(self.nodes)+1,dtype=np.int64)
+        self.cond_ptr[1:] = np.cumsum([len(conditions) for _,conditions in graph.nodes(data='conditions')])
+
+        num_cond = int(self.cond_ptr[-1])
+        self.A_weight = np.zeros(num_cond,dtype=np.float64)
+        self.B_weight = np.zeros(num_cond,dtype=np.float64)
+        self.code = np.zeros(num_cond,dtype=np.int8)
+        self.no_weight = np.zeros(num_cond,dtype=bool)
+
+        return
+
+    def fits(self,graph:nx.MultiDiGraph,u:Any)->bool:
+        """Whether u has the slots for its conditions, i.e. u is in the arrays and the number of its conditions is the same as when allocated."""
+        i = self.index.get(u)
+
+        return i is not None and int(self.cond_ptr[i+1] - self.cond_ptr[i]) == len(graph.nodes[u]['conditions'])
+
+    def relayout(self,graph:nx.MultiDiGraph):
+        """
+        Allocate the arrays again for the vertices and the conditions of graph, e.g. after the conditions of a vertex were edited directly.
+        The judges of the vertices having the same number of conditions are kept.
+
+        Args:
+            graph (nx.MultiDiGraph): graph of the model
+        """
+        old = copy.copy(self)
+        self.__init__(graph)
+
+        for node,j in old.index.items():
+            i = self.index.get(node)
+            if i is None:
+                continue
+            c0,c1 = int(old.cond_ptr[j]),int(old.cond_ptr[j+1])
+            d0,d1 = int(self.cond_ptr[i]),int(self.cond_ptr[i+1])
+            if c1 - c0 != d1 - d0:
+                continue
+            self.A_weight[d0:d1] = old.A_weight[c0:c1]
+            self.B_weight[d0:d1] = old.B_weight[c0:c1]
+            self.code[d0:d1] = old.code[c0:c1]
+            self.no_weight[d0:d1] = old.no_weight[c0:c1]
+
+        return
+
+    def record(self,u:Any,k:int,A_weight:float,B_weight:float,code:int,no_weight:bool):
+        """Record the judge of the k-th condition of vertex u. The slots of u must fit its conditions (see fits and MAModel._judge_trace)."""
+        c = self.cond_ptr[self.index[u]] + k
+        self.A_weight[c] = A_weight
+        self.B_weight[c] = B_weight
+        self.code[c] = code
+        self.no_weight[c] = no_weight
+
+        return
+
+    def entries(self,u:Any)->list[tuple[int,float,float,int]]:
+        """
+        Args:
+            u (Any): vertex
+
+        Returns:
+            list[tuple[int,float,float,int]]: (condition index, A_weight, B_weight, judge code) of the recorded conditions of u.
+        """
+        i = self.index[u]
+        c0,c1 = int(self.cond_ptr[i]),int(self.cond_ptr[i+1])
+
+        return [
+            (k,a,b,code)
+            for k,(a,b,code) in enumerate(zip(self.A_weight[c0:c1].tolist(),self.B_weight[c0:c1].tolist(),self.code[c0:c1].tolist()))
+            if code != 0
+        ]
+
+    def format(self,u:Any)->list[str]:
+        """Judges of u as text, e.g. 'A:1.0,B:2.0,S4' ('A:0,B:0,S4' when there is no weight)."""
+        i = self.index[u]
+        c0,c1 = int(self.cond_ptr[i]),int(self.cond_ptr[i+1])
+
+        return [
+            f'A:0,B:0,S{code}' if z else f'A:{a},B:{b},S{code}'
+            for a,b,z,code in zip(self.A_weight[c0:c1].tolist(),self.B_weight[c0:c1].tolist(),self.no_weight[c0:c1].tolist(),self.code[c0:c1].tolist())
+            if code != 0
+        ]
+
+
+class DynamicsResult:
+    """
+    Result of MAModel.run_dynamics.
+
+    Attributes:
+        mode(str): 'sync' or 'async'.
+        converged(bool): whether a fixed point was reached: every label is in its own predicted_labels (or nothing is predicted).
+        cycle_start(Optional[int]): the step from which the labels repeat, None if no cycle was found. A fixed point is not a cycle.
+        cycle_length(Optional[int]): the period of the cycle, None if no cycle was found.
+        steps(int): number of steps run.
+        evaluations(int): number of predictions computed.
+        changes(int): number of labels changed.
+        frontier_sizes(list[int]): number of vertices evaluated in each step.
+        changed_sizes(list[int]): number of labels changed in each step.
+        history(list[list[tuple]]): (vertex,old label,new label) of the changes in each step.
+        seconds(float): wall time.
+    """
+
+    def __init__(self,mode:str):
+        self.mode = mode
+        self.converged = False
+        self.cycle_start : Optional[int] = None
+        self.cycle_length : Optional[int] = None
+        self.steps = 0
+        self.evaluations = 0
+        self.changes = 0
+        self.frontier_sizes : list[int] = []
+        self.changed_sizes : list[int] = []
+        self.history : list[list[tuple]] = []
+        self.seconds = 0.0
+
+        return
+
+    def as_dict(self)->dict:
+        """
+        Returns:
+            dict: the statistics without history. The values are JSON serializable.
+        """
+        return {
+            "mode" : self.mode,
+            "converged" : self.converged,
+            "cycle_start" : self.cycle_start,
+            "cycle_length" : self.cycle_length,
+            "steps" : self.steps,
+            "evaluations" : self.evaluations,
+            "changes" : self.changes,
+            "max_frontier" : max(self.frontier_sizes,default=0),
+            "frontier_sizes" : list(self.frontier_sizes),
+            "changed_sizes" : list(self.changed_sizes),
+            "seconds" : self.seconds,
+        }
+
+
+class WeightInterval:
+    """
+    Interval of the weight of a vertex, found by MAModel.weight_sensitivity.
+    The bounds are exact (int or Fraction), or -math.inf and math.inf when unbounded.
+
+    Attributes:
+        low,high(Union[int,Fraction,float]): the bounds.
+        low_closed,high_closed(bool): whether the bounds are in the interval.
+    """
+
+    def __init__(self,low:Union[int,Fraction,float] = -math.inf,high:Union[int,Fraction,float] = math.inf,low_closed:bool = False,high_closed:bool = False):
+        self.low = low
+        self.high = high
+        self.low_closed = low_closed and low != -math.inf
+        self.high_closed = high_closed and high != math.inf
+
+        return
+
+    def __contains__(self,weight:Union[int,float,Fraction])->bool:
+        above = self.low < weight or (self.low_closed and self.low == weight)
+        below = weight < self.high or (self.high_closed and self.high == weight)
+        return above and below
 
+    def __eq__(self,other)->bool:
+        if not isinstance(other,WeightInterval):
+            return NotImplemented
+        return (self.low,self.high,self.low_closed,self.high_closed) == (other.low,other.high,other.low_closed,other.high_closed)
+
+    def intersection(self,other:WeightInterval)->WeightInterval:
+        """The intersection of two intervals containing the same weight."""
+        if (other.low,not other.low_closed) > (self.low,not self.low_closed):
+            low,low_closed = other.low,other.low_closed
+        else:
+            low,low_closed = self.low,self.low_closed
+
+        if (other.high,other.high_closed) < (self.high,self.high_closed):
+            high,high_closed = other.high,other.high_closed
+        else:
+            high,high_closed = self.high,self.high_closed
+
+        return WeightInterval(low,high,low_closed,high_closed)
+
+    def __repr__(self)->str:
+        return f"{'[' if self.low_closed else '('}{_number(self.low)},{_number(self.high)}{']' if self.high_closed else ')'}"
 
 
 class MAModel():
@@ -51,21 +396,116 @@ class MAModel():
 
     Attributes:
         graph(nx.MultiDigraph):the graph of the model. This has a lot of attributes such as graph.graph["label_list"].More information about the attributes attached are located in the ripository.
+            Change it with set_label, set_weight, add_edge and remove_edge. After editing it directly (e.g. graph.edges[u,v,key]['attack'] or graph.add_edge), call reset_caches.
         only_attack(bool):Specifies whether the model is likely to contain edges other than the attack edges as True or False. self.convert_subset_cond_to_simple_cond don't work properly when only_attack attributes is False.
+        trace_judges(bool):Whether the predictions record the judge of every condition in judge_trace. See get_judges. Defaults to False.
+        exact_arithmetic(bool):Whether the weights and the bounds of the conditions are compared exactly (int and Fraction) instead of in floating point. Defaults to False.
+        judge_trace(JudgeTrace):the judges recorded while trace_judges is True.
     """
 
     def __init__(self):
         
         self.graph : nx.MultiDiGraph= None
         self.only_attack = None
-        nx.MultiDiGraph.attach_scc_id = _attach_scc_id
-        nx.DiGraph.attach_scc_id = _attach_scc_id
 
         self.__DASH1 = 10000       #support -> attack
         self.__DASH2 = 100000000   #complex_cond -> simple_cond 
 
+        # Used by the mutation API (set_label etc.). See _build_aggregates.
+        self._aggregates : Optional[dict] = None
+        self._edge_pairs : Optional[dict] = None
+        self._dirty : set = set()
+
+        # vertex -> _CompiledConditions used by predict_labels, and vertex -> position in graph.nodes. See _node_positions.
+        self._compiled : dict = {}
+        self._positions : Optional[dict] = None
+
+        # scc and degrees used by visualize, and the version of the vertices and the edges they were found for.
+        # The version is counted up by add_edge, remove_edge and reset_caches (also when the graph is read or generated). See _structure_summary.
+        self._structure : Optional[dict] = None
+        self._structure_version = 0
+
+        # hash of the vertices and the edges -> layout. See _layout_key and _store_layout.
+        self._layouts : dict = {}
+
+        # Statistics while profile() is active. See Profile.
+        self._profile : Optional[Profile] = None
+
+        self.trace_judges = False
+        self.judge_trace : Optional[JudgeTrace] = None
+
+        # Compare A_weight and B_weight with the bounds by cross-multiplying. See _exact_judge_code.
+        self.exact_arithmetic = False
+
         return
-    
+
+    def get_judges(self,u:Any)->list[str]:
+        """
+        Judges of the conditions of vertex u recorded by the last prediction, as text (e.g. 'A:1.0,B:2.0,S4').
+        Nothing is recorded unless trace_judges is True.
+
+        Args:
+            u (Any): vertex
+
+        Returns:
+            list[str]: judges
+        """
+        if self.judge_trace is None or u not in self.judge_trace.index:
+            return []
+
+        return self.judge_trace.format(u)
+
+    def _judge_trace(self,u:Any = None)->Optional[JudgeTrace]:
+        """
+        judge_trace to record the judges in, allocated if needed. None (and the old judges are forgotten) if trace_judges is False.
+        With u, the arrays are laid out again if they have no slots for the conditions of u (they were edited directly).
+        """
+        if not self.trace_judges:
+            self.judge_trace = None
+            return None
+
+        if self.judge_trace is None or len(self.judge_trace.nodes) != self.graph.number_of_nodes():
+            self.judge_trace = JudgeTrace(self.graph)
+        elif u is not None and not self.judge_trace.fits(self.graph,u):
+            self.judge_trace.relayout(self.graph)
+
+        return self.judge_trace
+
+    @contextlib.contextmanager
+    def profile(self,callback:Optional[Callable[[dict],Any]] = None,num_slowest_nodes:int = 10)->typing.Iterator[Profile]:
+        """
+        Record the wall time of each phase (reading, predicting, judging, folding, visualizing, ...), call counts,
+        the edges scanned for each vertex, the number of conditions evaluated and the slowest vertices while the context is active.
+        Nothing is recorded, and almost nothing is paid, outside the context.
+
+            with model.profile() as prof:
+                model.predict_all()
+            print(prof.to_json(indent=2))
+
+        Args:
+            callback (Callable[[dict],Any], optional): called with Profile.as_dict() when the context exits. Defaults to None.
+            num_slowest_nodes (int, optional): number of the slowest vertices reported. Defaults to 10.
+
+        Yields:
+            Profile: the statistics
+        """
+        prof = Profile(num_slowest_nodes=num_slowest_nodes)
+        previous = self._profile
+        self._profile = prof
+        try:
+            yield prof
+        finally:
+            self._profile = previous
+            if callback is not None:
+                callback(prof.as_dict())
+
+    def _phase(self,name:str)->typing.ContextManager:
+        """Profile.phase while profiled, otherwise a context doing nothing."""
+        if self._profile is None:
+            return contextlib.nullcontext()
+        return self._profile.phase(name)
+
+    @_profiled("read_yaml")
     def read_yaml(self,path:str) -> None:
         """
         Read the .yml file specified to create the model.
@@ -79,79 +519,111 @@ class MAModel():
 
         self.graph = nx.MultiDiGraph()
         G = self.graph
+        self._reset_aggregates()
 
-        ymlstr = ""
+        # libyaml (CSafeLoader) is much faster than the pure python loader when it is available.
         with open(path,'r') as f:
-            ymlstr = f.read()
+            try:
+                ymlinfo = yaml.load(f,Loader=_YAML_LOADER)
+            except yaml.constructor.ConstructorError:
+                # python specific tags which only the full loader can construct
+                f.seek(0)
+                ymlinfo = yaml.full_load(f)
 
+        # graph
 
-        ymlinfo = yaml.full_load(ymlstr)
+        G.graph['label_list'] = ymlinfo["attr_graph"]["label_list"]
 
-        # constract graph
+        # node
 
-        nodes = ymlinfo["nodes"]
-        G.add_nodes_from(nodes)
+        attr_node = ymlinfo["attr_node"]
 
-        edgeinfo = ymlinfo["edges"]
+        if "weights" not in attr_node:
+            print("Warning: weight is not specified in the model. weight is set to 1.",file=sys.stderr)
 
-        only_attack = True
+        def subset_to_tuple(c):
+            c[3] = tuple(c[3])
+            return c
 
-        for content in edgeinfo:
-            u = content[0]
-            v = content[1]
-            is_attack = content[2]
+        def node_attributes(node):
+            attributes = {
+                'label' : attr_node['label'][node],
+                'skew_type' : attr_node['skew_type'][node],
+            }
 
-            only_attack = only_attack and is_attack
+            if not attr_node["use_subset_cond"]:
+                attributes['conditions'] = [ tuple(c) for c in  attr_node['conditions'][node] ]
+            else:
+                attributes['conditions'] = [ tuple(subset_to_tuple(c)) for c in  attr_node['conditions'][node] ]
 
-            color = "hogehoge"
+            if "weights" not in attr_node:
+                attributes['weight'] = 1
+            else :
+                attributes['weight'] = attr_node['weights'][node]
 
-            if is_attack:
-                color = "red"
-            else:
-                color = "blue"
+            if 'opinion' in attr_node and node in attr_node['opinion']:
+                attributes['opinion'] = attr_node['opinion'][node]
 
+            return attributes
 
-            G.add_edge(u,v,attack=is_attack,color=color)
-        
-        self.only_attack = only_attack
+        edgeinfo = ymlinfo["edges"]
 
-        # setting attributes with yaml
+        # vertices appearing only in the edges come after the listed ones.
+        nodes = dict.fromkeys(ymlinfo["nodes"])
+        for u,v,_ in edgeinfo:
+            nodes.setdefault(u)
+            nodes.setdefault(v)
 
-        # graph
+        G.add_nodes_from((node,node_attributes(node)) for node in nodes)
 
-        G.graph['label_list'] = ymlinfo["attr_graph"]["label_list"]
+        # edges
 
-        # node
+        G.add_edges_from(
+            (u,v,{'attack':is_attack,'color':("red" if is_attack else "blue")})
+            for u,v,is_attack in edgeinfo
+        )
 
-        attr_node = ymlinfo["attr_node"]
-        
-        for node in G.nodes():
-            G.nodes[node]['label'] = attr_node['label'][node]
-            G.nodes[node]['skew_type'] = attr_node['skew_type'][node]
+        self.only_attack = all(content[2] for content in edgeinfo)
 
+        return
 
-            if not attr_node["use_subset_cond"]:
-                G.nodes[node]['conditions'] = [ tuple(c) for c in  attr_node['conditions'][node] ]
-            else:
-                def subset_to_tuple(c):
-                    c[3] = tuple(c[3])
-                    return c
-                G.nodes[node]['conditions'] = [ tuple(subset_to_tuple(c)) for c in  attr_node['conditions'][node] ]
-            
-            if "weights" not in attr_node:
-                G.nodes[node]['weight'] = 1
-                print("Warning: weight is not specified in the model. weight is set to 1.",file=sys.stderr)
-            else :
-                G.nodes[node]['weight'] = attr_node['weights'][node]
+    @_profiled("read_npz")
+    def read_npz(self,path:str) -> None:
+        """
+        Read the .npz file saved by save_npz to create the model.
+        This is much faster than read_yaml, but it is not a sub-second reload of large models: most of the time is spent building
+        the networkx graph (about 10 s for 250k vertices and 1M edges). Only CompactMAModel.read_npz, which keeps the arrays
+        without networkx, reads such a model in under a second (about 0.7 s).
+
+        Args:
+            path (str): the path to the .npz file
 
-            if 'opinion' in attr_node:
-                G.nodes[node]['opinion'] = attr_node['opinion'][node]
+        """
+        compact = CompactMAModel()
+        compact.read_npz(path)
+
+        self.graph = compact.to_model().graph
+        self.only_attack = bool(compact.edge_attack.all())
+        self._reset_aggregates()
+
+        return
 
+    @_profiled("save_npz")
+    def save_npz(self,path:str = "output.npz"):
+        """
+        save the model in a compact binary format (.npz, numpy arrays).
+        you can use the saved model using read_npz method (or CompactMAModel.read_npz).
+        The vertices must be integers. Labels are saved as the positions in label_list.
 
+        Args:
+            path (str, optional): path to the new .npz file. Defaults to "output.npz".
 
+        """
+        CompactMAModel.from_model(self).save_npz(path)
 
         return
 
+    @_profiled("save_yaml")
     def save_yaml(self,path:str = "output.yml"):
         """
         save the model in .yml format.
@@ -188,12 +660,13 @@ class MAModel():
 
         def subset_to_list(c):
 
+            # lists rather than tuples, so that the file can be read with the safe loader.
             if len(c) == 3:
-                return c
+                return list(c)
             if len(c) == 4:
                 return [c[0],c[1],c[2],list(c[3])]
             
-            assert(False,"error")
+            assert False,"error"
 
             return
 
@@ -216,7 +689,7 @@ class MAModel():
 
 
         with open(path,"w") as file:
-            yaml.dump(content,file)
+            yaml.dump(content,file,Dumper=_YAML_DUMPER)
         
         return
             
@@ -290,6 +763,7 @@ class MAModel():
         
         self.graph = G
         self.graph.graph['label_list'] = [1,2,3]
+        self._reset_aggregates()
 
         # attach weight to each node
 
@@ -302,17 +776,134 @@ class MAModel():
         return G
 
 
-    def attach_label_randomly(self):
+    def generate_graph(
+        self,
+        num_vertex:int = 10,
+        max_indegree:int = 4,
+        max_outdegree:int = 4,
+        num_edges:Optional[int] = None,
+        only_attack = False,
+        avoid_self_loop = False,
+        attach_weight = True,
+        seed:Union[int,np.random.Generator,None] = None)->nx.MultiDiGraph:
+        """generate a random graph
+        The same kind of graph as init_graph (degree-bounded multigraph with attack/support edges, weights, label_list [1,2,3]),
+        but the edges are sampled with numpy in O(E) and the result is reproducible with seed. This scales to millions of vertices.
+
+        Each vertex has max_outdegree out-slots and max_indegree in-slots, and each edge pairs a random free out-slot with a random free in-slot,
+        so the degree bounds always hold. Pairs which duplicate an edge (tail,head,attack) or make a forbidden self-loop are sampled again a few times.
+
+        Args:
+            num_vertex (int, optional): the number of vertices. Defaults to 10.
+            max_indegree (int, optional): maximum number of indegrees allowed. Defaults to 4.
+            max_outdegree (int, optional): maximum number of outdegrees allowed. Defaults to 4.
+            num_edges (Optional[int], optional): the number of edges. If None, it is drawn in the same way as init_graph (biased toward the smaller). Defaults to None.
+            only_attack (bool, optional): specify whether to allow support on the edge.
+            avoid_self_loop (bool, optional): specify whether to avoid creating self-loops. Defaults to False.
+            attach_weight (bool, optional): give random weights 1-5 if True, otherwise 1. Defaults to True.
+            seed (Union[int,np.random.Generator,None], optional): seed or generator of numpy. Defaults to None.
+
+        Returns:
+            nx.MultiDiGraph : generated graph (same id as self.graph)
+        """
+        rng = np.random.default_rng(seed)
+
+        self.only_attack = only_attack
+
+        max_num_edge = min(max_indegree,max_outdegree) * num_vertex
+
+        if num_edges is None:
+            num_edges = int(max_num_edge * rng.random() * (rng.random() ** 0.3)) # The number of EDGEs is biased toward the smaller
+
+        num_edges = min(num_edges,num_vertex * max_outdegree,num_vertex * max_indegree)
+
+        out_slots = rng.permutation(num_vertex * max_outdegree)
+        in_slots = rng.permutation(num_vertex * max_indegree)
+
+        tail = np.zeros(0,dtype=np.int64)
+        head = np.zeros(0,dtype=np.int64)
+        attack = np.zeros(0,dtype=np.int64)
+
+        for _ in range(10):
+            num_new = min(num_edges - len(tail),len(out_slots),len(in_slots))
+            if num_new <= 0:
+                break
+
+            new_out,out_slots = out_slots[:num_new],out_slots[num_new:]
+            new_in,in_slots = in_slots[:num_new],in_slots[num_new:]
+
+            new_tail = new_out // max_outdegree
+            new_head = new_in // max_indegree
+            if only_attack:
+                new_attack = np.ones(num_new,dtype=np.int64)
+            else:
+                new_attack = rng.integers(0,2,size=num_new)
+
+            # Check for the same in the edges. (Tail,Head,Attack)
+            key = np.concatenate([tail,new_tail]) * (2*num_vertex) + np.concatenate([head,new_head]) * 2 + np.concatenate([attack,new_attack])
+            _,first = np.unique(key,return_index=True)
+            accepted = np.zeros(len(key),dtype=bool)
+            accepted[first] = True
+            accepted = accepted[len(tail):]
+
+            if avoid_self_loop:
+                accepted &= new_tail != new_head
+
+            tail = np.concatenate([tail,new_tail[accepted]])
+            head = np.concatenate([head,new_head[accepted]])
+            attack = np.concatenate([attack,new_attack[accepted]])
+
+            # the slots of the rejected pairs are paired again with other slots.
+            out_slots = np.concatenate([out_slots,rng.permutation(new_out[~accepted])])
+            in_slots = np.concatenate([in_slots,rng.permutation(new_in[~accepted])])
+
+        G = nx.MultiDiGraph()
+        G.add_nodes_from(range(num_vertex))
+
+        attack = (attack == 1).tolist()
+        G.add_edges_from(
+            (u,v,{'attack':a,'color':("red" if a else "blue")})
+            for u,v,a in zip(tail.tolist(),head.tolist(),attack)
+        )
+
+        self.graph = G
+        self.graph.graph['label_list'] = [1,2,3]
+        self._reset_aggregates()
+
+        # attach weight to each node
+        if attach_weight:
+            weights = rng.integers(1,6,size=num_vertex).tolist()
+        else:
+            weights = [1] * num_vertex
+        nx.set_node_attributes(G,dict(zip(range(num_vertex),weights)),'weight')
+
+        return G
+
+
+    def attach_label_randomly(self,seed:Union[int,np.random.Generator,None] = None):
         """Give the model a random real label.
+
+        Args:
+            seed (Union[int,np.random.Generator,None], optional): seed or generator of numpy. If None, the random module is used as before. Defaults to None.
         """
 
         G = self.graph
-        for node in G.nodes():
-            G.nodes[node]['label'] = random.choice(G.graph['label_list'])
+
+        if seed is None:
+            for node in G.nodes():
+                G.nodes[node]['label'] = random.choice(G.graph['label_list'])
+        else:
+            rng = np.random.default_rng(seed)
+            label_list = G.graph['label_list']
+            codes = rng.integers(0,len(label_list),size=G.number_of_nodes()).tolist()
+            nx.set_node_attributes(G,{node:label_list[code] for node,code in zip(G.nodes,codes)},'label')
+
+        self._reset_aggregates()
 
         return
 
 
+    @_profiled("attach_scc_id")
     def attach_scc_id(self)->tuple[nx.MultiDiGraph,int]:
         """
         Apply the scc algorithm to the graph and attach scc_id (same value for the same scc) as an attribute.
@@ -323,19 +914,10 @@ class MAModel():
             tuple[nx.MultiDiGraph,int]: Graph after assignment, number of SCCs.
 
         """
-        G = self.graph
-        scc_id = 1
-        
-        for comp in sorted(nx.strongly_connected_components(G), key=len, reverse=True):
-            for node in comp:
-                G.nodes[node]["scc_id"] = scc_id
-            scc_id += 1
-        
-        
-        return G,scc_id-1
+        return _attach_scc_id(self.graph)
 
 
-    def attach_skew_types(self,only:str = 'neutral')->nx.MultiDiGraph:
+    def attach_skew_types(self,only:str = 'neutral',seed:Union[int,np.random.Generator,None] = None)->nx.MultiDiGraph:
         """
         give skew_type as an attribute of a vertex of a graph at random.
 
@@ -348,12 +930,25 @@ class MAModel():
             and if any is specified, the type is not limited."
             If "neutral" is specified, only neutral is assigned as skew type.
             The same applies other skew labels
+            seed (Union[int,np.random.Generator,None], optional): seed or generator of numpy. If None, the random module is used as before. Defaults to None.
 
         Returns:
             nx.MultiDiGraph: [Graph after skew_type is given].
         """
 
         G = self.graph
+
+        if seed is not None:
+            skew_types = ['neutral','L1','L2']
+            if only in skew_types:
+                codes = [skew_types.index(only)] * G.number_of_nodes()
+            else:
+                codes = np.random.default_rng(seed).integers(0,3,size=G.number_of_nodes()).tolist()
+            nx.set_node_attributes(G,{node:skew_types[code] for node,code in zip(G.nodes,codes)},'skew_type')
+
+            self._reset_aggregates()
+
+            return G
         
         for node in list(G.nodes):
             skew_types = ['neutral','L1','L2']
@@ -363,10 +958,12 @@ class MAModel():
             if only in ['L1','L2','neutral']:
                 G.nodes[node]['skew_type'] = only
         
+        self._reset_aggregates()
+
         return G
 
 
-    def attach_conditions(self,use_extended_conditions : bool = False) -> nx.MultiDiGraph:
+    def attach_conditions(self,use_extended_conditions : bool = False,seed:Union[int,np.random.Generator,None] = None) -> nx.MultiDiGraph:
         """attach conditions to the MA model
 
         Conditional data is randomly given to MAModel.
@@ -376,11 +973,18 @@ class MAModel():
 
         Args:
             use_extended_conditions (bool) : Whether extended condition data is used or not.1~5 extended condition data are given for each vertex.
+            seed (Union[int,np.random.Generator,None], optional): seed or generator of numpy. If given, the conditions of all the vertices are generated at once with numpy
+                (see _attach_conditions_in_bulk), which is much faster for large models and vertices with high indegree. If None, the random module is used as before. Defaults to None.
 
         Returns:
             [nx.MultiDigraph]: [graph with condition data].
         """
 
+        self._reset_aggregates()
+
+        if seed is not None:
+            return self._attach_conditions_in_bulk(use_extended_conditions,np.random.default_rng(seed))
+
         # Use the form (sign,x,y) for the case where the subset of predecessors is not used.
         if not use_extended_conditions:
 
@@ -419,8 +1023,8 @@ class MAModel():
 
                     G.nodes[index]['conditions'].add((sign,*boundary_tuple))
                     
-                # Change the set to list.
-                G.nodes[index]['conditions'] = list(G.nodes[index]['conditions'])
+                # Change the set to list. Sorted, since the order of a set of strings differs between processes (hash randomization).
+                G.nodes[index]['conditions'] = sorted(G.nodes[index]['conditions'])
                     
 
             return G
@@ -505,54 +1109,231 @@ class MAModel():
 
                     G.nodes[index]['conditions'].add((sign,*boundary_tuple,pred_subset))
                     
-                # Chanage the set to the list.
-                G.nodes[index]['conditions'] = list(G.nodes[index]['conditions'])
+                # Chanage the set to the list. Sorted for the same reason as above.
+                G.nodes[index]['conditions'] = sorted(G.nodes[index]['conditions'])
                     
             return G
 
 
 
 
-    def visualize(
-        self,
-        notes = "",
-        title = "result",
-        path_to_save_dir="./",
-        vis_features : list[str] = ['label','conditions','predicted_labels','weight','opinion'],
-        form : str = "",
-        add_description : bool = True):
-        """
-        Display networkx directed graphs (MultiDiGraph).
-        It supports the display of attributes.
+    def _attach_conditions_in_bulk(self,use_extended_conditions:bool,rng:np.random.Generator) -> nx.MultiDiGraph:
+        """attach conditions to all the vertices at once
+        The conditions have the same distribution as attach_conditions, but are generated with numpy arrays:
+        the subsets of the predecessors are sampled as boolean masks over an index of the distinct predecessors (uniform over the non-empty subsets),
+        and the edges from the subsets are counted with the number of edges of each (tail,head) in that index.
+
         Args:
-            notes (str, optional): [description]. Defaults to "".
-            title (str, optional): [title to save]. Defaults to "result".
-            path_to_save_dir (str, optional): [destination path]. Defaults to "generated_pic/".
-            vis_features(list[str],optional): Select attributes to display
-            form(str,optional):Whether to use the notation for the paper or not. If not, use "", if so, use the string for the output type.
-                                "index.label.skew".
+            use_extended_conditions (bool): Whether extended condition data is used or not.
+            rng (np.random.Generator): generator
+
+        Returns:
+            nx.MultiDiGraph: graph with condition data.
+        """
+        G = self.graph
+
+        nodes = list(G.nodes)
+        index = {node:i for i,node in enumerate(nodes)}
+        n = len(nodes)
+
+        # distinct predecessors of each vertex sorted by the vertex, and the number of edges from each of them.
+        edges = np.array([(index[u],index[v]) for u,v in G.edges()],dtype=np.int64).reshape(-1,2)
+        pair_key,multiplicity = np.unique(edges[:,1] * n + edges[:,0],return_counts=True)
+        pred_head = pair_key // max(n,1)
+        pred_tail = pair_key % max(n,1)
+
+        # sort the predecessors of each vertex by the vertex itself, as attach_conditions does.
+        rank = np.zeros(n,dtype=np.int64)
+        rank[sorted(range(n),key=nodes.__getitem__)] = np.arange(n)
+        order = np.lexsort((rank[pred_tail],pred_head))
+        pred_tail = pred_tail[order]
+        multiplicity = multiplicity[order]
+
+        indegree = np.bincount(pred_head,minlength=n)
+        pred_ptr = np.zeros(n+1,dtype=np.int64)
+        pred_ptr[1:] = np.cumsum(indegree)
+
+        if not use_extended_conditions:
+            # (+,x1,x2) and (-,y1,y2) for each vertex
+            cond_node = np.repeat(np.arange(n),2)
+            sign = np.tile([True,False],n)
+            random_max = indegree[cond_node] + 1
+            selected_ptr = None
+        else:
+            # 1-5 conditions for each vertex
+            num_conditions = rng.integers(1,6,size=n)
+            cond_node = np.repeat(np.arange(n),num_conditions)
+            sign = rng.integers(0,2,size=len(cond_node)) == 1
+
+            # (condition, predecessor) pairs. A subset is a boolean mask over the predecessors of the vertex.
+            size = indegree[cond_node]
+            pair_cond = np.repeat(np.arange(len(cond_node)),size)
+            start = np.zeros(len(cond_node)+1,dtype=np.int64)
+            start[1:] = np.cumsum(size)
+            pair_pred = pred_ptr[cond_node][pair_cond] + np.arange(len(pair_cond)) - start[pair_cond]
+
+            mask = rng.random(len(pair_cond)) < 0.5
+
+            # resample the empty subsets (of the vertices which have predecessors).
+            while True:
+                empty = (np.bincount(pair_cond,weights=mask,minlength=len(cond_node)) == 0) & (size > 0)
+                if not empty.any():
+                    break
+                redo = empty[pair_cond]
+                mask[redo] = rng.random(int(redo.sum())) < 0.5
+
+            # number of edges extending from within the subset
+            random_max = np.bincount(pair_cond,weights=mask * multiplicity[pair_pred],minlength=len(cond_node)).astype(np.int64) + 1
+
+            selected = pred_tail[pair_pred[mask]].tolist()
+            selected_ptr = np.zeros(len(cond_node)+1,dtype=np.int64)
+            selected_ptr[1:] = np.cumsum(np.bincount(pair_cond[mask],minlength=len(cond_node)))
+            selected_ptr = selected_ptr.tolist()
+
+        x1 = rng.integers(0,random_max+1)
+        x2 = rng.integers(x1,random_max+1)
+
+        signs = ['+' if plus else '-' for plus in sign.tolist()]
+        x1 = x1.tolist()
+        x2 = x2.tolist()
+
+        conditions = [[] for _ in range(n)]
+
+        for c,i in enumerate(cond_node.tolist()):
+            if selected_ptr is None:
+                conditions[i].append((signs[c],x1[c],x2[c]))
+            else:
+                subset = tuple(nodes[v] for v in selected[selected_ptr[c]:selected_ptr[c+1]])
+                conditions[i].append((signs[c],x1[c],x2[c],subset))
+
+        # We don't want to have exactly the same conditions.
+        nx.set_node_attributes(G,{node:list(dict.fromkeys(conditions[i])) for i,node in enumerate(nodes)},'conditions')
+
+        return G
+
+
+    @_profiled("visualize")
+    def visualize(
+        self,
+        notes = "",
+        title = "result",
+        path_to_save_dir="./",
+        vis_features : list[str] = ['label','conditions','predicted_labels','weight','opinion'],
+        form : str = "",
+        add_description : bool = True,
+        nodes : Optional[typing.Iterable] = None,
+        hops : int = 1,
+        scc_id : Optional[int] = None,
+        condensation : bool = False,
+        prog : Optional[str] = None,
+        sfdp_threshold : int = 500,
+        layout_cache_dir : Optional[str] = None,
+        format : str = "pdf")->str:
+        """
+        Display networkx directed graphs (MultiDiGraph).
+        It supports the display of attributes.
+        A large graph can be rendered in part: the vertices within hops edges of nodes, a single SCC, or the condensation (one vertex for each SCC).
+        Args:
+            notes (str, optional): [description]. Defaults to "".
+            title (str, optional): [title to save]. Defaults to "result".
+            path_to_save_dir (str, optional): [destination path]. Defaults to "generated_pic/".
+            vis_features(list[str],optional): Select attributes to display
+            form(str,optional):Whether to use the notation for the paper or not. If not, use "", if so, use the string for the output type.
+                                "index.label.skew".
             add_description(bool,optional):Whether to add a dummy vertex for description
+            nodes(Iterable,optional): render only the vertices within hops edges (in either direction) of these vertices. Defaults to None.
+            hops(int,optional): see nodes. Defaults to 1.
+            scc_id(int,optional): render only the SCC with this scc_id (see attach_scc_id). Defaults to None.
+            condensation(bool,optional): render one vertex for each SCC with the numbers of its vertices, labels and predicted labels,
+                                and one edge for each (SCC,SCC,attack) with the number of the edges. Defaults to False.
+            prog(str,optional): graphviz layout program. Defaults to None (fdp, or sfdp above sfdp_threshold vertices).
+            sfdp_threshold(int,optional): see prog. Defaults to 500.
+            layout_cache_dir(str,optional): directory where the positions of the vertices are saved, keyed by a hash of the vertices and the edges rendered.
+                                The positions are also kept in the model. When the same vertices and edges are rendered again (e.g. after predicting again),
+                                the layout is skipped and the saved positions are drawn as they are (neato -n2). Defaults to None (kept only in the model).
+            format(str,optional): "pdf", "svg", "png" or "dot". "dot" writes the graph with the labels and the colors but without positions, skipping the layout. Defaults to "pdf".
+
+        Raises:
+            ValueError: Raised when more than one of nodes, scc_id and condensation are given, or a vertex or an SCC is not in the graph.
+
+        Returns:
+            str: path of the file written
+        """
+        job = self._render_job(
+            notes=notes,title=title,path_to_save_dir=path_to_save_dir,vis_features=vis_features,form=form,add_description=add_description,
+            nodes=nodes,hops=hops,scc_id=scc_id,condensation=condensation,prog=prog,sfdp_threshold=sfdp_threshold,
+            layout_cache_dir=layout_cache_dir,format=format,
+        )
+
+        path,layout = _draw_render_job(job,self._phase)
+        if layout is not None:
+            self._store_layout(job["layout_key"],layout,layout_cache_dir)
+
+        return path
+
+    def _render_job(
+        self,
+        notes = "",
+        title = "result",
+        path_to_save_dir="./",
+        vis_features : list[str] = ['label','conditions','predicted_labels','weight','opinion'],
+        form : str = "",
+        add_description : bool = True,
+        nodes : Optional[typing.Iterable] = None,
+        hops : int = 1,
+        scc_id : Optional[int] = None,
+        condensation : bool = False,
+        prog : Optional[str] = None,
+        sfdp_threshold : int = 500,
+        layout_cache_dir : Optional[str] = None,
+        format : str = "pdf")->dict:
         """
+        The python side of visualize (the arguments are the same): the graph to render as pygraphviz.AGraph and how to draw it.
+        The graphviz work is done by _draw_render_job, in this process (visualize) or in a worker process (render_jobs).
+
+        Returns:
+            dict: 'graph' (pygraphviz.AGraph), 'path', 'format', 'prog', 'layout' (cached layout or None) and 'layout_key'
+        """
+        if format not in RENDER_FORMATS:
+            raise ValueError(f"format must be one of {RENDER_FORMATS}, not {format}")
+
+        if sum([nodes is not None,scc_id is not None,condensation]) > 1:
+            raise ValueError("only one of nodes, scc_id and condensation can be given")
+
+        # The rendering dependencies are loaded only when visualizing. pygraphviz is loaded by nx.nx_agraph.
+        import matplotlib.pyplot as plt
+        import matplotlib.colors as mcolors
+
         graph = self.graph
 
-        num_vertex = len(list(graph.nodes))
-        max_indegree = 0
-        max_outdegree = 0
-        
-        
-        # Find the max of indegree,outdegree.
-        # Note that there may be multiple edges.
-        for node in list(graph.nodes):
-            max_indegree  = max(max_indegree,
-                                len(graph.in_edges(nbunch=node))
-                            )
-            max_outdegree = max(max_outdegree,
-                                len(graph.out_edges(nbunch=node))
-                                )
-        
-        
-        #SCC
-        graph,num_scc_group = self.attach_scc_id()
+        num_vertex = graph.number_of_nodes()
+
+        # max of indegree,outdegree and SCC. They are reused until the graph changes.
+        with self._phase("visualize.structure"):
+            structure = self._structure_summary()
+        max_indegree = structure['max_indegree']
+        max_outdegree = structure['max_outdegree']
+        num_scc_group = structure['num_scc']
+
+        # the vertices rendered
+        scope = ""
+        if nodes is not None:
+            nodes = list(nodes)
+            for node in nodes:
+                if node not in graph:
+                    raise ValueError(f"{node} is not in the graph")
+            rendered = self._neighbourhood(nodes,hops)
+            scope = f"{hops}-hop neighbourhood of {nodes}"
+        elif scc_id is not None:
+            rendered = [node for node,k in graph.nodes(data='scc_id') if k == scc_id]
+            if not rendered:
+                raise ValueError(f"there is no SCC with scc_id {scc_id}")
+            scope = f"scc_id:{scc_id}"
+        elif condensation:
+            rendered = []
+            scope = "condensation"
+        else:
+            rendered = graph.nodes
         
         def set_visinfo(node:int,attributes:list[str]= vis_features):
             """
@@ -607,6 +1388,12 @@ class MAModel():
                 info = f"node_index:{node}\n"
                 
                 for attr in attributes:
+
+                    # the judges are formatted from judge_trace only when they are shown.
+                    if attr == 'judges':
+                        if self.judge_trace is not None:
+                            info += f"{attr}:{self.get_judges(node)}\n"
+                        continue
                     
                     try:
                     
@@ -621,8 +1408,9 @@ class MAModel():
             return
         
         # setting vis_info to each node
-        for node in list(graph.nodes):
-            set_visinfo(node=node)
+        with self._phase("visualize.vis_info"):
+            for node in list(rendered):
+                set_visinfo(node=node)
             
 
         # Put information about indegree max and such in description.
@@ -633,6 +1421,8 @@ class MAModel():
             description+=f"num edges:{graph.number_of_edges()}\n"
             description+= f"max indegree:{max_indegree}\nmax outdegree:{max_outdegree} \n" 
             description+= f"scc_groups:{num_scc_group}compomnents"
+            if scope:
+                description+= f"\nrendered:{scope}"
             return description
         
         description = make_description()
@@ -642,29 +1432,37 @@ class MAModel():
         cm = plt.get_cmap(cm_name,num_scc_group+1)
         
         # setting drawing
-        for node in list(graph.nodes):
+        if condensation:
+            render_graph = self._condensation_graph()
+        elif rendered is graph.nodes:
+            render_graph = graph
+        else:
+            render_graph = graph.subgraph(rendered)
+
+        for node in list(render_graph.nodes):
             # rgb expressed in 0-1 values
-            color_rgb = cm(graph.nodes[node]['scc_id'])[:3]
+            color_rgb = cm(render_graph.nodes[node]['scc_id'])[:3]
             #Change to rgb string in hexadecimal notation
-            graph.nodes[node]['color'] = mcolors.to_hex(color_rgb)
-            graph.nodes[node]['penwidth'] = 5 #頂点を囲む線の太さ
+            render_graph.nodes[node]['color'] = mcolors.to_hex(color_rgb)
+            render_graph.nodes[node]['penwidth'] = 5 #頂点を囲む線の太さ
         
-        graph.graph['overlap'] = "prism"
+        render_graph.graph['overlap'] = "prism"
         
         # placement parameter for sfdp,fdp
-        graph.graph['K'] = 1.2
+        render_graph.graph['K'] = 1.2
         # placement parameter for sfdp
-        graph.graph['repulsiveforce'] = 1.4
+        render_graph.graph['repulsiveforce'] = 1.4
         
         
         
         # Convert this to agraph class (PyGraphviz)
-        G_pgv = nx.nx_agraph.to_agraph(graph)
+        with self._phase("visualize.to_agraph"):
+            G_pgv = nx.nx_agraph.to_agraph(render_graph)
 
         
         # Make the information visible by putting vis_info in the label.
         for node in G_pgv.nodes():
-            G_pgv.get_node(node).attr["label"] = graph.nodes[int(node)]["vis_info"]   
+            G_pgv.get_node(node).attr["label"] = render_graph.nodes[int(node)]["vis_info"]   
         
         
         
@@ -673,19 +1471,180 @@ class MAModel():
             G_pgv.add_node("description",label = description,shape = "box",color = "gray",style = "filled")
         
         # Optional prog=[‘neato’|’dot’|’twopi’|’circo’|’fdp’|’nop’] will use specified graphviz layout method.
-        # fdp is recommended.
+        # fdp is recommended. sfdp is used for large graphs since fdp takes too long.
         # ValueError: Program osage is not one of: neato, dot, twopi, circo, fdp, nop, gc, acyclic, gvpr, gvcolor, ccomps, sccmap, tred, sfdp, unflatten.
-        G_pgv.draw(path_to_save_dir+f"{title}.pdf",prog='fdp',args='-Gnodesep=1')
-        
-        return 
+        if prog is None:
+            prog = 'sfdp' if render_graph.number_of_nodes() > sfdp_threshold else 'fdp'
+
+        path = path_to_save_dir+f"{title}.{format}"
+
+        # The layout depends only on the vertices and the edges, so it is reused while they are the same.
+        with self._phase("visualize.layout_cache"):
+            layout_key = self._layout_key(render_graph,prog,add_description,condensation)
+            layout = self._cached_layout(layout_key,layout_cache_dir)
+
+        return {
+            "graph" : G_pgv,
+            "path" : path,
+            "format" : format,
+            "prog" : prog,
+            "layout" : layout,
+            "layout_key" : layout_key,
+        }
+
+    # number of layouts kept in the model by visualize.
+    MAX_CACHED_LAYOUTS = 16
+
+    def _layout_key(self,graph:nx.MultiDiGraph,prog:str,add_description:bool,condensation:bool)->str:
+        """Hash of the vertices and the edges (tail,head,attack) rendered by visualize, and of the layout options."""
+        nodes = sorted(str(node) for node in graph.nodes)
+        edges = sorted((str(u),str(v),bool(attack)) for u,v,attack in graph.edges(data='attack'))
+        content = json.dumps([prog,add_description,condensation,nodes,edges])
+
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _cached_layout(self,key:str,layout_cache_dir:Optional[str])->Optional[dict]:
+        """Layout saved by _store_layout, in the model or in layout_cache_dir. None if not saved."""
+        if key in self._layouts:
+            return self._layouts[key]
+
+        if layout_cache_dir is None:
+            return None
+
+        path = os.path.join(layout_cache_dir,f"{key}.json")
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            layout = json.load(f)
+
+        self._layouts[key] = layout
+
+        return layout
+
+    def _store_layout(self,key:str,layout:dict,layout_cache_dir:Optional[str]):
+        """
+        Keep the layout in the model and, if layout_cache_dir is given, in a file.
+        layout is {'bb' : bounding box, 'nodes' : {vertex name : 'x,y'}, 'edges' : [[tail,head,key,spline]]} in the pos format of graphviz.
+        """
+        if len(self._layouts) >= self.MAX_CACHED_LAYOUTS:
+            self._layouts.pop(next(iter(self._layouts)))
+        self._layouts[key] = layout
+
+        if layout_cache_dir is None:
+            return
+
+        os.makedirs(layout_cache_dir,exist_ok=True)
+        path = os.path.join(layout_cache_dir,f"{key}.json")
+
+        # written at once so that a render running at the same time never reads half of it.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path,"w") as f:
+            json.dump(layout,f)
+        os.replace(tmp_path,path)
+
+        return
+
+    def _structure_summary(self)->dict:
+        """
+        The number of SCCs (attach_scc_id is applied), max indegree and max outdegree of the graph, used by visualize.
+        They are kept until the vertices or the edges change: add_edge, remove_edge and reset_caches count up the version of the structure,
+        so that this check costs nothing for large graphs. Call reset_caches after editing the edges of the graph directly.
+
+        Returns:
+            dict: 'num_scc', 'max_indegree', 'max_outdegree'
+        """
+        G = self.graph
+        key = (id(G),self._structure_version)
+
+        if self._structure is not None and self._structure['key'] == key:
+            return self._structure
+
+        _,num_scc = self.attach_scc_id()
+
+        # Note that there may be multiple edges.
+        self._structure = {
+            'key' : key,
+            'num_scc' : num_scc,
+            'max_indegree' : max((d for _,d in G.in_degree()),default=0),
+            'max_outdegree' : max((d for _,d in G.out_degree()),default=0),
+        }
+
+        return self._structure
+
+    def _neighbourhood(self,nodes:list,hops:int)->set:
+        """The vertices within hops edges of nodes, following the edges in either direction."""
+        G = self.graph
+
+        seen = set(nodes)
+        frontier = list(seen)
+
+        for _ in range(hops):
+            next_frontier = []
+            for u in frontier:
+                for v in itertools.chain(G.predecessors(u),G.successors(u)):
+                    if v not in seen:
+                        seen.add(v)
+                        next_frontier.append(v)
+            frontier = next_frontier
+
+        return seen
+
+    def _condensation_graph(self)->nx.MultiDiGraph:
+        """
+        The condensation rendered by visualize(condensation=True). scc_id must be attached.
+        Each vertex is an SCC (named by its scc_id) whose vis_info has the numbers of its vertices, internal edges, labels and predicted labels.
+        Each edge is the edges of an (SCC,SCC,attack) with their number as the label.
+
+        Returns:
+            nx.MultiDiGraph: the condensation
+        """
+        G = self.graph
+
+        C = nx.MultiDiGraph()
+        size = {}
+        labels = {}
+        predicted = {}
+        for node,data in G.nodes(data=True):
+            k = data['scc_id']
+            size[k] = size.get(k,0) + 1
+            count = labels.setdefault(k,{})
+            count[data['label']] = count.get(data['label'],0) + 1
+            if 'predicted_labels' in data:
+                count = predicted.setdefault(k,{})
+                key = str(data['predicted_labels'])
+                count[key] = count.get(key,0) + 1
+
+        internal = {}
+        between = {}
+        for u,v,attack in G.edges(data='attack'):
+            a,b = G.nodes[u]['scc_id'],G.nodes[v]['scc_id']
+            if a == b:
+                internal[a] = internal.get(a,0) + 1
+            else:
+                pair = (a,b,bool(attack))
+                between[pair] = between.get(pair,0) + 1
 
+        for k in sorted(size):
+            info = f"scc_id:{k}\nvertices:{size[k]}\ninternal edges:{internal.get(k,0)}\nlabels:{labels[k]}\n"
+            if k in predicted:
+                info += f"predicted_labels:{predicted[k]}\n"
+            C.add_node(k,scc_id=k,vis_info=info)
 
+        for (a,b,attack),count in between.items():
+            C.add_edge(a,b,attack=attack,color=("red" if attack else "blue"),label=str(count))
 
+        return C
 
+
+
+
+    @_profiled("predict_labels",per_node=True)
     def predict_labels(self,u:int)->list:
         """
         For a vertex u, return the labels predicted by the surrounding vertices in a list format.
-        Modifies the judges and predicted_labels attributes of node.
+        Modifies the predicted_labels attribute of node, and records the judges in judge_trace if trace_judges is True.
+        See compute_labels for the same prediction without modifying anything.
 
         Args:
             u (int): natural number of the vertex to be predicted
@@ -693,302 +1652,3167 @@ class MAModel():
         Returns:
             list[int]: list of predicted labels
         """
+        predicted_labels = self._compute_labels(u,self._judge_trace(u))
+
+        self.graph.nodes[u]["predicted_labels"] = predicted_labels
+        self._dirty.discard(u)
+        
+        return predicted_labels
+
+    def compute_labels(self,u:Any)->list:
+        """
+        The labels of vertex u predicted by the surrounding vertices, the same as predict_labels,
+        but nothing is modified: neither the attributes of the graph (predicted_labels) nor judge_trace.
+        Any number of threads may call compute_labels and compute_all on one model at the same time,
+        as long as no thread changes the model (set_label, predict_labels, read_yaml, ...) meanwhile.
+
+        Args:
+            u (Any): vertex
+
+        Returns:
+            list: list of predicted labels
+        """
+        return self._compute_labels(u,None)
+
+    def compute_all(self,nodes:Optional[typing.Iterable] = None)->dict:
+        """
+        The predicted labels of many vertices without modifying the model, see compute_labels.
+        All the vertices are predicted at once with the arrays of predict_all.
+
+        Args:
+            nodes (Optional[typing.Iterable], optional): vertices. Defaults to None (all the vertices).
+
+        Returns:
+            dict: {vertex : list of predicted labels}
+        """
+        if nodes is not None:
+            return {u:self._compute_labels(u,None) for u in nodes}
+
+        arrays = _ModelArrays(self)
+        overall_judges,_ = arrays.predict_range()
+
+        to_list = self._judge_to_labels()
+
+        return {node:list(to_list[code]) for node,code in zip(arrays.nodes,overall_judges.tolist())}
+
+    def _compute_labels(self,u:Any,trace:Optional[JudgeTrace])->list:
+        """
+        The prediction of predict_labels, without storing it. The judges are recorded in trace if given.
+        Only the cache of the compiled conditions (see _compiled_conditions) is written, which is safe to share between threads.
+        """
         G = self.graph
         
-        label_list = G.graph['label_list']
         skew_type = G.nodes[u]['skew_type']
-        
-        G.nodes[u]['judges'] = []
+
+        # Au and Bu are found once for all the conditions.
+        prof = self._profile
+        if prof is not None:
+            start = time.perf_counter()
+
+        compiled = self._compiled_conditions(u)
+        bound = compiled.bind(G,self.exact_arithmetic)
+
+        if prof is not None:
+            prof.add("split_predecessors",time.perf_counter() - start)
+            prof.add_edges_scanned(u,compiled.in_degree)
         
         # Calculate the judgement for each condition
         judges :list[_Judge] = []
         
-        for c in G.nodes[u]['conditions']:
+        for k,c in enumerate(G.nodes[u]['conditions']):
             judge = _Judge()
-            judge.make_a_judge(condition=c,ma_model=self,u=u)
+            judge.make_a_judge(condition=c,ma_model=self,u=u,trace=trace,index=k,compiled=bound)
             judges.append(judge)
             
             
         # Make an overall judgment based on the judgment calculated for each condition.
         
-        overall_judge = _Judge(judge="S8",skew_type=skew_type)
-        
-        for judge in judges:
-            judge.skew_type = skew_type
-            overall_judge = (overall_judge + judge)
-            
+        if prof is not None:
+            start = time.perf_counter()
+
+        overall_judge = reduce_judges([judge.code for judge in judges],skew_type)
+
+        if prof is not None:
+            prof.add("fold_judges",time.perf_counter() - start)
+            prof.count("judges_folded",len(judges))
         
         # Rearrange the format of S1, S2, etc. into a list and return it.
-        to_list = [
-            None,
-            [label_list[0]],                                #S1
-            [label_list[1]],                                #S2
-            [label_list[2]],                                #S3
-            [label_list[0],label_list[1]],                  #S4
-            [label_list[0],label_list[2]],                  #S5
-            [label_list[1],label_list[2]],                  #S6
-            [label_list[0],label_list[1],label_list[2]],    #S7
-            []                                              #S8
-        ]
+        to_list = self._judge_to_labels()
 
-        self.graph.nodes[u]["predicted_labels"] = to_list[int(overall_judge.judge[1])]
-        
-        return to_list[int(overall_judge.judge[1])]
+        return to_list[overall_judge]
 
-   
 
-    def _split_predecessor_by_label(self,vertex_index:int,label:int,target:Any) -> list[int]:
-        """Function to get the predecessor for each vertex label.
+    @_profiled("predict_all")
+    def predict_all(self,workers:Optional[int] = None,shards_per_worker:int = 4)->dict:
+        """
+        Predict the labels of all the vertices at once.
+        The result is the same as calling predict_labels for every vertex, but the predecessors are aggregated
+        with numpy arrays (CSR form) built once for the whole graph instead of scanning in_edges for each condition.
+        Modifies the predicted_labels attribute of every node, and records the judges in judge_trace if trace_judges is True.
+
+        With workers, a read-only snapshot of the arrays is sent once to each of the worker processes,
+        which predict shards of consecutive vertices. The shards are merged back in the order of graph.nodes,
+        so the result is exactly the same as the serial one.
 
         Args:
-            vertex_index (int): name of target vertex]: [name of target vertex
-            label (int): [which label vertices to collect].
-            target (Union[bool,str]): [Specify which vertices to focus on, the attacker or the supporter. True if only the attacker, false if only the supporter, "any" if both.
-            No vertices are duplicated if both are specified].
+            workers (Optional[int], optional): number of worker processes. Defaults to None (no worker process).
+            shards_per_worker (int, optional): number of shards for each worker, to balance the load. Defaults to 4.
 
-        Returns.
-            [list(int)]: [result].
+        Returns:
+            dict: {vertex : list of predicted labels}
         """
+        G = self.graph
 
+        with self._phase("predict_all.build_arrays"):
+            arrays = _ModelArrays(self)
+
+        num_vertex = arrays.num_vertex
+        num_cond = len(arrays.cond_node)
+        trace = self._judge_trace()
+
+        # all the judges are recorded again, in the layout of arrays.
+        if trace is not None and (trace.nodes != arrays.nodes or not np.array_equal(trace.cond_ptr,arrays.cond_ptr)):
+            trace = self.judge_trace = JudgeTrace(G)
+
+        if (workers is None or workers <= 1) and arrays.exact:
+            with self._phase("predict_all.exact_condition_judges"):
+                judges,weights = arrays.exact_condition_judges(with_weights=trace is not None)
+            with self._phase("fold_judges"):
+                overall_judges = arrays.fold_judges(judges)
+            if trace is not None:
+                A_weight,B_weight,no_weight = weights
+        elif workers is None or workers <= 1:
+            with self._phase("predict_all.condition_weights"):
+                A_weight,B_weight,no_weight = arrays.condition_weights()
+            with self._phase("predict_all.condition_judges"):
+                judges = arrays.condition_judges(A_weight,B_weight)
+            with self._phase("fold_judges"):
+                overall_judges = arrays.fold_judges(judges)
+        else:
+            # shards with about the same number of conditions
+            num_shards = min(max(workers * shards_per_worker,1),max(num_vertex,1))
+            bounds = np.searchsorted(arrays.cond_ptr,np.linspace(0,num_cond,num_shards+1),side='left')
+            bounds[0] = 0
+            bounds[-1] = num_vertex
+            bounds = np.maximum.accumulate(np.minimum(bounds,num_vertex)).tolist()
+            shards = [(lo,hi,trace is not None) for lo,hi in zip(bounds[:-1],bounds[1:]) if hi > lo]
+
+            with self._phase("predict_all.workers"):
+                with concurrent.futures.ProcessPoolExecutor(max_workers=workers,initializer=_init_prediction_worker,initargs=(arrays.snapshot(),)) as executor:
+                    results = list(executor.map(_predict_shard,shards))
+
+            overall_judges = np.concatenate([codes for codes,_ in results]) if results else np.zeros(0,dtype=np.int8)
+            if trace is not None:
+                A_weight,B_weight,no_weight,judges = (
+                    np.concatenate([weights[k] for _,weights in results]) if results else np.zeros(0)
+                    for k in range(4)
+                )
+
+        if trace is not None:
+            # the vertices and the conditions of arrays are in the same order as trace.
+            with self._phase("judge_trace"):
+                trace.A_weight[:] = A_weight
+                trace.B_weight[:] = B_weight
+                trace.no_weight[:] = no_weight
+                trace.code[:] = judges
+
+        prof = self._profile
+        if prof is not None:
+            prof.count("conditions_evaluated",num_cond)
+            prof.count("judges_folded",num_cond)
+            # each vertex scans its in-edges once for all its conditions
+            for node,n in zip(arrays.nodes,np.diff(arrays.in_ptr).tolist()):
+                prof.add_edges_scanned(node,n)
+
+        to_list = self._judge_to_labels()
+        res = {}
+
+        for node,code in zip(arrays.nodes,overall_judges.tolist()):
+            predicted_labels = list(to_list[code])
+            G.nodes[node]['predicted_labels'] = predicted_labels
+            res[node] = predicted_labels
+
+        self._dirty.clear()
+
+        return res
+
+
+    @_profiled("predict_scenarios")
+    def predict_scenarios(self,weights:np.ndarray,chunk_size:Optional[int] = None)->np.ndarray:
+        """
+        Predict the labels of all the vertices for many weight assignments (scenarios) at once, the graph, the labels and the conditions being fixed.
+        The predecessors in Au and Bu of every condition are found once, and then A_weight, B_weight and the judges of all the conditions
+        are calculated for a chunk of scenarios with array operations. The graph is not modified.
+        The result is the same as setting the weights of a scenario and calling predict_all.
 
-        graph = self.graph
+            codes = model.predict_scenarios(weights)    # weights[s,i] : weight of list(model.graph.nodes)[i] in scenario s
+            model.judge_labels(codes[s,i])              # predicted labels
 
-        res_list = []
-        
-        # search for (u,v,attack) such that v == vertex_index.
-        for u,v,attack in graph.in_edges(nbunch = vertex_index,data = "attack"):
-            
-            assert(attack is not None)
-            assert(type(u) == int)
-            
-            if attack == target:
-                if label == "any":
-                    res_list.append(u)
-                    continue
-                
-                if graph.nodes[u]['label'] == label:
-                    res_list.append(u)
-                    continue
-        
-        return res_list
+        Args:
+            weights (np.ndarray): (scenarios, vertices) array of the weights. The vertices are in the order of graph.nodes.
+            chunk_size (Optional[int], optional): number of scenarios calculated at once. Defaults to None (chosen to keep the temporary arrays around 64MB).
 
+        Raises:
+            ValueError: Raised when the shape of weights doesn't match the graph.
 
-class _Judge:
-    """
-    Class for enabling the addition of decisions.
-    
-    Attributes:
-    
-    self.judge A place to put real judgments, represented by S1-S8.
-    self.skew_type The skew_type needed to add up the judgments for each condition.
-    
-    """
-    
-    def __init__(self,judge=None,skew_type = None):
-        """Initialization
-      
-        Args:
-            judge (_type_, optional): _Judge by the condition. Defaults to None.
+        Returns:
+            np.ndarray: (scenarios, vertices) int8 array of the codes of the overall judges (1 for S1, ..., 8 for S8). See judge_labels for the labels.
         """
-        
-        self.skew_type = None
-        
-        if skew_type is not None:
-            self.skew_type = skew_type
+        arrays = _ModelArrays(self)
 
-        #S8 is the unit source in the addition of decisions.
-        self.judge = 'S8'
-        
-        if judge is not  None:
-            self.judge = judge
-        
-        return
-    
-    def make_a_judge(self,condition:tuple,ma_model:MAModel,u:int):
+        if self.exact_arithmetic:
+            weights = np.asarray(weights,dtype=object)
+        else:
+            weights = np.asarray(weights,dtype=np.float64)
+
+        if weights.ndim != 2 or weights.shape[1] != arrays.num_vertex:
+            raise ValueError(f"weights must be a (scenarios, {arrays.num_vertex}) array, not {weights.shape}")
+
+        if chunk_size is None:
+            # float64 temporaries of the in-edges, the subset members and the conditions for each scenario.
+            per_scenario = 8 * (len(arrays.in_src) + len(arrays.member_src) + 8 * len(arrays.cond_node) + arrays.num_vertex)
+            chunk_size = max(1,(64 << 20) // max(per_scenario,1))
+
+        res = np.empty(weights.shape,dtype=np.int8)
+
+        for start in range(0,len(weights),chunk_size):
+            with self._phase("predict_scenarios.chunk"):
+                chunk = weights[start:start+chunk_size]
+                if self.exact_arithmetic:
+                    chunk = np.vectorize(_exact_weight,otypes=[object])(chunk)
+                res[start:start+chunk_size] = arrays.scenario_codes(chunk)
+
+        return res
+
+    def judge_labels(self,code:int)->list:
+        """The predicted labels of the code of an overall judge (1 for S1, ..., 8 for S8), e.g. of predict_scenarios."""
+        return self._judge_to_labels()[int(code)]
+
+
+    def enumerate_consistent_labelings(self)->typing.Iterator[dict]:
         """
-        Require a per-condition data decision. Skew-type is not involved when making a judgment for each condition. Conditional data with subsets are supported.
-        Conditional data with no subset is also supported.
+        Enumerate the labelings where the label of every vertex is in its own predicted_labels.
+        The graph is decomposed with attach_scc_id and the SCCs are solved in topological order of the condensation,
+        so the labels of an SCC are searched only once for each labeling of the vertices attacking/supporting it from outside.
+        Within an SCC, backtracking with constraint propagation is used: as soon as all the predecessors of a vertex are labeled,
+        its candidates are narrowed down to its predicted labels.
+        Side Effect: Assign scc_id to the model's graph. The labels and the other attributes are not modified.
 
-        Args:
-            condition (tuple): Condition
-            mamodel(MAModel):model
-            u: Vertex with condition passed as argument
+        This is a generator, so you can stop after the first k labelings (e.g. itertools.islice).
+
+        Yields:
+            dict: {vertex : label}
         """
-        
-        G = ma_model.graph
+        search = _LabelingSearch(self)
 
-        label_list = G.graph['label_list']
-        
-        Au = set(ma_model._split_predecessor_by_label(u,label_list[0],True)) | set(ma_model._split_predecessor_by_label(u,label_list[1],False)) 
-        Bu = set(ma_model._split_predecessor_by_label(u,label_list[1],True)) | set(ma_model._split_predecessor_by_label(u,label_list[0],False))
-        
-        if len(condition) == 4:
-            
-            Au = Au & set(condition[3])
-            Bu = Bu & set(condition[3])
+        yield from search.run()
 
-        all_weight = 0
-        A_weight = 0 # the bigger, the easier to be rej
-        B_weight = 0 # the bigger, the easier to be acc
 
+    @_profiled("run_dynamics")
+    def run_dynamics(self,mode:str = 'sync',max_steps:int = 1000,frontier:Optional[typing.Iterable] = None,order:Optional[list] = None)->DynamicsResult:
+        """
+        Repeat setting the label of every vertex to one of its predicted labels until nothing changes (a fixed point) or the labels repeat (a cycle).
+        A vertex keeps its label if the label is in its predicted_labels (or nothing is predicted), otherwise it takes the first of them.
+        The labels are changed with set_label and only the successors of the changed vertices are evaluated again,
+        so a step costs in proportion to its frontier, not to the graph.
+        Side Effect: the labels and the predicted_labels of the graph are modified. Copy the model first to keep them.
 
-        
-        for v in Au:
-            A_weight += G.nodes[v]['weight']
-            all_weight += G.nodes[v]['weight']
-        
-        for v in Bu:
-            B_weight += G.nodes[v]['weight']
-            all_weight += G.nodes[v]['weight']
-        
-        # 重みが全て1である時と同一のスケールにする。
-        if all_weight == 0:
-            A_weight = 0
-            B_weight = 0
-        else:
-            average_weight = all_weight / (len(Au) + len(Bu))
-            A_weight = A_weight/average_weight
-            B_weight = B_weight/average_weight
+            result = model.run_dynamics(mode='async')
+            print(result.converged,result.cycle_length,result.as_dict())
 
-            # print (f'A:{A_weight},B:{B_weight},all:{all_weight},average:{average_weight},u:{u}')
-        
-        # A_weight + B_weight shold be almost len(Au) + len(Bu)
+        Args:
+            mode (str, optional): 'sync' : every vertex of the frontier is updated from the labels before the step.
+                'async' : the frontier is swept in order, and each change is seen by the vertices after it in the same sweep. A step is a sweep. Defaults to 'sync'.
+            max_steps (int, optional): the run stops after this number of steps. Defaults to 1000.
+            frontier (Iterable, optional): the vertices evaluated in the first step. The other vertices must already be stable,
+                e.g. after a fixed point, the successors of the vertices changed since. Defaults to None (all the vertices).
+            order (list, optional): order of the vertices in a sweep of 'async'. Defaults to None (the order of graph.nodes).
 
-        assert abs(A_weight + B_weight - len(Au) - len(Bu)) < 0.1
+        Raises:
+            ValueError: Raised when mode is unknown or order is not an ordering of the vertices.
+
+        Returns:
+            DynamicsResult: convergence statistics
+        """
+        if mode not in ('sync','async'):
+            raise ValueError(f"unknown mode: {mode}")
+
+        dynamics = _LabelDynamics(self,mode,order)
+
+        return dynamics.run(max_steps,frontier)
+
+    @_profiled("weight_sensitivity")
+    def weight_sensitivity(self,nodes:Optional[typing.Iterable] = None)->dict:
+        """
+        For every vertex u (or the vertices in nodes), find the interval of the weight of u in which the predicted labels of each successor stay the same,
+        all the other weights and the labels being fixed.
+        Each judge is a comparison of A_weight or B_weight with a bound, and with the weight w of u, sum_A and sum_B of a condition are linear in w.
+        So A_weight < x is sum_A(w) * |V| < x * all_weight(w), which changes only at the root of a linear function of w.
+        The roots are found exactly (as in exact_arithmetic), in one pass over the in-edges of the successors and without predicting again.
+        So the intervals agree with predict_labels when exact_arithmetic is True. When it is False, predict_labels compares in floating point
+        and may disagree with an interval for a weight within the rounding error of its bound.
+
+            intervals = model.weight_sensitivity()
+            intervals[u][v]    # e.g. [2,7/2) : the predicted labels of v are the same for 2 <= weight of u < 7/2
+
+        Args:
+            nodes (Iterable, optional): the vertices whose weights are analyzed. Defaults to None (all the vertices).
+
+        Returns:
+            dict: {u : {successor v : WeightInterval containing the current weight of u}}.
+                The intersection of the intervals of u is where no successor changes (see WeightInterval.intersection).
+        """
+        G = self.graph
+
+        targets = set(G.nodes) if nodes is None else set(nodes)
+        res = {u:{} for u in targets}
+
+        successors = set()
+        for u in targets:
+            successors.update(G.successors(u))
+
+        for v in successors:
+            compiled = self._compiled_conditions(v)
+            bound = compiled.bind(G,True)
+
+            conditions = G.nodes[v]['conditions']
+            sums = [bound.condition_sums(k) for k in range(len(conditions))]
+            bounds = [(c[0] == '+',_exact_weight(c[1]),_exact_weight(c[2])) for c in conditions]
+
+            for j,u in enumerate(compiled.preds):
+                if u not in targets:
+                    continue
+
+                weight = bound.weights[j]
+                bit = 1 << j
+
+                # sum_A and sum_B of each condition without u, |Au|+|Bu|, and whether u is in Au and Bu.
+                rows = []
+                for k,(sum_A,sum_B,len_Au,len_Bu) in enumerate(sums):
+                    in_A = bool(bound.Au & bound.cond_masks[k] & bit)
+                    in_B = bool(bound.Bu & bound.cond_masks[k] & bit)
+                    rows.append((sum_A - in_A * weight,sum_B - in_B * weight,len_Au + len_Bu,in_A,in_B))
+
+                res[u][v] = _weight_interval(weight,bounds,rows,G.nodes[v]['skew_type'])
+
+        return res
+
+    def set_label(self,u:int,label:Any):
+        """
+        Change the label of vertex u.
+        Only the predictions of the successors of u become stale. They are recomputed when asked by get_predicted_labels or update_predictions.
+
+        Args:
+            u (int): vertex
+            label (Any): new label (one of graph.graph['label_list'])
+        """
+        G = self.graph
+        self._build_aggregates()
+
+        old_code = self._label_code(G.nodes[u]['label'])
+        new_code = self._label_code(label)
+        weight = _exact_weight(G.nodes[u]['weight'])
+
+        G.nodes[u]['label'] = label
+
+        for (_,v,attack) in self._out_pairs(u):
+            self._add_aggregate(v,old_code,attack,-1,-weight)
+            self._add_aggregate(v,new_code,attack,1,weight)
+            self._dirty.add(v)
+
+        return
+
+    def set_weight(self,u:int,weight:Union[int,float]):
+        """
+        Change the weight of vertex u.
+        Only the predictions of the successors of u become stale. They are recomputed when asked by get_predicted_labels or update_predictions.
+
+        Args:
+            u (int): vertex
+            weight (Union[int,float]): new weight
+        """
+        G = self.graph
+        self._build_aggregates()
+
+        code = self._label_code(G.nodes[u]['label'])
+        diff = _exact_weight(weight) - _exact_weight(G.nodes[u]['weight'])
+
+        G.nodes[u]['weight'] = weight
+
+        for (_,v,attack) in self._out_pairs(u):
+            self._add_aggregate(v,code,attack,0,diff)
+            self._dirty.add(v)
+
+        return
+
+    def add_edge(self,u:int,v:int,attack:bool):
+        """
+        Add an edge u -> v. Only the prediction of v becomes stale.
+
+        Args:
+            u (int): tail
+            v (int): head
+            attack (bool): True for attack, False for support
+        """
+        G = self.graph
+        self._build_aggregates()
+
+        attack = bool(attack)
+        G.add_edge(u,v,attack=attack,color=("red" if attack else "blue"))
+        self.only_attack = bool(self.only_attack) and attack
+
+        pair = (u,v,attack)
+        self._edge_pairs[pair] = self._edge_pairs.get(pair,0) + 1
+
+        # Au and Bu are sets, so only the first edge of the same (tail,head,attack) counts.
+        if self._edge_pairs[pair] == 1:
+            self._add_aggregate(v,self._label_code(G.nodes[u]['label']),attack,1,_exact_weight(G.nodes[u]['weight']))
+
+        self._compiled.pop(v,None)
+        self._structure = None
+        self._structure_version += 1
+        self._dirty.add(v)
+
+        return
+
+    def remove_edge(self,u:int,v:int,attack:bool):
+        """
+        Remove an edge u -> v (one of them if there are multiple edges). Only the prediction of v becomes stale.
+
+        Args:
+            u (int): tail
+            v (int): head
+            attack (bool): True for attack, False for support
+
+        Raises:
+            nx.NetworkXError: Raised when there is no such edge.
+        """
+        G = self.graph
+        self._build_aggregates()
+
+        attack = bool(attack)
+        keys = [key for key,data in G.get_edge_data(u,v,default={}).items() if bool(data['attack']) == attack]
+
+        if not keys:
+            raise nx.NetworkXError(f"The edge {u}-{v} (attack={attack}) is not in the graph.")
+
+        G.remove_edge(u,v,key=keys[-1])
+
+        pair = (u,v,attack)
+        self._edge_pairs[pair] -= 1
+
+        if self._edge_pairs[pair] == 0:
+            del self._edge_pairs[pair]
+            self._add_aggregate(v,self._label_code(G.nodes[u]['label']),attack,-1,-_exact_weight(G.nodes[u]['weight']))
+
+        self._compiled.pop(v,None)
+        self._structure = None
+        self._structure_version += 1
+        self._dirty.add(v)
+
+        return
+
+    def reset_caches(self):
+        """
+        Forget everything derived from the graph: the aggregates of the mutation API (all the predictions become stale),
+        the compiled conditions, the SCCs and the degrees of visualize and the judge trace.
+        Call this after editing self.graph directly instead of by set_label, set_weight, add_edge or remove_edge.
+        """
+        self._reset_aggregates()
+
+        return
+
+    def get_predicted_labels(self,u:int)->list:
+        """
+        Return the predicted labels of vertex u, recomputing them only if they are stale because of set_label, set_weight, add_edge or remove_edge.
+
+        Args:
+            u (int): vertex
+
+        Returns:
+            list: list of predicted labels
+        """
+        self._build_aggregates()
+
+        if u in self._dirty or "predicted_labels" not in self.graph.nodes[u]:
+            self._predict_from_aggregates(u)
+
+        return self.graph.nodes[u]["predicted_labels"]
+
+    @_profiled("update_predictions")
+    def update_predictions(self)->dict:
+        """
+        Recompute the predicted labels of all the vertices that are stale.
+
+        Returns:
+            dict: {vertex : list of predicted labels} of the recomputed vertices
+        """
+        self._build_aggregates()
+
+        res = {}
+        for u in list(self._dirty):
+            res[u] = self._predict_from_aggregates(u)
+
+        return res
+
+    def _reset_aggregates(self):
+        """Forget the aggregates of the mutation API, the compiled conditions, the structure summary and the judge trace. Called when the graph is replaced or its attributes are reassigned.
+        """
+        self._aggregates = None
+        self._edge_pairs = None
+        self._dirty = set()
+        self._compiled = {}
+        self._positions = None
+        self._structure = None
+        self._structure_version += 1
+        self.judge_trace = None
+
+        return
+
+    def _build_aggregates(self):
+        """
+        Build, if not yet, the aggregates of the predecessors used by the mutation API.
+        For every vertex v, self._aggregates[v][(label code,attack)] is [number,sum of weights] of the distinct predecessors with the label attacking (or supporting) v.
+        self._edge_pairs counts the edges of each (tail,head,attack).
+        All the vertices are stale after building.
+        """
+        if self._aggregates is not None:
+            return
+
+        G = self.graph
+
+        self._edge_pairs = {}
+        for u,v,attack in G.edges(data='attack'):
+            pair = (u,v,bool(attack))
+            self._edge_pairs[pair] = self._edge_pairs.get(pair,0) + 1
+
+        self._aggregates = {node:{} for node in G.nodes}
+        for (u,v,attack) in self._edge_pairs:
+            self._add_aggregate(v,self._label_code(G.nodes[u]['label']),attack,1,_exact_weight(G.nodes[u]['weight']))
+
+        self._dirty = set(G.nodes)
+
+        return
+
+    def _add_aggregate(self,v:int,code:int,attack:bool,count:int,weight:Union[int,Fraction]):
+        """Add count and weight to self._aggregates[v][(code,attack)].
+        """
+        aggregate = self._aggregates.setdefault(v,{}).setdefault((code,attack),[0,0])
+        aggregate[0] += count
+        aggregate[1] += weight
+
+        return
+
+    def _out_pairs(self,u:int)->list[tuple]:
+        """Distinct (tail,head,attack) of the edges going out of u."""
+        return list(set((u,v,bool(attack)) for _,v,attack in self.graph.out_edges(nbunch=u,data='attack')))
+
+    def _label_code(self,label:Any)->int:
+        """0,1,2 for label_list[0],label_list[1],label_list[2]. 3 for the other labels."""
+        label_list = self.graph.graph['label_list']
+        for code in range(3):
+            if label_list[code] == label:
+                return code
+        return 3
+
+    @_profiled("predict_from_aggregates",per_node=True)
+    def _predict_from_aggregates(self,u:int)->list:
+        """
+        The same as predict_labels. In exact arithmetic, sum_A and sum_B of the simple conditions are taken from self._aggregates instead of scanning the edges.
+        Extended conditions need the predecessors themselves, and floating point sums depend on the order of the additions
+        (the aggregates would add them in the order of the edits), so predict_labels is used for them: it adds the weights
+        in the same order as predict_all, in O(in-degree) with the compiled conditions.
+
+        Args:
+            u (int): vertex
+
+        Returns:
+            list: list of predicted labels
+        """
+        G = self.graph
+
+        if not self.exact_arithmetic or any(len(c) == 4 for c in G.nodes[u]['conditions']):
+            return self.predict_labels(u)
+
+        aggregate = self._aggregates.get(u,{})
+        get = lambda code,attack:aggregate.get((code,attack),(0,0))
+
+        # Au : label_list[0] and attack, or label_list[1] and support. Bu : the opposite.
+        len_Au = get(0,True)[0] + get(1,False)[0]
+        len_Bu = get(1,True)[0] + get(0,False)[0]
+
+        return self._predict_exactly_from_aggregates(u,len_Au + len_Bu,get(0,True)[1] + get(1,False)[1],get(1,True)[1] + get(0,False)[1])
+
+    def _predict_exactly_from_aggregates(self,u:int,num:int,sum_A:Union[int,Fraction],sum_B:Union[int,Fraction])->list:
+        """_predict_from_aggregates in exact arithmetic. The sums of the aggregates are already exact.
+        """
+        G = self.graph
+        trace = self._judge_trace(u)
+
+        if self._profile is not None:
+            self._profile.count("conditions_evaluated",len(G.nodes[u]['conditions']))
+
+        if trace is not None:
+            A_weight,B_weight = _exact_scaled_weights(sum_A,sum_B,num)
+
+        codes = []
+        for k,condition in enumerate(G.nodes[u]['conditions']):
+            code = _exact_judge_code(condition[0] == '+',_exact_weight(condition[1]),_exact_weight(condition[2]),sum_A,sum_B,num)
+            codes.append(code)
+            if trace is not None:
+                trace.record(u,k,A_weight,B_weight,code,sum_A + sum_B == 0)
+
+        to_list = self._judge_to_labels()
+        predicted_labels = to_list[reduce_judges(codes,G.nodes[u]['skew_type'])]
+
+        G.nodes[u]['predicted_labels'] = predicted_labels
+        self._dirty.discard(u)
+
+        return predicted_labels
+
+    def _compiled_conditions(self,u:Any)->_CompiledConditions:
+        """The conditions of u compiled into bitmasks (see _CompiledConditions), compiled at the first prediction of u.
+        They are compiled again when the conditions or the in-edges of u change, also when the graph is edited directly.
+        """
+        compiled = self._compiled.get(u)
+
+        if compiled is None or not compiled.is_valid(self.graph,u):
+            compiled = self._compiled[u] = _CompiledConditions(self.graph,u,self._node_positions(self.graph.predecessors(u)))
+
+        return compiled
+
+    def _node_positions(self,nodes:typing.Iterable)->dict:
+        """Vertex -> position in graph.nodes, the order in which every prediction adds the weights of the predecessors.
+        It is built again when one of nodes is not in it (a vertex added since).
+        """
+        positions = self._positions
+        if positions is None or any(v not in positions for v in nodes):
+            positions = self._positions = {node:i for i,node in enumerate(self.graph.nodes)}
+
+        return positions
+
+    def _judge_to_labels(self)->list:
+        """Table to rearrange the format of S1, S2, etc. into a list of labels.
+
+        Returns:
+            list: the list of labels for S1-S8 at index 1-8.
+        """
+        label_list = self.graph.graph['label_list']
+
+        return [
+            None,
+            [label_list[0]],                                #S1
+            [label_list[1]],                                #S2
+            [label_list[2]],                                #S3
+            [label_list[0],label_list[1]],                  #S4
+            [label_list[0],label_list[2]],                  #S5
+            [label_list[1],label_list[2]],                  #S6
+            [label_list[0],label_list[1],label_list[2]],    #S7
+            []                                              #S8
+        ]
+
+   
+
+    def _split_predecessor_by_label(self,vertex_index:int,label:int,target:Any) -> list[int]:
+        """Function to get the predecessor for each vertex label.
+
+        Args:
+            vertex_index (int): name of target vertex]: [name of target vertex
+            label (int): [which label vertices to collect].
+            target (Union[bool,str]): [Specify which vertices to focus on, the attacker or the supporter. True if only the attacker, false if only the supporter, "any" if both.
+            No vertices are duplicated if both are specified].
+
+        Returns.
+            [list(int)]: [result].
+        """
+
+
+        graph = self.graph
+
+        res_list = []
+
+        prof = self._profile
+        if prof is not None:
+            start = time.perf_counter()
+        
+        # search for (u,v,attack) such that v == vertex_index.
+        for u,v,attack in graph.in_edges(nbunch = vertex_index,data = "attack"):
+            
+            assert(attack is not None)
+            assert(type(u) == int)
+            
+            if attack == target:
+                if label == "any":
+                    res_list.append(u)
+                    continue
+                
+                if graph.nodes[u]['label'] == label:
+                    res_list.append(u)
+                    continue
+
+        if prof is not None:
+            prof.add("split_predecessor_by_label",time.perf_counter() - start)
+            prof.add_edges_scanned(vertex_index,graph.in_degree(vertex_index))
+        
+        return res_list
+
+
+# Addition table of decisions when neutral.
+_TABLE_NEUTRAL = [
+#          S1   S2   S3   S4   S5   S6   S7   S8
+    [None,None,None,None,None,None,None,None,None],
+    [None,'S1','S3','S3','S5','S5','S3','S5','S1'],#S1
+    [None,'S3','S2','S3','S6','S3','S3','S6','S2'],#S2
+    [None,'S3','S3','S3','S3','S3','S3','S3','S3'],#S3
+    [None,'S5','S6','S3','S7','S5','S6','S7','S4'],#S4
+    [None,'S5','S3','S3','S5','S5','S3','S5','S5'],#S5
+    [None,'S3','S3','S3','S6','S3','S3','S6','S6'],#S6
+    [None,'S5','S6','S3','S7','S5','S6','S7','S7'],#S7
+    [None,'S1','S2','S3','S4','S5','S6','S7','S8'],#S8
+]
+
+# Addition table of decisions when L1 skew.
+_TABLE_L1 =[
+#          S1   S2   S3   S4   S5   S6   S7   S8
+    [None,None,None,None,None,None,None,None,None],
+    [None,"S1","S1",None,"S1",None,None,None,"S1"],#S1
+    [None,"S1","S2",None,"S4",None,None,None,"S2"],#S2
+    [None,None,None,None,None,None,None,None,None],#S3
+    [None,"S1","S4",None,"S4",None,None,None,"S4"],#S4
+    [None,None,None,None,None,None,None,None,None],#S5
+    [None,None,None,None,None,None,None,None,None],#S6
+    [None,None,None,None,None,None,None,None,None],#S7
+    [None,"S1","S2",None,"S4",None,None,None,"S8"],#S8
+]
+
+# Addition table of decisions when L2 skew.
+_TABLE_L2 = [
+#          S1   S2   S3   S4   S5   S6   S7   S8
+    [None,None,None,None,None,None,None,None,None],
+    [None,"S1","S2",None,"S4",None,None,None,"S1"],#S1
+    [None,"S2","S2",None,"S2",None,None,None,"S2"],#S2
+    [None,None,None,None,None,None,None,None,None],#S3
+    [None,"S4","S2",None,"S4",None,None,None,"S4"],#S4
+    [None,None,None,None,None,None,None,None,None],#S5
+    [None,None,None,None,None,None,None,None,None],#S6
+    [None,None,None,None,None,None,None,None,None],#S7
+    [None,"S1","S2",None,"S4",None,None,None,"S8"],#S8
+]
+
+# output formats of visualize and render_jobs. "dot" is written without layout.
+RENDER_FORMATS = ("pdf","svg","png","dot")
+
+
+def render_jobs(jobs:list[dict],workers:Optional[int] = None)->list[str]:
+    """
+    Render many figures, running the graphviz layout and drawing in a pool of worker processes.
+    Each job is a dict with 'model' (MAModel) and the arguments of MAModel.visualize, e.g.
+
+        paths = render_jobs(
+            [{"model":model,"scc_id":k,"title":f"scc{k}","format":"svg"} for k in range(1,num_scc+1)]
+            + [{"model":scenario,"title":f"scenario{i}","vis_features":["label","predicted_labels"]} for i,scenario in enumerate(scenarios)]
+        )
+
+    The vis_info and the colors are prepared in this process, and the workers get the graphs in DOT.
+    The layouts are cached as in visualize: a job whose vertices and edges were laid out before (or earlier in the same call) is drawn without layout.
+    Jobs with the format "dot" are written without layout in this process.
+
+    Args:
+        jobs (list[dict]): the jobs
+        workers (Optional[int], optional): number of worker processes. Defaults to None (os.cpu_count()). 1 to render in this process.
+
+    Returns:
+        list[str]: the paths of the files written, in the order of the jobs
+    """
+    workers = os.cpu_count() if workers is None else workers
+
+    paths : list[Optional[str]] = [None] * len(jobs)
+    remaining = list(range(len(jobs)))
+
+    # the jobs sharing a layout which is not cached yet wait for the first of them (second round).
+    while remaining:
+        prepared = {}
+        deferred = []
+        laying_out = set()
+
+        for i in remaining:
+            kwargs = dict(jobs[i])
+            model = kwargs.pop("model")
+            job = model._render_job(**kwargs)
+
+            if job["format"] != "dot" and job["layout"] is None:
+                if job["layout_key"] in laying_out:
+                    deferred.append(i)
+                    continue
+                laying_out.add(job["layout_key"])
+
+            prepared[i] = (model,kwargs.get("layout_cache_dir"),job)
+
+        pooled = [i for i,(_,_,job) in prepared.items() if job["format"] != "dot"]
+
+        if workers <= 1 or len(pooled) <= 1:
+            results = {i:_draw_render_job(prepared[i][2]) for i in pooled}
+        else:
+            sources = []
+            for i in pooled:
+                job = dict(prepared[i][2])
+                job["graph"] = job["graph"].string()
+                sources.append(job)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers,len(pooled))) as executor:
+                results = dict(zip(pooled,executor.map(_draw_render_job,sources)))
+
+        for i,(model,layout_cache_dir,job) in prepared.items():
+            path,layout = results[i] if i in results else _draw_render_job(job)
+            if layout is not None:
+                model._store_layout(job["layout_key"],layout,layout_cache_dir)
+            paths[i] = path
+
+        remaining = deferred
+
+    return paths
+
+
+def _draw_render_job(job:dict,phase:Optional[Callable[[str],typing.ContextManager]] = None)->tuple[str,Optional[dict]]:
+    """
+    The graphviz side of visualize: draw the graph of a job made by MAModel._render_job.
+
+    Args:
+        job (dict): the job. 'graph' is pygraphviz.AGraph, or its DOT source when sent to a worker process.
+        phase (Optional[Callable[[str],typing.ContextManager]], optional): MAModel._phase to profile the layout and the drawing. Defaults to None.
+
+    Returns:
+        tuple[str,Optional[dict]]: the path written, and the layout if it was laid out (to be cached, see MAModel._store_layout)
+    """
+    import pygraphviz
+
+    phase = phase if phase is not None else (lambda name:contextlib.nullcontext())
+
+    G_pgv = job["graph"]
+    if isinstance(G_pgv,str):
+        G_pgv = pygraphviz.AGraph(string=G_pgv)
+
+    path = job["path"]
+    layout = job["layout"]
+
+    # DOT is written as it is, to be laid out by the downstream tools.
+    if job["format"] == "dot":
+        with phase("visualize.render"):
+            G_pgv.write(path)
+        return path,None
+
+    new_layout = None
+
+    if layout is None or not all(str(node) in layout["nodes"] for node in G_pgv.nodes()):
+        # The layout runs once, in a draw to DOT, and the positions are read from its output.
+        # (layout() followed by draw() on the same AGraph may crash in gvFreeLayout with fdp.)
+        with phase("visualize.layout"):
+            laid_out = pygraphviz.AGraph(string=G_pgv.draw(format='dot',prog=job["prog"],args='-Gnodesep=1').decode())
+        new_layout = {
+            "bb" : laid_out.graph_attr["bb"],
+            "nodes" : {str(node):laid_out.get_node(node).attr["pos"] for node in laid_out.nodes()},
+            "edges" : [[str(e[0]),str(e[1]),str(e.key),e.attr["pos"],e.attr.get("lp") or None] for e in laid_out.edges()],
+        }
+
+        # the graph read back has the positions. Each AGraph is drawn only once.
+        with phase("visualize.render"):
+            laid_out.draw(path,format=job["format"],prog='nop2')
+
+        return path,new_layout
+
+    with phase("visualize.render"):
+        for node in G_pgv.nodes():
+            G_pgv.get_node(node).attr["pos"] = layout["nodes"][str(node)]
+
+        # the saved splines of the edges are drawn as they are. If the edges differ, they are routed again.
+        edges = {(u,v,key):rest for u,v,key,*rest in layout["edges"]}
+        if all((str(e[0]),str(e[1]),str(e.key)) in edges for e in G_pgv.edges()):
+            for e in G_pgv.edges():
+                pos,*lp = edges[(str(e[0]),str(e[1]),str(e.key))]
+                e.attr["pos"] = pos
+                if lp and lp[0]:
+                    e.attr["lp"] = lp[0]
+            G_pgv.graph_attr["bb"] = layout["bb"]
+
+        # nop2 is neato -n2 of the graphviz library: the positions are used as they are, without layout.
+        # (draw passes only -T,-K,-G,-N,-E of args to the library, so prog='neato',args='-n2' would lay the graph out again.)
+        G_pgv.draw(path,format=job["format"],prog='nop2')
+
+    return path,new_layout
+
+
+def _exact_weight(weight:Union[int,float])->Union[int,Fraction]:
+    """Weight for the aggregates of the mutation API. Non-integer weights are kept as Fraction so that adding and subtracting them doesn't drift.
+    """
+    if isinstance(weight,int):
+        return weight
+    return Fraction(weight)
+
+
+def _number(value:Union[int,Fraction])->Union[int,float]:
+    """Inverse of _exact_weight for a sum of weights."""
+    if isinstance(value,Fraction):
+        return float(value)
+    return value
+
+
+def _exact_judge_code(is_plus:bool,lo:Union[int,Fraction],hi:Union[int,Fraction],sum_A:Union[int,Fraction],sum_B:Union[int,Fraction],num:int)->int:
+    """
+    Judge code of a condition in exact arithmetic (MAModel.exact_arithmetic).
+    A_weight = sum_A / (all_weight / num) is never calculated: A_weight < x is compared as sum_A * num < x * all_weight.
+
+    Args:
+        is_plus (bool): whether the condition is '+'
+        lo (Union[int,Fraction]): x1 (or y1) of the condition, see _exact_weight
+        hi (Union[int,Fraction]): x2 (or y2) of the condition
+        sum_A (Union[int,Fraction]): sum of the weights in Au
+        sum_B (Union[int,Fraction]): sum of the weights in Bu
+        num (int): |Au| + |Bu|
+
+    Returns:
+        int: 1 for S1, 2 for S2, 4 for S4
+    """
+    value = sum_B if is_plus else sum_A
+    all_weight = sum_A + sum_B
+
+    if all_weight == 0:
+        # A_weight and B_weight are 0
+        value = 0
+        all_weight = 1
+    elif all_weight < 0:
+        value = -value
+        all_weight = -all_weight
+
+    value = value * num
+
+    if is_plus:
+        return 2 if value < lo * all_weight else (4 if value < hi * all_weight else 1)
+    else:
+        return 1 if value < lo * all_weight else (4 if value < hi * all_weight else 2)
+
+
+def _exact_scaled_weights(sum_A:Union[int,Fraction],sum_B:Union[int,Fraction],num:int)->tuple[float,float]:
+    """A_weight and B_weight of exact sums, rounded once to float (for JudgeTrace)."""
+    all_weight = sum_A + sum_B
+    if all_weight == 0:
+        return 0,0
+
+    return float(Fraction(sum_A * num) / all_weight),float(Fraction(sum_B * num) / all_weight)
+
+
+def _weight_interval(weight:Union[int,Fraction],bounds:list[tuple],rows:list[tuple],skew_type:str)->WeightInterval:
+    """
+    Interval of the weight w of a predecessor in which the overall judge of a vertex stays the same as at weight (see MAModel.weight_sensitivity).
+
+    Args:
+        weight (Union[int,Fraction]): current weight of the predecessor
+        bounds (list[tuple]): (is '+',x1,x2) of each condition of the vertex
+        rows (list[tuple]): (sum_A without the predecessor, sum_B without it, |Au|+|Bu|, whether it is in Au, whether it is in Bu) of each condition
+        skew_type (str): skew_type of the vertex
+
+    Returns:
+        WeightInterval: the interval
+    """
+    # The judges change only where a comparison sum * num < x * all_weight turns, or all_weight becomes 0 (or changes its sign).
+    roots = set()
+    for (is_plus,lo,hi),(sum_A,sum_B,num,in_A,in_B) in zip(bounds,rows):
+        in_value,value = (in_B,sum_B) if is_plus else (in_A,sum_A)
+        in_all,all_weight = in_A + in_B,sum_A + sum_B
+
+        if in_all:
+            roots.add(Fraction(-all_weight,1) / in_all)
+        for x in (lo,hi):
+            # num * (value + in_value * w) - x * (all_weight + in_all * w) = 0
+            slope = num * in_value - x * in_all
+            if slope != 0:
+                roots.add(Fraction(x * all_weight - num * value) / slope)
+
+    def overall(w):
+        codes = [
+            _exact_judge_code(is_plus,lo,hi,sum_A + in_A * w,sum_B + in_B * w,num)
+            for (is_plus,lo,hi),(sum_A,sum_B,num,in_A,in_B) in zip(bounds,rows)
+        ]
+        return reduce_judges(codes,skew_type)
+
+    current = overall(weight)
+    roots = sorted(roots)
+
+    # Go down (up) from weight through the open segments between the roots and the roots themselves while the judge is the same.
+    low,low_closed = -math.inf,False
+    end = weight
+    for r in [r for r in reversed(roots) if r < weight] + [None]:
+        if overall((r + end) / 2 if r is not None else end - 1) != current:
+            low,low_closed = end,True
+            break
+        if r is None:
+            break
+        if overall(r) != current:
+            low,low_closed = r,False
+            break
+        end = r
+
+    high,high_closed = math.inf,False
+    end = weight
+    for r in [r for r in roots if r > weight] + [None]:
+        if overall((r + end) / 2 if r is not None else end + 1) != current:
+            high,high_closed = end,True
+            break
+        if r is None:
+            break
+        if overall(r) != current:
+            high,high_closed = r,False
+            break
+        end = r
+
+    return WeightInterval(_exact_number(low),_exact_number(high),low_closed,high_closed)
+
+
+def _exact_number(value:Union[int,Fraction,float])->Union[int,Fraction,float]:
+    """A Fraction with the denominator 1 as int."""
+    if isinstance(value,Fraction) and value.denominator == 1:
+        return value.numerator
+    return value
+
+
+# Judges are handled as integer codes: 1 for S1, ..., 8 for S8. 0 is the undefined judge (None in the tables).
+_JUDGE_NAMES = (None,'S1','S2','S3','S4','S5','S6','S7','S8')
+_JUDGE_CODES = {name:code for code,name in enumerate(_JUDGE_NAMES) if name is not None}
+
+# skew_type -> index of the first axis of _ADDITION_CODES
+_SKEW_CODES = {'neutral':0,'L1':1,'L2':2}
+
+# The addition tables above precompiled to the judge codes.
+# _ADDITION_CODES[skew_code][a][b] is the code of the sum of Sa and Sb.
+_ADDITION_CODES = tuple(
+    tuple(
+        tuple(0 if j is None else _JUDGE_CODES[j] for j in row)
+        for row in table
+    )
+    for table in (_TABLE_NEUTRAL,_TABLE_L1,_TABLE_L2)
+)
+
+# The same table as a numpy array for the vectorized addition.
+_ADDITION_ARRAY = np.array(_ADDITION_CODES,dtype=np.int8)
+
+
+def reduce_judges(codes:typing.Iterable[int],skew_type:str)->int:
+    """Add up the judge codes of the conditions of a vertex in order, starting from S8.
+
+    Args:
+        codes (typing.Iterable[int]): judge codes (1 for S1, ..., 8 for S8) of each condition.
+        skew_type (str): 'neutral', 'L1' or 'L2'.
+
+    Returns:
+        int: the code of the overall judge.
+    """
+    table = _ADDITION_CODES[_SKEW_CODES[skew_type]]
+
+    res = 8
+    for code in codes:
+        res = table[res][code]
+
+    return res
+
+
+def reduce_judge_array(judges:np.ndarray,skew_codes:np.ndarray)->np.ndarray:
+    """Add up the judge codes of many vertices at once.
+
+    Args:
+        judges (np.ndarray): (num_vertex, num_conditions) array of judge codes. Pad with 8 (S8) when a vertex has fewer conditions since S8 is the unit.
+        skew_codes (np.ndarray): (num_vertex,) array of skew codes (0 for neutral, 1 for L1, 2 for L2).
+
+    Returns:
+        np.ndarray: (num_vertex,) array of the codes of the overall judges.
+    """
+    judges = np.asarray(judges,dtype=np.int8).reshape(len(skew_codes),-1)
+
+    overall = np.full(len(skew_codes),8,dtype=np.int8)
+
+    for k in range(judges.shape[1]):
+        overall = _ADDITION_ARRAY[skew_codes,overall,judges[:,k]]
+
+    return overall
+
+
+def _in_edge_signature(graph:nx.MultiDiGraph,u:Any)->tuple:
+    """(tail,key,attack) of each in-edge of u, which determine the masks of _CompiledConditions."""
+    return tuple((v,key,attack) for v,_,key,attack in graph.in_edges(nbunch=u,keys=True,data='attack'))
+
+
+class _CompiledConditions:
+    """
+    The conditions of a vertex compiled into bitmasks over its distinct predecessors: the j-th predecessor is the bit 1 << j.
+    Au and Bu are found once for all the conditions (bind), and then each condition is an AND with its mask and a sum over the bits.
+    The predecessors are in the order of graph.nodes, so the weights are added in the same order as _ModelArrays (predict_all)
+    and the floating point sums are the same whatever order the edges were added in.
+    The compiled conditions are not modified after __init__, so they are shared by the threads predicting the same vertex.
+
+    Attributes:
+        conditions(tuple): the conditions compiled.
+        in_edges(tuple): (tail,key,attack) of each in-edge of the vertex when compiled.
+            The conditions are compiled again if the conditions or the in-edges differ (see is_valid), even when the graph was edited directly.
+        in_degree(int): the in-degree of the vertex when compiled.
+        preds(list): the distinct predecessors, in the order of graph.nodes.
+        attack_mask,support_mask(int): the predecessors with an attack (support) edge to the vertex.
+        cond_masks(list[int]): the mask of each condition. All the predecessors for a simple condition, the predecessors in the subset for an extended condition.
+    """
+
+    def __init__(self,graph:nx.MultiDiGraph,u:Any,positions:dict):
+        """Compile the conditions of u.
+
+        Args:
+            graph (nx.MultiDiGraph): graph of the model
+            u (Any): vertex
+            positions (dict): vertex -> position in graph.nodes, at least for the predecessors of u (see MAModel._node_positions)
+        """
+        attack_mask = 0
+        support_mask = 0
+
+        in_edges = _in_edge_signature(graph,u)
+
+        preds = sorted({v for v,_,_ in in_edges},key=positions.__getitem__)
+        index = {v:j for j,v in enumerate(preds)}
+
+        for v,_,attack in in_edges:
+            j = index[v]
+            if attack:
+                attack_mask |= 1 << j
+            else:
+                support_mask |= 1 << j
+
+        all_preds = (1 << len(index)) - 1
+
+        cond_masks = []
+        for c in graph.nodes[u]['conditions']:
+            if len(c) == 4:
+                # vertices which are not predecessors are never in Au or Bu.
+                mask = 0
+                for v in c[3]:
+                    if v in index:
+                        mask |= 1 << index[v]
+                cond_masks.append(mask)
+            else:
+                cond_masks.append(all_preds)
+
+        self.conditions = tuple(graph.nodes[u]['conditions'])
+        self.in_edges = in_edges
+        self.in_degree = len(in_edges)
+        self.preds = preds
+        self.attack_mask = attack_mask
+        self.support_mask = support_mask
+        self.cond_masks = cond_masks
+
+        return
+
+    def is_valid(self,graph:nx.MultiDiGraph,u:Any)->bool:
+        """Whether the compiled conditions still describe u: the same conditions and the same in-edges (tails, keys and attack)."""
+        return (
+            tuple(graph.nodes[u]['conditions']) == self.conditions
+            and _in_edge_signature(graph,u) == self.in_edges
+        )
+
+    def bind(self,graph:nx.MultiDiGraph,exact:bool)->_BoundConditions:
+        """Find Au and Bu (as masks) and the weights of the predecessors with the current labels and weights.
+
+        Args:
+            graph (nx.MultiDiGraph): graph of the model
+            exact (bool): whether the weights are taken as int or Fraction (see _exact_weight)
+
+        Returns:
+            _BoundConditions: the conditions with Au, Bu and the weights
+        """
+        label_list = graph.graph['label_list']
+        nodes = graph.nodes
+
+        label0 = 0
+        label1 = 0
+        weights = []
+        for j,v in enumerate(self.preds):
+            label = nodes[v]['label']
+            if label == label_list[0]:
+                label0 |= 1 << j
+            if label == label_list[1]:
+                label1 |= 1 << j
+            weights.append(_exact_weight(nodes[v]['weight']) if exact else nodes[v]['weight'])
+
+        # Au : label_list[0] and attack, or label_list[1] and support. Bu : the opposite.
+        Au = (label0 & self.attack_mask) | (label1 & self.support_mask)
+        Bu = (label1 & self.attack_mask) | (label0 & self.support_mask)
+
+        return _BoundConditions(self.cond_masks,Au,Bu,weights)
+
+
+class _BoundConditions:
+    """
+    _CompiledConditions bound to the labels and the weights of a prediction (see _CompiledConditions.bind).
+
+    Attributes:
+        cond_masks(list[int]): the mask of each condition (of _CompiledConditions).
+        Au,Bu(int): the predecessors in Au and Bu.
+        weights(list): the weight of each predecessor.
+    """
+
+    def __init__(self,cond_masks:list[int],Au:int,Bu:int,weights:list):
+        self.cond_masks = cond_masks
+        self.Au = Au
+        self.Bu = Bu
+        self.weights = weights
+        self._sums = {}
+
+        return
+
+    def condition_sums(self,k:int)->tuple[Any,Any,int,int]:
+        """Sums of the weights in Au and Bu of the k-th condition and their sizes.
+
+        Returns:
+            tuple[Any,Any,int,int]: sum_A, sum_B, |Au|, |Bu|
+        """
+        mask = self.cond_masks[k]
+        sum_A,len_Au = self._masked_sum(self.Au & mask)
+        sum_B,len_Bu = self._masked_sum(self.Bu & mask)
+
+        return sum_A,sum_B,len_Au,len_Bu
+
+    def _masked_sum(self,mask:int)->tuple[Any,int]:
+        """Sum of the weights of the predecessors in mask and their number. The sums are cached by mask."""
+        if mask in self._sums:
+            return self._sums[mask]
+
+        weights = self.weights
+        total = 0
+        count = 0
+        rest = mask
+        while rest:
+            low = rest & -rest
+            total += weights[low.bit_length() - 1]
+            count += 1
+            rest ^= low
+
+        self._sums[mask] = (total,count)
+
+        return total,count
+
+
+class _Judge:
+    """
+    Class for enabling the addition of decisions.
+    
+    Attributes:
+    
+    self.code The real judgment as an integer code, 1 for S1, ..., 8 for S8.
+    self.judge The same judgment represented by S1-S8.
+    self.skew_type The skew_type needed to add up the judgments for each condition.
+    
+    """
+    
+    def __init__(self,judge=None,skew_type = None):
+        """Initialization
+      
+        Args:
+            judge (Union[str,int], optional): _Judge by the condition, 'S1'-'S8' or its code. Defaults to None.
+        """
+        
+        self.skew_type = None
+        
+        if skew_type is not None:
+            self.skew_type = skew_type
+
+        #S8 is the unit source in the addition of decisions.
+        self.code = 8
+        
+        if judge is not  None:
+            self.judge = judge
+        
+        return
+
+    @property
+    def judge(self)->Optional[str]:
+        """The judgment represented by S1-S8."""
+        return _JUDGE_NAMES[self.code]
+
+    @judge.setter
+    def judge(self,judge:Union[str,int]):
+        self.code = judge if isinstance(judge,int) else _JUDGE_CODES[judge]
+    
+    def make_a_judge(self,condition:tuple,ma_model:MAModel,u:int,trace:Optional[JudgeTrace] = None,index:int = 0,compiled:Optional[_BoundConditions] = None):
+        """
+        Require a per-condition data decision. Skew-type is not involved when making a judgment for each condition. Conditional data with subsets are supported.
+        Conditional data with no subset is also supported.
+
+        Args:
+            condition (tuple): Condition
+            mamodel(MAModel):model
+            u: Vertex with condition passed as argument
+            trace (Optional[JudgeTrace], optional): where the judge is recorded. Defaults to None (not recorded).
+            index (int, optional): position of the condition in the conditions of u, for trace and compiled. Defaults to 0.
+            compiled (Optional[_BoundConditions], optional): the conditions of u compiled into bitmasks and bound to the current labels.
+                If given, Au and Bu are taken from it instead of scanning the edges. Defaults to None.
+        """
+        
+        G = ma_model.graph
+
+        label_list = G.graph['label_list']
+
+        prof = ma_model._profile
+        if prof is not None:
+            start = time.perf_counter()
+            prof.count("conditions_evaluated")
+
+        if compiled is not None:
+            sum_A,sum_B,len_Au,len_Bu = compiled.condition_sums(index)
+
+        else:
+            Au = set(ma_model._split_predecessor_by_label(u,label_list[0],True)) | set(ma_model._split_predecessor_by_label(u,label_list[1],False)) 
+            Bu = set(ma_model._split_predecessor_by_label(u,label_list[1],True)) | set(ma_model._split_predecessor_by_label(u,label_list[0],False))
+            
+            if len(condition) == 4:
+                
+                Au = Au & set(condition[3])
+                Bu = Bu & set(condition[3])
+
+            weight = _exact_weight if ma_model.exact_arithmetic else (lambda w:w)
+
+            sum_A = sum(weight(G.nodes[v]['weight']) for v in Au)
+            sum_B = sum(weight(G.nodes[v]['weight']) for v in Bu)
+            len_Au = len(Au)
+            len_Bu = len(Bu)
+
+        if ma_model.exact_arithmetic:
+            self._make_an_exact_judge(condition,u,sum_A,sum_B,len_Au + len_Bu,trace,index)
+
+            if prof is not None:
+                prof.add("make_a_judge",time.perf_counter() - start)
+
+            return
+
+        all_weight = sum_A + sum_B
+        A_weight = sum_A # the bigger, the easier to be rej
+        B_weight = sum_B # the bigger, the easier to be acc
+        
+        # 重みが全て1である時と同一のスケールにする。
+        if all_weight == 0:
+            A_weight = 0
+            B_weight = 0
+        else:
+            average_weight = all_weight / (len_Au + len_Bu)
+            A_weight = A_weight/average_weight
+            B_weight = B_weight/average_weight
+
+            # print (f'A:{A_weight},B:{B_weight},all:{all_weight},average:{average_weight},u:{u}')
+        
+        # A_weight + B_weight shold be almost len(Au) + len(Bu)
+
+        assert abs(A_weight + B_weight - len_Au - len_Bu) < 0.1
 
 
         # Judging from the ease of being acc. see Bu
         if condition[0] == '+':
             if B_weight < condition[1]:
-                self.judge = 'S2'
+                self.code = 2
             elif B_weight < condition[2]:
-                self.judge = 'S4'
+                self.code = 4
             else:
-                self.judge = 'S1'
+                self.code = 1
+        
+        # Judging from the ease of being rej. see Au.
+        else:
+            if A_weight < condition[1]:
+                self.code = 1
+            elif A_weight < condition[2]:
+                self.code = 4
+            else:
+                self.code = 2
+
+        if trace is not None:
+            trace.record(u,index,A_weight,B_weight,self.code,all_weight == 0)
+
+        if prof is not None:
+            prof.add("make_a_judge",time.perf_counter() - start)
+
+        return
+    
+    def _make_an_exact_judge(self,condition:tuple,u:int,sum_A:Union[int,Fraction],sum_B:Union[int,Fraction],num:int,trace:Optional[JudgeTrace],index:int):
+        """make_a_judge in exact arithmetic (MAModel.exact_arithmetic), after the exact sums of the weights in Au and Bu are found.
+        """
+        self.code = _exact_judge_code(condition[0] == '+',_exact_weight(condition[1]),_exact_weight(condition[2]),sum_A,sum_B,num)
+
+        if trace is not None:
+            A_weight,B_weight = _exact_scaled_weights(sum_A,sum_B,num)
+            trace.record(u,index,A_weight,B_weight,self.code,sum_A + sum_B == 0)
+
+        return
+
+    def __add__(self,other):
+        """        
+        Add up the decisions for each vertex.
+        Note that it depends on skew_type.
+
+        Args:
+            other (_Judge): The other party of the addition.
+
+        Returns:
+            _Judge: Result of _Judge addition performed. 
+        """
         
-        # Judging from the ease of being rej. see Au.
+        assert(self.skew_type == other.skew_type)
+        
+        skew_type = self.skew_type
+        
+        assert(isinstance(other,_Judge))
+        assert(skew_type in ["neutral","L1","L2"])
+        
+        
+        # use the precompiled addition table of the codes.
+        res_judge = _Judge(judge=_ADDITION_CODES[_SKEW_CODES[skew_type]][self.code][other.code],skew_type=skew_type)
+        
+        return res_judge
+    
+    def __str__(self):
+        return f"<judge:{self.judge}>"
+    
+    def __repr__(self) -> str:
+        return f"<judge:{self.judge}>"
+
+
+class _ModelArrays:
+    """
+    Array representation of MAModel used to predict the labels of the whole graph at once.
+    Vertices are referred to by their position in self.nodes.
+
+    Attributes:
+        nodes(list): vertices in the order of graph.nodes.
+        index(dict): vertex -> position in nodes.
+        label_code(np.ndarray): 0,1,2 for label_list[0],label_list[1],label_list[2]. 3 for the other labels.
+        skew_code(np.ndarray): 0 for neutral, 1 for L1, 2 for L2.
+        weight(np.ndarray): weight of each vertex.
+        edge_key(np.ndarray): sorted head*(2*num_vertex) + tail*2 + attack of the edges. Multiple edges with the same (tail,head,attack) are merged since Au and Bu are sets.
+        in_ptr(np.ndarray): the edges coming into vertex i are in_ptr[i]:in_ptr[i+1] of in_src,in_dst,in_attack.
+        in_src,in_dst,in_attack(np.ndarray): tail, head and attack of the merged edges sorted by head.
+        cond_ptr(np.ndarray): the conditions of vertex i are cond_ptr[i]:cond_ptr[i+1] of cond_*.
+        cond_node,cond_sign,cond_lo,cond_hi,cond_has_subset(np.ndarray): vertex, sign ('+' is True), bounds and whether it is an extended condition.
+        member_cond,member_src(np.ndarray): (condition, vertex) pairs for the subsets of the extended conditions.
+        exact(bool): whether the judges are calculated in exact arithmetic (MAModel.exact_arithmetic).
+        exact_weight,exact_lo,exact_hi(np.ndarray): weights and bounds as int or Fraction (object arrays), only if exact.
+    """
+
+    def __init__(self,ma_model:MAModel):
+        """Build the arrays from ma_model.graph.
+
+        Args:
+            ma_model (MAModel): model
+        """
+
+        G = ma_model.graph
+
+        self.nodes = list(G.nodes)
+        self.index = {node:i for i,node in enumerate(self.nodes)}
+        index = self.index
+        n = len(self.nodes)
+        self.num_vertex = n
+
+        label_list = G.graph['label_list']
+        label_to_code = {label:i for i,label in enumerate(label_list[:3])}
+
+        self.label_code = np.array([label_to_code.get(G.nodes[node]['label'],3) for node in self.nodes],dtype=np.int8)
+        self.skew_code = np.array([_SKEW_CODES[G.nodes[node]['skew_type']] for node in self.nodes],dtype=np.int8)
+        self.weight = np.array([G.nodes[node]['weight'] for node in self.nodes],dtype=np.float64)
+
+        # edges
+        edges = np.array(
+            [(index[u],index[v],bool(attack)) for u,v,attack in G.edges(data='attack')],
+            dtype=np.int64
+        ).reshape(-1,3)
+
+        self._set_edges(edges[:,0],edges[:,1],edges[:,2])
+
+        # conditions
+        cond_node = []
+        cond_sign = []
+        cond_lo = []
+        cond_hi = []
+        cond_has_subset = []
+        member_cond = []
+        member_src = []
+
+        for i,node in enumerate(self.nodes):
+            for c in G.nodes[node]['conditions']:
+                if len(c) == 4:
+                    # vertices outside the graph are never in Au or Bu. The members are in the order of graph.nodes,
+                    # the order in which the weights are added (as in _CompiledConditions).
+                    for j in sorted({index[v] for v in c[3] if v in index}):
+                        member_cond.append(len(cond_node))
+                        member_src.append(j)
+
+                cond_node.append(i)
+                cond_sign.append(c[0] == '+')
+                cond_lo.append(c[1])
+                cond_hi.append(c[2])
+                cond_has_subset.append(len(c) == 4)
+
+        self.cond_node = np.array(cond_node,dtype=np.int64)
+        self.cond_sign = np.array(cond_sign,dtype=bool)
+        self.cond_lo = np.array(cond_lo,dtype=np.float64)
+        self.cond_hi = np.array(cond_hi,dtype=np.float64)
+        self.cond_has_subset = np.array(cond_has_subset,dtype=bool)
+        self.cond_ptr = np.zeros(n+1,dtype=np.int64)
+        self.cond_ptr[1:] = np.cumsum(np.bincount(self.cond_node,minlength=n))
+        self.member_cond = np.array(member_cond,dtype=np.int64)
+        self.member_src = np.array(member_src,dtype=np.int64)
+
+        self.exact = ma_model.exact_arithmetic
+        if self.exact:
+            self.exact_weight = np.array([_exact_weight(G.nodes[node]['weight']) for node in self.nodes],dtype=object)
+            self.exact_lo = np.array([_exact_weight(lo) for lo in cond_lo],dtype=object)
+            self.exact_hi = np.array([_exact_weight(hi) for hi in cond_hi],dtype=object)
+
+        return
+
+    @classmethod
+    def from_compact(cls,compact:CompactMAModel)->_ModelArrays:
+        """Build the arrays from CompactMAModel without going through networkx.
+
+        Args:
+            compact (CompactMAModel): model
+
+        Returns:
+            _ModelArrays: arrays
+        """
+        self = cls.__new__(cls)
+
+        n = len(compact.nodes)
+        self.nodes = compact.nodes.tolist()
+        self.index = {node:i for i,node in enumerate(self.nodes)}
+        self.num_vertex = n
+
+        self.label_code = np.minimum(compact.label_code,3).astype(np.int8)
+        self.skew_code = compact.skew_code
+        self.weight = compact.weight
+
+        self._set_edges(compact.edge_src.astype(np.int64),compact.edge_dst.astype(np.int64),compact.edge_attack.astype(np.int64))
+
+        num_cond = len(compact.cond_sign)
+        self.cond_ptr = compact.cond_ptr
+        self.cond_node = np.repeat(np.arange(n,dtype=np.int64),np.diff(compact.cond_ptr))
+        self.cond_sign = compact.cond_sign
+        self.cond_lo = compact.cond_lo
+        self.cond_hi = compact.cond_hi
+        self.cond_has_subset = compact.cond_has_subset
+
+        # the same vertex may appear twice in a subset.
+        member_cond = np.repeat(np.arange(num_cond,dtype=np.int64),np.diff(compact.subset_ptr))
+        member_key = np.unique(member_cond * max(n,1) + compact.subset_members)
+        self.member_cond = member_key // max(n,1)
+        self.member_src = member_key % max(n,1)
+
+        self.exact = False
+
+        return self
+
+    def _set_edges(self,tail:np.ndarray,head:np.ndarray,attack:np.ndarray):
+        """Merge the edges with the same (tail,head,attack) and sort them by head (CSR form).
+
+        Args:
+            tail (np.ndarray): positions of the tails
+            head (np.ndarray): positions of the heads
+            attack (np.ndarray): 1 for attack, 0 for support
+        """
+        n = self.num_vertex
+
+        self.edge_key = np.unique(head * (2*n) + tail * 2 + attack)
+        self.in_dst = self.edge_key // (2*n)
+        self.in_src = (self.edge_key % (2*n)) // 2
+        self.in_attack = (self.edge_key % 2) == 1
+        self.in_ptr = np.zeros(n+1,dtype=np.int64)
+        self.in_ptr[1:] = np.cumsum(np.bincount(self.in_dst,minlength=n))
+
+        return
+
+    def _build_lists(self):
+        """Build python lists of the arrays for the per-vertex evaluation (predict_code).
+        """
+        if hasattr(self,'_pred_lists'):
+            return
+
+        in_ptr = self.in_ptr.tolist()
+        in_src = self.in_src.tolist()
+        in_attack = self.in_attack.tolist()
+
+        # (tail,attack) of the edges coming into each vertex.
+        self._pred_lists = [
+            list(zip(in_src[in_ptr[i]:in_ptr[i+1]],in_attack[in_ptr[i]:in_ptr[i+1]]))
+            for i in range(self.num_vertex)
+        ]
+
+        members = [None if not has_subset else set() for has_subset in self.cond_has_subset.tolist()]
+        for c,v in zip(self.member_cond.tolist(),self.member_src.tolist()):
+            members[c].add(v)
+
+        cond_ptr = self.cond_ptr.tolist()
+        if self.exact:
+            conditions = list(zip(self.cond_sign.tolist(),self.exact_lo.tolist(),self.exact_hi.tolist(),members))
+        else:
+            conditions = list(zip(self.cond_sign.tolist(),self.cond_lo.tolist(),self.cond_hi.tolist(),members))
+
+        # (is '+',x1,x2,subset or None) of each vertex.
+        self._cond_lists = [conditions[cond_ptr[i]:cond_ptr[i+1]] for i in range(self.num_vertex)]
+        self._weight_list = self.exact_weight.tolist() if self.exact else self.weight.tolist()
+        self._skew_types = [('neutral','L1','L2')[code] for code in self.skew_code.tolist()]
+
+        return
+
+    def predict_code(self,i:int,labels:list[int])->int:
+        """Overall judge code of vertex i when the vertices have the label codes given by labels.
+        This is the same calculation as MAModel.predict_labels, for one vertex and without modifying anything.
+
+        Args:
+            i (int): position of the vertex
+            labels (list[int]): label code of each vertex (0,1,2 for label_list[0],label_list[1],label_list[2]).
+
+        Returns:
+            int: code of the overall judge (1 for S1, ..., 8 for S8)
+        """
+        self._build_lists()
+        weight = self._weight_list
+
+        Au = []
+        Bu = []
+        for v,attack in self._pred_lists[i]:
+            label = labels[v]
+            if label == 0:
+                (Au if attack else Bu).append(v)
+            elif label == 1:
+                (Bu if attack else Au).append(v)
+
+        codes = []
+        for is_plus,lo,hi,members in self._cond_lists[i]:
+            if members is None:
+                A = Au
+                B = Bu
+            else:
+                A = [v for v in Au if v in members]
+                B = [v for v in Bu if v in members]
+
+            A_weight = sum(weight[v] for v in A)
+            B_weight = sum(weight[v] for v in B)
+
+            if self.exact:
+                codes.append(_exact_judge_code(is_plus,lo,hi,A_weight,B_weight,len(A) + len(B)))
+                continue
+
+            all_weight = A_weight + B_weight
+
+            if all_weight == 0:
+                A_weight = 0
+                B_weight = 0
+            else:
+                average_weight = all_weight / (len(A) + len(B))
+                A_weight = A_weight / average_weight
+                B_weight = B_weight / average_weight
+
+            if is_plus:
+                codes.append(2 if B_weight < lo else (4 if B_weight < hi else 1))
+            else:
+                codes.append(1 if A_weight < lo else (4 if A_weight < hi else 2))
+
+        return reduce_judges(codes,self._skew_types[i])
+
+    def _has_edge(self,head:np.ndarray,tail:np.ndarray,attack:bool)->np.ndarray:
+        """Whether the edges (tail,head,attack) exist.
+
+        Args:
+            head (np.ndarray): heads
+            tail (np.ndarray): tails
+            attack (bool): attack or support
+
+        Returns:
+            np.ndarray: bool array
+        """
+        key = head * (2*self.num_vertex) + tail * 2 + int(attack)
+        pos = np.searchsorted(self.edge_key,key)
+        pos_clipped = np.minimum(pos,max(len(self.edge_key)-1,0))
+
+        if len(self.edge_key) == 0:
+            return np.zeros(len(key),dtype=bool)
+
+        return (pos < len(self.edge_key)) & (self.edge_key[pos_clipped] == key)
+
+    def _vertex_range(self,lo:int,hi:Optional[int])->tuple[int,int,int,int]:
+        """Positions lo:hi of the vertices (hi=None for the last), and the conditions cond_ptr[lo]:cond_ptr[hi] of them."""
+        hi = self.num_vertex if hi is None else hi
+
+        return lo,hi,int(self.cond_ptr[lo]),int(self.cond_ptr[hi])
+
+    def condition_weights(self,lo:int = 0,hi:Optional[int] = None)->tuple[np.ndarray,np.ndarray,np.ndarray]:
+        """Calculate A_weight and B_weight of every condition in the same way as _Judge.make_a_judge.
+
+        Args:
+            lo (int, optional): only the conditions of the vertices at positions lo:hi are calculated. Defaults to 0.
+            hi (Optional[int], optional): see lo. Defaults to None (all the vertices from lo).
+
+        Returns:
+            tuple[np.ndarray,np.ndarray,np.ndarray]: A_weight, B_weight, whether all_weight is 0.
+        """
+        count_A,count_B,sum_A,sum_B = self._condition_sums(self.weight,lo,hi)
+
+        # Scale to the same scale as when all weights are 1.
+        all_weight = sum_A + sum_B
+        no_weight = all_weight == 0
+
+        with np.errstate(divide='ignore',invalid='ignore'):
+            average_weight = all_weight / (count_A + count_B)
+            A_weight = np.where(no_weight,0.0,sum_A / average_weight)
+            B_weight = np.where(no_weight,0.0,sum_B / average_weight)
+
+        return A_weight,B_weight,no_weight
+
+    def _condition_sums(self,vertex_weight:np.ndarray,lo:int,hi:Optional[int])->tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]:
+        """|Au|, |Bu| and the sums of the weights in Au and Bu of every condition of the vertices at positions lo:hi.
+
+        Args:
+            vertex_weight (np.ndarray): weight of each vertex, float64 or object (exact_weight)
+            lo (int): see condition_weights
+            hi (Optional[int]): see condition_weights
+
+        Returns:
+            tuple[np.ndarray,np.ndarray,np.ndarray,np.ndarray]: count_A, count_B (float64), sum_A, sum_B (the dtype of vertex_weight)
+        """
+        lo,hi,c0,c1 = self._vertex_range(lo,hi)
+        n = hi - lo
+        num_cond = c1 - c0
+
+        # the edges are sorted by head, so the edges coming into lo:hi are a slice.
+        e0 = int(self.in_ptr[lo])
+        e1 = int(self.in_ptr[hi])
+        in_src = self.in_src[e0:e1]
+        in_dst = self.in_dst[e0:e1] - lo
+        cond_node = self.cond_node[c0:c1] - lo
+        cond_has_subset = self.cond_has_subset[c0:c1]
+
+        # Au : label_list[0] and attack, or label_list[1] and support. Bu : the opposite.
+        label = self.label_code[in_src]
+        attack = self.in_attack[e0:e1]
+        in_A = ((label == 0) & attack) | ((label == 1) & ~attack)
+        in_B = ((label == 1) & attack) | ((label == 0) & ~attack)
+        weight = vertex_weight[in_src]
+
+        count_A = np.bincount(in_dst,weights=in_A.astype(np.float64),minlength=n)[cond_node]
+        count_B = np.bincount(in_dst,weights=in_B.astype(np.float64),minlength=n)[cond_node]
+        sum_A = _segment_sum(in_dst,weight * in_A,n)[cond_node]
+        sum_B = _segment_sum(in_dst,weight * in_B,n)[cond_node]
+
+        # Au & subset, Bu & subset for the extended conditions. member_cond is sorted.
+        m0,m1 = np.searchsorted(self.member_cond,[c0,c1]).tolist()
+        if m1 > m0:
+            member_cond = self.member_cond[m0:m1]
+            member_src = self.member_src[m0:m1]
+            head = self.cond_node[member_cond]
+            has_attack = self._has_edge(head,member_src,True)
+            has_support = self._has_edge(head,member_src,False)
+            label = self.label_code[member_src]
+            member_A = ((label == 0) & has_attack) | ((label == 1) & has_support)
+            member_B = ((label == 1) & has_attack) | ((label == 0) & has_support)
+            weight = vertex_weight[member_src]
+            member_cond = member_cond - c0
+
+            subset = cond_has_subset
+            count_A[subset] = np.bincount(member_cond,weights=member_A.astype(np.float64),minlength=num_cond)[subset]
+            count_B[subset] = np.bincount(member_cond,weights=member_B.astype(np.float64),minlength=num_cond)[subset]
+            sum_A[subset] = _segment_sum(member_cond,weight * member_A,num_cond)[subset]
+            sum_B[subset] = _segment_sum(member_cond,weight * member_B,num_cond)[subset]
+        else:
+            count_A[cond_has_subset] = 0
+            count_B[cond_has_subset] = 0
+            sum_A[cond_has_subset] = 0
+            sum_B[cond_has_subset] = 0
+
+        return count_A,count_B,sum_A,sum_B
+
+    def exact_condition_judges(self,lo:int = 0,hi:Optional[int] = None,with_weights:bool = False)->tuple[np.ndarray,Optional[tuple]]:
+        """Judge code of every condition in exact arithmetic (see _exact_judge_code). self.exact must be True.
+
+        Args:
+            lo (int, optional): see condition_weights. Defaults to 0.
+            hi (Optional[int], optional): see condition_weights. Defaults to None.
+            with_weights (bool, optional): whether A_weight, B_weight and no_weight (see condition_weights) are also returned. Defaults to False.
+
+        Returns:
+            tuple[np.ndarray,Optional[tuple]]: judge codes, and (A_weight,B_weight,no_weight) if with_weights.
+        """
+        lo,hi,c0,c1 = self._vertex_range(lo,hi)
+
+        count_A,count_B,sum_A,sum_B = self._condition_sums(self.exact_weight,lo,hi)
+        num = (count_A + count_B).astype(np.int64).tolist()
+        sum_A = sum_A.tolist()
+        sum_B = sum_B.tolist()
+
+        judges = np.array([
+            _exact_judge_code(is_plus,x1,x2,a,b,k)
+            for is_plus,x1,x2,a,b,k in zip(self.cond_sign[c0:c1].tolist(),self.exact_lo[c0:c1].tolist(),self.exact_hi[c0:c1].tolist(),sum_A,sum_B,num)
+        ],dtype=np.int8)
+
+        if not with_weights:
+            return judges,None
+
+        scaled = [_exact_scaled_weights(a,b,k) for a,b,k in zip(sum_A,sum_B,num)]
+        A_weight = np.array([w[0] for w in scaled],dtype=np.float64)
+        B_weight = np.array([w[1] for w in scaled],dtype=np.float64)
+        no_weight = np.array([a + b == 0 for a,b in zip(sum_A,sum_B)],dtype=bool)
+
+        return judges,(A_weight,B_weight,no_weight)
+
+    def condition_judges(self,A_weight:np.ndarray,B_weight:np.ndarray,lo:int = 0,hi:Optional[int] = None)->np.ndarray:
+        """Judge code of every condition (1 for S1, 2 for S2, 4 for S4) in the same way as _Judge.make_a_judge.
+
+        Args:
+            A_weight (np.ndarray): A_weight of every condition
+            B_weight (np.ndarray): B_weight of every condition
+            lo (int, optional): the weights are those of the vertices at positions lo:hi (see condition_weights). Defaults to 0.
+            hi (Optional[int], optional): see lo. Defaults to None.
+
+        Returns:
+            np.ndarray: judge codes
+        """
+        lo,hi,c0,c1 = self._vertex_range(lo,hi)
+        cond_sign = self.cond_sign[c0:c1]
+
+        # '+' sees B_weight (acc), '-' sees A_weight (rej).
+        value = np.where(cond_sign,B_weight,A_weight)
+        below_lo = value < self.cond_lo[c0:c1]
+        below_hi = value < self.cond_hi[c0:c1]
+
+        plus = np.where(below_lo,2,np.where(below_hi,4,1))
+        minus = np.where(below_lo,1,np.where(below_hi,4,2))
+
+        return np.where(cond_sign,plus,minus).astype(np.int8)
+
+    def fold_judges(self,judges:np.ndarray,lo:int = 0,hi:Optional[int] = None)->np.ndarray:
+        """Add up the judges of the conditions of every vertex in order, starting from S8.
+
+        Args:
+            judges (np.ndarray): judge codes of every condition
+            lo (int, optional): the judges are those of the vertices at positions lo:hi (see condition_weights). Defaults to 0.
+            hi (Optional[int], optional): see lo. Defaults to None.
+
+        Returns:
+            np.ndarray: the judge code of every vertex
+        """
+        lo,hi,c0,c1 = self._vertex_range(lo,hi)
+
+        if len(judges) == 0:
+            return np.full(hi-lo,8,dtype=np.int8)
+
+        # pad with S8, the unit of the addition.
+        cond_node = self.cond_node[c0:c1]
+        position = np.arange(c0,c1) - self.cond_ptr[cond_node]
+        padded = np.full((hi-lo,int(position.max())+1),8,dtype=np.int8)
+        padded[cond_node-lo,position] = judges
+
+        overall = reduce_judge_array(padded,self.skew_code[lo:hi])
+
+        return overall
+
+    def predict_range(self,lo:int = 0,hi:Optional[int] = None,with_weights:bool = False)->tuple[np.ndarray,Optional[tuple]]:
+        """condition_weights, condition_judges and fold_judges for the vertices at positions lo:hi.
+
+        Returns:
+            tuple[np.ndarray,Optional[tuple]]: the overall judge code of each vertex, and (A_weight,B_weight,no_weight,judges) of each condition if with_weights.
+        """
+        if self.exact:
+            judges,weights = self.exact_condition_judges(lo,hi,with_weights)
+            overall = self.fold_judges(judges,lo,hi)
+
+            return overall,((*weights,judges) if with_weights else None)
+
+        A_weight,B_weight,no_weight = self.condition_weights(lo,hi)
+        judges = self.condition_judges(A_weight,B_weight,lo,hi)
+        overall = self.fold_judges(judges,lo,hi)
+
+        return overall,((A_weight,B_weight,no_weight,judges) if with_weights else None)
+
+    def _scenario_incidence(self)->dict:
+        """
+        The predecessors in Au and Bu for predict_scenarios, found once for the fixed labels.
+        'vertex_A' ('vertex_B') is (sources,ptr): the vertices in Au (Bu) of the simple conditions of vertex i are sources[ptr[i]:ptr[i+1]].
+        'cond_A' ('cond_B') is the same for each extended condition. 'count_A' and 'count_B' are |Au| and |Bu| of each condition.
+        """
+        if hasattr(self,'_incidence'):
+            return self._incidence
+
+        n = self.num_vertex
+        num_cond = len(self.cond_node)
+
+        def csr(group:np.ndarray,source:np.ndarray,keep:np.ndarray,length:int)->tuple[np.ndarray,np.ndarray]:
+            # group is sorted.
+            ptr = np.zeros(length+1,dtype=np.int64)
+            ptr[1:] = np.cumsum(np.bincount(group[keep],minlength=length))
+            return source[keep],ptr
+
+        # Au : label_list[0] and attack, or label_list[1] and support. Bu : the opposite.
+        label = self.label_code[self.in_src]
+        attack = self.in_attack
+        in_A = ((label == 0) & attack) | ((label == 1) & ~attack)
+        in_B = ((label == 1) & attack) | ((label == 0) & ~attack)
+
+        head = self.cond_node[self.member_cond]
+        has_attack = self._has_edge(head,self.member_src,True)
+        has_support = self._has_edge(head,self.member_src,False)
+        label = self.label_code[self.member_src]
+        member_A = ((label == 0) & has_attack) | ((label == 1) & has_support)
+        member_B = ((label == 1) & has_attack) | ((label == 0) & has_support)
+
+        count_A,count_B,_,_ = self._condition_sums(self.weight,0,None)
+
+        self._incidence = {
+            'vertex_A' : csr(self.in_dst,self.in_src,in_A,n),
+            'vertex_B' : csr(self.in_dst,self.in_src,in_B,n),
+            'cond_A' : csr(self.member_cond,self.member_src,member_A,num_cond),
+            'cond_B' : csr(self.member_cond,self.member_src,member_B,num_cond),
+            'count_A' : count_A,
+            'count_B' : count_B,
+        }
+
+        return self._incidence
+
+    def scenario_codes(self,weights:np.ndarray)->np.ndarray:
+        """The overall judge codes of all the vertices for each row of weights, with the labels of the arrays.
+
+        Args:
+            weights (np.ndarray): (scenarios, vertices) array of the weights, float64 or object (int and Fraction, if self.exact)
+
+        Returns:
+            np.ndarray: (scenarios, vertices) array of the codes of the overall judges
+        """
+        incidence = self._scenario_incidence()
+        num_scenario = len(weights)
+        n = self.num_vertex
+        subset = self.cond_has_subset
+
+        sum_A = _segment_row_sums(weights,*incidence['vertex_A'])[:,self.cond_node]
+        sum_B = _segment_row_sums(weights,*incidence['vertex_B'])[:,self.cond_node]
+        if subset.any():
+            sum_A[:,subset] = _segment_row_sums(weights,*incidence['cond_A'])[:,subset]
+            sum_B[:,subset] = _segment_row_sums(weights,*incidence['cond_B'])[:,subset]
+        num = incidence['count_A'] + incidence['count_B']
+
+        if self.exact:
+            judge = np.vectorize(_exact_judge_code,otypes=[np.int8])
+            judges = judge(self.cond_sign,self.exact_lo,self.exact_hi,sum_A,sum_B,num.astype(np.int64).astype(object))
+        else:
+            # the same as condition_weights and condition_judges, for each scenario.
+            all_weight = sum_A + sum_B
+            no_weight = all_weight == 0
+
+            with np.errstate(divide='ignore',invalid='ignore'):
+                average_weight = all_weight / num
+                A_weight = np.where(no_weight,0.0,sum_A / average_weight)
+                B_weight = np.where(no_weight,0.0,sum_B / average_weight)
+
+            judges = self.condition_judges(A_weight,B_weight)
+
+        # fold_judges for each scenario.
+        if len(self.cond_node) == 0:
+            return np.full((num_scenario,n),8,dtype=np.int8)
+
+        position = np.arange(len(self.cond_node)) - self.cond_ptr[self.cond_node]
+        padded = np.full((num_scenario,n,int(position.max())+1),8,dtype=np.int8)
+        padded[:,self.cond_node,position] = judges
+
+        overall = reduce_judge_array(padded.reshape(num_scenario * n,-1),np.tile(self.skew_code,num_scenario))
+
+        return overall.reshape(num_scenario,n)
+
+    def snapshot(self)->_ModelArrays:
+        """A copy sharing the arrays, without the vertices themselves (nodes,index) and the python lists, to be sent to worker processes."""
+        res = copy.copy(self)
+        res.nodes = None
+        res.index = None
+        for name in ('_pred_lists','_cond_lists','_weight_list','_skew_types','_incidence'):
+            res.__dict__.pop(name,None)
+
+        return res
+
+
+# _ModelArrays.snapshot of the model being predicted, in each worker process of MAModel.predict_all.
+_worker_arrays : Optional[_ModelArrays] = None
+
+
+def _init_prediction_worker(arrays:_ModelArrays):
+    """Initializer of the worker processes of MAModel.predict_all. The snapshot is received once per process."""
+    global _worker_arrays
+    _worker_arrays = arrays
+
+    return
+
+
+def _predict_shard(shard:tuple[int,int,bool])->tuple[np.ndarray,Optional[tuple]]:
+    """_ModelArrays.predict_range(*shard) (lo,hi,with_weights) in a worker process."""
+    return _worker_arrays.predict_range(*shard)
+
+
+def _segment_sum(index:np.ndarray,values:np.ndarray,length:int)->np.ndarray:
+    """np.bincount(index,weights=values,minlength=length), which also works for object arrays (int and Fraction)."""
+    if values.dtype != object:
+        return np.bincount(index,weights=values,minlength=length)
+
+    res = np.zeros(length,dtype=object)
+    np.add.at(res,index,values)
+
+    return res
+
+
+def _segment_row_sums(values:np.ndarray,sources:np.ndarray,ptr:np.ndarray)->np.ndarray:
+    """
+    For each row of values, the sums of values[:,sources[ptr[k]:ptr[k+1]]] (0 for an empty segment).
+
+    Args:
+        values (np.ndarray): (rows, vertices) array, float64 or object
+        sources (np.ndarray): positions of the vertices of the segments
+        ptr (np.ndarray): bounds of the segments
+
+    Returns:
+        np.ndarray: (rows, segments) array of the sums
+    """
+    res = np.zeros((len(values),len(ptr)-1),dtype=values.dtype)
+
+    start = ptr[:-1]
+    length = ptr[1:] - start
+    if len(sources) == 0:
+        return res
+
+    # added one by one from the left, like _segment_sum, so that the float sums are the same as those of predict_all.
+    # (np.add.reduceat adds in a different order.)
+    for j in range(int(length.max())):
+        segments = np.flatnonzero(length > j)
+        res[:,segments] += values[:,sources[start[segments]+j]]
+
+    return res
+
+
+# label codes allowed by each judge code.
+_JUDGE_TO_LABEL_CODES = (
+    frozenset(),            # undefined
+    frozenset([0]),         # S1
+    frozenset([1]),         # S2
+    frozenset([2]),         # S3
+    frozenset([0,1]),       # S4
+    frozenset([0,2]),       # S5
+    frozenset([1,2]),       # S6
+    frozenset([0,1,2]),     # S7
+    frozenset(),            # S8
+)
+
+
+class _LabelDynamics:
+    """
+    Engine of MAModel.run_dynamics.
+
+    The frontier of a step is the set of the vertices whose predecessors changed since they were evaluated, so the vertices outside it are stable.
+    Then the labels after a step depend only on the labels before it, in both modes (an async sweep is the same as a sweep over all the vertices in order),
+    and the run is in a cycle as soon as the labels at the end of a step repeat.
+    The labels are hashed incrementally (XOR of hash((vertex,label))) to find a repetition in O(1), and a hit is confirmed by replaying the changes since then,
+    so a hash collision never reports a wrong cycle.
+
+    Attributes:
+        ma_model(MAModel): model
+        mode(str): 'sync' or 'async'.
+        nodes(list): vertices in the order of a sweep.
+        rank(dict): vertex -> position in nodes.
+        state_hash(int): hash of the current labels.
+        seen(dict): hash -> steps ending with the labels of the hash.
+    """
+
+    def __init__(self,ma_model:MAModel,mode:str,order:Optional[list]):
+        """
+        Args:
+            ma_model (MAModel): model
+            mode (str): 'sync' or 'async'
+            order (Optional[list]): order of a sweep. None for the order of graph.nodes.
+
+        Raises:
+            ValueError: Raised when order is not an ordering of the vertices.
+        """
+        G = ma_model.graph
+
+        self.ma_model = ma_model
+        self.mode = mode
+        self.nodes = list(G.nodes) if order is None else list(order)
+        self.rank = {node:i for i,node in enumerate(self.nodes)}
+
+        if len(self.rank) != len(self.nodes) or len(self.nodes) != G.number_of_nodes() or any(node not in G for node in self.nodes):
+            raise ValueError("order must contain every vertex exactly once")
+
+        self.state_hash = 0
+        for node,label in G.nodes(data='label'):
+            self.state_hash ^= hash((node,label))
+
+        self.seen = {self.state_hash:[0]}
+
+        return
+
+    def run(self,max_steps:int,frontier:Optional[typing.Iterable])->DynamicsResult:
+        """Run the steps.
+
+        Args:
+            max_steps (int): maximum number of steps
+            frontier (Optional[typing.Iterable]): vertices of the first step. None for all the vertices.
+
+        Returns:
+            DynamicsResult: statistics
+        """
+        start = time.perf_counter()
+        result = DynamicsResult(self.mode)
+        step = self._step_sync if self.mode == 'sync' else self._step_async
+
+        worklist = set(self.nodes) if frontier is None else set(frontier)
+
+        while result.steps < max_steps:
+            if not worklist:
+                result.converged = True
+                break
+
+            result.frontier_sizes.append(len(worklist))
+            result.evaluations += len(worklist)
+
+            changed,worklist = step(worklist)
+
+            result.steps += 1
+            result.history.append(changed)
+            result.changed_sizes.append(len(changed))
+            result.changes += len(changed)
+
+            if not changed:
+                continue
+
+            cycle_start = self._find_repetition(result)
+            if cycle_start is not None:
+                result.cycle_start = cycle_start
+                result.cycle_length = result.steps - cycle_start
+                break
+
+        # the last step may have emptied the worklist.
+        if not worklist:
+            result.converged = True
+
+        result.seconds = time.perf_counter() - start
+
+        return result
+
+    def _next_label(self,u:Any)->Any:
+        """The label u takes: its label if it is predicted (or nothing is predicted), otherwise the first predicted label."""
+        label = self.ma_model.graph.nodes[u]['label']
+        predicted = self.ma_model.get_predicted_labels(u)
+
+        if not predicted or label in predicted:
+            return label
+
+        return predicted[0]
+
+    def _set_label(self,u:Any,old:Any,new:Any):
+        """set_label keeping the hash of the labels."""
+        self.ma_model.set_label(u,new)
+        self.state_hash ^= hash((u,old)) ^ hash((u,new))
+
+        return
+
+    def _step_sync(self,worklist:set)->tuple[list[tuple],set]:
+        """Update the vertices of worklist from the current labels.
+
+        Returns:
+            tuple[list[tuple],set]: (vertex,old label,new label) of the changes, and the worklist of the next step.
+        """
+        G = self.ma_model.graph
+        rank = self.rank
+
+        changed = []
+        for u in sorted(worklist,key=rank.__getitem__):
+            old = G.nodes[u]['label']
+            new = self._next_label(u)
+            if new != old:
+                changed.append((u,old,new))
+
+        # every vertex is evaluated before any label is changed.
+        next_worklist = set()
+        for u,old,new in changed:
+            self._set_label(u,old,new)
+            next_worklist.update(G.successors(u))
+
+        return changed,next_worklist
+
+    def _step_async(self,worklist:set)->tuple[list[tuple],set]:
+        """Sweep the vertices of worklist in order, changing the labels at once.
+        The successors of a changed vertex are evaluated in the same sweep if they come after it, otherwise in the next one.
+
+        Returns:
+            tuple[list[tuple],set]: (vertex,old label,new label) of the changes, and the worklist of the next step.
+        """
+        G = self.ma_model.graph
+        nodes = self.nodes
+        rank = self.rank
+
+        heap = [rank[u] for u in worklist]
+        heapq.heapify(heap)
+        queued = set(heap)
+
+        changed = []
+        next_worklist = set()
+        while heap:
+            r = heapq.heappop(heap)
+            u = nodes[r]
+
+            old = G.nodes[u]['label']
+            new = self._next_label(u)
+            if new == old:
+                continue
+
+            changed.append((u,old,new))
+            self._set_label(u,old,new)
+
+            for v in G.successors(u):
+                if rank[v] > r:
+                    if rank[v] not in queued:
+                        queued.add(rank[v])
+                        heapq.heappush(heap,rank[v])
+                else:
+                    next_worklist.add(v)
+
+        return changed,next_worklist
+
+    def _find_repetition(self,result:DynamicsResult)->Optional[int]:
+        """Record the labels after the last step and find the earlier step ending with the same labels.
+
+        Returns:
+            Optional[int]: the earlier step, None if the labels are new.
+        """
+        steps = self.seen.setdefault(self.state_hash,[])
+
+        for s in steps:
+            if self._same_labels_since(result.history,s):
+                return s
+
+        steps.append(result.steps)
+
+        return None
+
+    def _same_labels_since(self,history:list[list[tuple]],s:int)->bool:
+        """Whether the changes after step s cancel out."""
+        net = {}
+        for changed in history[s:]:
+            for u,old,new in changed:
+                if u in net:
+                    net[u][1] = new
+                else:
+                    net[u] = [old,new]
+
+        return all(old == new for old,new in net.values())
+
+
+class _LabelingSearch:
+    """
+    Search of the consistent labelings used by MAModel.enumerate_consistent_labelings.
+
+    Attributes:
+        arrays(_ModelArrays): array representation of the model.
+        label_list(list): label_list of the graph.
+        labels(list[int]): label code of each vertex under search. -1 if not labeled yet.
+        sccs(list[list[int]]): vertices of each SCC in topological order of the condensation.
+        boundary(list[list[int]]): vertices outside each SCC which have an edge into it.
+        boundary_levels(list[frozenset]): positions in sccs of the SCCs of the boundary.
+        cache(dict): (position of SCC, labels of its boundary) -> all the labelings of the SCC.
+        predicted_cache(dict): (vertex, labels of its predecessors) -> predicted label codes.
+    """
+
+    # The labelings of an SCC are cached for each labeling of its boundary unless there are more than this.
+    MAX_CACHED_SOLUTIONS = 10000
+
+    # A constraint is not revised while its predecessors have more combinations of candidates than this.
+    MAX_COMBINATIONS = 3 ** 6
+
+    def __init__(self,ma_model:MAModel):
+        """Decompose the model into SCCs.
+
+        Args:
+            ma_model (MAModel): model
+        """
+        G,_ = ma_model.attach_scc_id()
+
+        self.arrays = _ModelArrays(ma_model)
+        self.arrays._build_lists()
+        self.label_list = G.graph['label_list']
+
+        arrays = self.arrays
+        n = arrays.num_vertex
+        scc_of = [G.nodes[node]['scc_id'] for node in arrays.nodes]
+
+        self.preds = [sorted(set(v for v,_ in arrays._pred_lists[i])) for i in range(n)]
+        self.succs = [[] for _ in range(n)]
+        for i in range(n):
+            for v in self.preds[i]:
+                self.succs[v].append(i)
+
+        # topological order of the condensation
+        dependency = {scc_id:set() for scc_id in scc_of}
+        members = {scc_id:[] for scc_id in scc_of}
+        for i in range(n):
+            members[scc_of[i]].append(i)
+            for v in self.preds[i]:
+                if scc_of[v] != scc_of[i]:
+                    dependency[scc_of[i]].add(scc_of[v])
+
+        order = list(graphlib.TopologicalSorter(dependency).static_order())
+        level = {scc_id:k for k,scc_id in enumerate(order)}
+
+        self.sccs = [members[scc_id] for scc_id in order]
+        self.boundary = []
+        self.boundary_levels = []
+        for scc_id in order:
+            outside = sorted(set(v for i in members[scc_id] for v in self.preds[i] if scc_of[v] != scc_id))
+            self.boundary.append(outside)
+            self.boundary_levels.append(frozenset(level[scc_of[v]] for v in outside))
+
+        self.labels = [-1] * n
+        self.cache = {}
+        self.predicted_cache = {}
+        self._scratch = [-1] * n
+
+        return
+
+    def run(self)->typing.Iterator[dict]:
+        """Enumerate the consistent labelings: the SCCs are labeled in every consistent way, in order.
+        The search keeps a frame for each SCC labeled so far on an explicit stack (not recursion), so the number of SCCs is not limited.
+        Backjumping: when nothing is found below an SCC, the positions of the SCCs responsible for it are passed up,
+        and the SCCs whose labels are not responsible skip their remaining candidates.
+
+        Yields:
+            dict: {vertex : label}
+        """
+        sccs = self.sccs
+        labels = self.labels
+        nodes = self.arrays.nodes
+
+        if not sccs:
+            yield {}
+            return
+
+        # frames[k] : [labelings of the k-th SCC left to try, whether a labeling was found below, positions of the SCCs responsible for the failures below]
+        frames = [[self._scc_solutions(0),False,set()]]
+
+        while frames:
+            k = len(frames) - 1
+            frame = frames[-1]
+            solution = next(frame[0],None)
+
+            if solution is not None:
+                for i,code in zip(sccs[k],solution):
+                    labels[i] = code
+
+                if k + 1 == len(sccs):
+                    yield {nodes[i]:self.label_list[code] for i,code in enumerate(labels)}
+                    frame[1] = True
+                else:
+                    frames.append([self._scc_solutions(k+1),False,set()])
+                continue
+
+            # the k-th SCC has no labeling left: None if a labeling was found, otherwise the SCCs responsible for the failure.
+            frames.pop()
+            for i in sccs[k]:
+                labels[i] = -1
+            res = None if frame[1] else frozenset(frame[2] | self.boundary_levels[k])
+
+            # the SCCs whose labels are not responsible for the failure are skipped.
+            while frames and res is not None and len(frames) - 1 not in res:
+                frames.pop()
+                for i in sccs[len(frames)]:
+                    labels[i] = -1
+
+            if frames:
+                if res is None:
+                    frames[-1][1] = True
+                else:
+                    frames[-1][2] |= res - {len(frames) - 1}
+
+        return
+
+    def _scc_solutions(self,k:int)->typing.Iterator[tuple]:
+        """All the labelings of the k-th SCC consistent with the current labels of its boundary.
+
+        Args:
+            k (int): position in self.sccs
+
+        Yields:
+            tuple: label codes of the vertices of the SCC.
+        """
+        key = (k,tuple(self.labels[v] for v in self.boundary[k]))
+
+        if key in self.cache:
+            yield from self.cache[key]
+            return
+
+        record = []
+        for solution in self._search_scc(self.sccs[k]):
+            if record is not None:
+                record.append(solution)
+                if len(record) > self.MAX_CACHED_SOLUTIONS:
+                    record = None
+            yield solution
+
+        if record is not None:
+            self.cache[key] = record
+
+        return
+
+    def _predicted(self,i:int,pred_labels:tuple)->frozenset:
+        """Label codes predicted for vertex i when its predecessors (self.preds[i]) have pred_labels. Cached.
+
+        Args:
+            i (int): position of the vertex
+            pred_labels (tuple): label codes of self.preds[i]
+
+        Returns:
+            frozenset: predicted label codes
+        """
+        key = (i,pred_labels)
+
+        if key not in self.predicted_cache:
+            scratch = self._scratch
+            for v,code in zip(self.preds[i],pred_labels):
+                scratch[v] = code
+            self.predicted_cache[key] = _JUDGE_TO_LABEL_CODES[self.arrays.predict_code(i,scratch)]
+            for v in self.preds[i]:
+                scratch[v] = -1
+
+        return self.predicted_cache[key]
+
+    def _search_scc(self,scc:list[int])->typing.Iterator[tuple]:
+        """Backtracking in an SCC. The vertices outside the SCC which have an edge into it must be labeled.
+
+        Each vertex w gives the constraint "the label of w is in the labels predicted from the labels of its predecessors".
+        The candidates of the vertices are kept arc consistent with these constraints (a candidate is removed
+        when no combination of the candidates of the other vertices of the constraint supports it),
+        which is checked by enumerating the combinations of the candidates of the predecessors when there are not too many of them.
+
+        Args:
+            scc (list[int]): vertices of the SCC
+
+        Yields:
+            tuple: label codes of the vertices of the SCC.
+        """
+        labels = self.labels
+        in_scc = set(scc)
+        succs = {i:[w for w in self.succs[i] if w in in_scc] for i in scc}
+        domain = {i:frozenset(range(3)) for i in scc}
+
+        def candidates(v:int)->frozenset:
+            if v in in_scc:
+                return domain[v]
+            return frozenset([labels[v]])
+
+        def revise(w:int)->Optional[list]:
+            """Supported candidates of the vertices of the constraint of w.
+            Returns None if the constraint can't be satisfied, otherwise the list of (vertex, narrowed candidates).
+            """
+            preds = self.preds[w]
+            pred_candidates = [sorted(candidates(v)) for v in preds]
+
+            num_combinations = 1
+            for c in pred_candidates:
+                num_combinations *= len(c)
+            if num_combinations > self.MAX_COMBINATIONS:
+                return []
+
+            self_loop = w in in_scc and w in preds
+            supports = [set() for _ in preds]
+            support_w = set()
+
+            for combination in itertools.product(*pred_candidates):
+                predicted = self._predicted(w,combination)
+
+                if self_loop:
+                    allowed = predicted & {combination[preds.index(w)]}
+                else:
+                    allowed = predicted & domain[w]
+
+                if allowed:
+                    for k,code in enumerate(combination):
+                        supports[k].add(code)
+                    support_w |= allowed
+
+            if not support_w:
+                return None
+
+            narrowed = []
+            for v,support in zip(preds,supports):
+                if v in in_scc and v != w and len(support) < len(domain[v]):
+                    narrowed.append((v,frozenset(support)))
+            if len(support_w) < len(domain[w]):
+                narrowed.append((w,frozenset(support_w)))
+
+            return narrowed
+
+        def propagate(queue:set,trail:list)->bool:
+            """Revise the constraints until nothing changes. Returns False if a constraint can't be satisfied.
+            """
+            while queue:
+                w = queue.pop()
+                narrowed = revise(w)
+
+                if narrowed is None:
+                    return False
+
+                for v,new_domain in narrowed:
+                    trail.append((v,domain[v]))
+                    domain[v] = new_domain
+                    # the constraints including v
+                    queue.add(v)
+                    queue.update(succs[v])
+
+            return True
+
+        def undo(trail:list):
+            for v,old in reversed(trail):
+                domain[v] = old
+            return
+
+        def backtrack():
+            """Decide the vertices one by one. The decided vertices are on an explicit stack (not recursion), so the size of the SCC is not limited."""
+            # [vertex, its candidates left to try, trail of the candidate being tried]
+            stack = []
+            descend = True
+
+            while True:
+                if descend:
+                    undecided = [v for v in scc if len(domain[v]) > 1]
+
+                    if not undecided:
+                        yield tuple(next(iter(domain[i])) for i in scc)
+                    else:
+                        # the vertex with the fewest candidates. Among them, the one appearing in more constraints.
+                        i = min(undecided,key=lambda v:(len(domain[v]),-len(succs[v])))
+                        stack.append([i,iter(sorted(domain[i])),None])
+
+                # the next candidate of the last vertex with candidates left.
+                descend = False
+                while stack and not descend:
+                    frame = stack[-1]
+                    i = frame[0]
+                    if frame[2] is not None:
+                        undo(frame[2])
+                        frame[2] = None
+
+                    for code in frame[1]:
+                        trail = [(i,domain[i])]
+                        domain[i] = frozenset([code])
+
+                        if propagate({i,*succs[i]},trail):
+                            frame[2] = trail
+                            descend = True
+                            break
+
+                        undo(trail)
+                    else:
+                        stack.pop()
+
+                if not descend:
+                    return
+
+        trail = []
+        if not propagate(set(scc),trail):
+            undo(trail)
+            return
+
+        yield from backtrack()
+
+        undo(trail)
+
+        return
+
+def _strongly_connected_components(num_vertex:int,tail:np.ndarray,head:np.ndarray)->np.ndarray:
+    """Strongly connected components of a graph given by edge arrays (iterative Tarjan's algorithm).
+
+    Args:
+        num_vertex (int): number of vertices
+        tail (np.ndarray): tails of the edges
+        head (np.ndarray): heads of the edges
+
+    Returns:
+        np.ndarray: index of the component of each vertex (0,1,2,...)
+    """
+    order = np.argsort(tail,kind='stable')
+    out_ptr = np.zeros(num_vertex+1,dtype=np.int64)
+    out_ptr[1:] = np.cumsum(np.bincount(tail,minlength=num_vertex))
+    out_ptr = out_ptr.tolist()
+    out_dst = head[order].tolist()
+
+    index = [-1] * num_vertex
+    lowlink = [0] * num_vertex
+    on_stack = [False] * num_vertex
+    component = [-1] * num_vertex
+    stack = []
+    counter = 0
+    num_component = 0
+
+    for root in range(num_vertex):
+        if index[root] != -1:
+            continue
+
+        # (vertex, position of the next edge to see)
+        work = [(root,out_ptr[root])]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+
+        while work:
+            v,e = work[-1]
+
+            if e < out_ptr[v+1]:
+                work[-1] = (v,e+1)
+                w = out_dst[e]
+                if index[w] == -1:
+                    index[w] = lowlink[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w,out_ptr[w]))
+                elif on_stack[w]:
+                    lowlink[v] = min(lowlink[v],index[w])
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent],lowlink[v])
+
+            if lowlink[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component[w] = num_component
+                    if w == v:
+                        break
+                num_component += 1
+
+    return np.array(component,dtype=np.int64)
+
+
+class CompactMAModel():
+    """MA model held in numpy arrays instead of networkx attribute dicts.
+    This uses much less memory than MAModel for large models. Prediction, SCC and I/O work on the arrays directly,
+    and the model is converted to MAModel (networkx) only when needed, e.g. for visualize.
+    Vertices are referred to by their position in self.nodes in all the arrays.
+
+    Attributes:
+        label_list(list): the same as graph.graph['label_list'] of MAModel.
+        nodes(np.ndarray): vertices (integers).
+        label_code(np.ndarray): int8, position of the label of each vertex in label_list.
+        skew_code(np.ndarray): int8, 0 for neutral, 1 for L1, 2 for L2.
+        weight(np.ndarray): float64, weight of each vertex.
+        integer_weights(bool): whether the weights are integers (they are restored as int).
+        edge_src,edge_dst(np.ndarray): int32, tail and head of each edge.
+        edge_attack(np.ndarray): bool, True for attack, False for support.
+        cond_ptr(np.ndarray): the conditions of vertex i are cond_ptr[i]:cond_ptr[i+1] of cond_*.
+        cond_sign(np.ndarray): bool, True for '+'.
+        cond_lo,cond_hi(np.ndarray): float64, bounds of the conditions.
+        integer_bounds(bool): whether the bounds are integers (they are restored as int).
+        cond_has_subset(np.ndarray): bool, whether the condition is an extended one.
+        subset_ptr(np.ndarray): the subset of condition c is subset_members[subset_ptr[c]:subset_ptr[c+1]].
+        subset_members(np.ndarray): int32, vertices of the subsets.
+        opinions(dict): position -> opinion of the vertices having one.
+        scc_id(np.ndarray): int32, scc_id of each vertex after attach_scc_id. None before.
+        predicted_code(np.ndarray): int8, code of the overall judge (1 for S1, ..., 8 for S8) of each vertex after predict_all. None before.
+    """
+
+    def __init__(self):
+
+        self.label_list : list = []
+        self.nodes = np.zeros(0,dtype=np.int64)
+        self.label_code = np.zeros(0,dtype=np.int8)
+        self.skew_code = np.zeros(0,dtype=np.int8)
+        self.weight = np.zeros(0,dtype=np.float64)
+        self.integer_weights = True
+        self.edge_src = np.zeros(0,dtype=np.int32)
+        self.edge_dst = np.zeros(0,dtype=np.int32)
+        self.edge_attack = np.zeros(0,dtype=bool)
+        self.cond_ptr = np.zeros(1,dtype=np.int64)
+        self.cond_sign = np.zeros(0,dtype=bool)
+        self.cond_lo = np.zeros(0,dtype=np.float64)
+        self.cond_hi = np.zeros(0,dtype=np.float64)
+        self.integer_bounds = True
+        self.cond_has_subset = np.zeros(0,dtype=bool)
+        self.subset_ptr = np.zeros(1,dtype=np.int64)
+        self.subset_members = np.zeros(0,dtype=np.int32)
+        self.opinions : dict = {}
+
+        self.scc_id : Optional[np.ndarray] = None
+        self.predicted_code : Optional[np.ndarray] = None
+        self._condition_weights : Optional[tuple] = None
+        self._condition_judges : Optional[np.ndarray] = None
+
+        return
+
+    @classmethod
+    def from_model(cls,ma_model:MAModel)->CompactMAModel:
+        """
+        Convert MAModel to CompactMAModel. The vertices must be integers.
+
+        Args:
+            ma_model (MAModel): model
+
+        Returns:
+            CompactMAModel: converted model
+        """
+        G = ma_model.graph
+        nodes = list(G.nodes)
+        index = {node:i for i,node in enumerate(nodes)}
+
+        edges = list(G.edges(data="attack"))
+        conditions = [c for node in nodes for c in G.nodes[node]["conditions"]]
+
+        self = cls()
+        self._set_arrays(
+            label_list=G.graph["label_list"],
+            nodes=nodes,
+            labels=[G.nodes[node]["label"] for node in nodes],
+            skew_types=[G.nodes[node]["skew_type"] for node in nodes],
+            weights=[G.nodes[node]["weight"] for node in nodes],
+            edge_src=[index[u] for u,_,_ in edges],
+            edge_dst=[index[v] for _,v,_ in edges],
+            edge_attack=[bool(c) for _,_,c in edges],
+            num_conditions=[len(G.nodes[node]["conditions"]) for node in nodes],
+            conditions=conditions,
+            index=index,
+        )
+        self.opinions = {index[node]:G.nodes[node]["opinion"] for node in nodes if "opinion" in G.nodes[node]}
+
+        return self
+
+    def _set_arrays(self,label_list:list,nodes:list,labels:list,skew_types:list,weights:list,
+                    edge_src:list,edge_dst:list,edge_attack:list,num_conditions:list,conditions:list,index:dict):
+        """Set the arrays from python lists.
+
+        Args:
+            label_list (list): label_list
+            nodes (list): vertices
+            labels (list): label of each vertex
+            skew_types (list): skew_type of each vertex
+            weights (list): weight of each vertex
+            edge_src (list): position of the tail of each edge
+            edge_dst (list): position of the head of each edge
+            edge_attack (list): attack of each edge
+            num_conditions (list): number of conditions of each vertex
+            conditions (list): conditions of all the vertices in order
+            index (dict): vertex -> position. Vertices in the subsets which are not in the graph are dropped.
+        """
+        label_to_code = {label:i for i,label in enumerate(label_list)}
+
+        self.label_list = list(label_list)
+        self.nodes = np.array(nodes,dtype=np.int64)
+        self.label_code = np.array([label_to_code[label] for label in labels],dtype=np.int8)
+        self.skew_code = np.array([_SKEW_CODES[skew_type] for skew_type in skew_types],dtype=np.int8)
+        self.weight = np.array(weights,dtype=np.float64)
+        self.integer_weights = all(isinstance(w,int) for w in weights)
+
+        self.edge_src = np.array(edge_src,dtype=np.int32)
+        self.edge_dst = np.array(edge_dst,dtype=np.int32)
+        self.edge_attack = np.array(edge_attack,dtype=bool)
+
+        self.cond_ptr = np.zeros(len(nodes)+1,dtype=np.int64)
+        self.cond_ptr[1:] = np.cumsum(num_conditions)
+        self.cond_sign = np.array([c[0] == '+' for c in conditions],dtype=bool)
+        self.cond_lo = np.array([c[1] for c in conditions],dtype=np.float64)
+        self.cond_hi = np.array([c[2] for c in conditions],dtype=np.float64)
+        self.integer_bounds = all(isinstance(c[1],int) and isinstance(c[2],int) for c in conditions)
+        self.cond_has_subset = np.array([len(c) == 4 for c in conditions],dtype=bool)
+
+        subsets = [[index[v] for v in c[3] if v in index] if len(c) == 4 else [] for c in conditions]
+        self.subset_ptr = np.zeros(len(conditions)+1,dtype=np.int64)
+        self.subset_ptr[1:] = np.cumsum([len(subset) for subset in subsets])
+        self.subset_members = np.fromiter(itertools.chain.from_iterable(subsets),dtype=np.int32,count=int(self.subset_ptr[-1]))
+
+        self.scc_id = None
+        self.predicted_code = None
+        self._condition_weights = None
+        self._condition_judges = None
+
+        return
+
+    def read_yaml(self,path:str) -> None:
+        """
+        Read the .yml file (the same format as MAModel.read_yaml) without building a networkx graph.
+
+        Args:
+            path (str): the path to the .yml file
+
+        """
+        with open(path,'r') as f:
+            try:
+                ymlinfo = yaml.load(f,Loader=_YAML_LOADER)
+            except yaml.constructor.ConstructorError:
+                f.seek(0)
+                ymlinfo = yaml.full_load(f)
+
+        attr_node = ymlinfo["attr_node"]
+        edgeinfo = ymlinfo["edges"]
+
+        # vertices appearing only in the edges come after the listed ones.
+        node_order = dict.fromkeys(ymlinfo["nodes"])
+        for u,v,_ in edgeinfo:
+            node_order.setdefault(u)
+            node_order.setdefault(v)
+        nodes = list(node_order)
+        index = {node:i for i,node in enumerate(nodes)}
+
+        if "weights" not in attr_node:
+            print("Warning: weight is not specified in the model. weight is set to 1.",file=sys.stderr)
+            weights = [1] * len(nodes)
         else:
-            if A_weight < condition[1]:
-                self.judge = 'S1'
-            elif A_weight < condition[2]:
-                self.judge = 'S4'
-            else:
-                self.judge = 'S2'
-                
-        G.nodes[u]['judges'].append(f'A:{A_weight},B:{B_weight},{self.judge}')
+            weights = [attr_node['weights'][node] for node in nodes]
+
+        node_conditions = [attr_node['conditions'][node] for node in nodes]
+
+        self._set_arrays(
+            label_list=ymlinfo["attr_graph"]["label_list"],
+            nodes=nodes,
+            labels=[attr_node['label'][node] for node in nodes],
+            skew_types=[attr_node['skew_type'][node] for node in nodes],
+            weights=weights,
+            edge_src=[index[u] for u,_,_ in edgeinfo],
+            edge_dst=[index[v] for _,v,_ in edgeinfo],
+            edge_attack=[bool(a) for _,_,a in edgeinfo],
+            num_conditions=[len(conditions) for conditions in node_conditions],
+            conditions=[c for conditions in node_conditions for c in conditions],
+            index=index,
+        )
+
+        opinions = attr_node.get('opinion',{})
+        self.opinions = {index[node]:opinions[node] for node in nodes if node in opinions}
 
         return
-    
-    def __add__(self,other):
-        """        
-        Add up the decisions for each vertex.
-        Note that it depends on skew_type.
+
+    def save_yaml(self,path:str = "output.yml"):
+        """
+        save the model in .yml format (the same format as MAModel.save_yaml).
 
         Args:
-            other (_Judge): The other party of the addition.
+            path (str, optional): path to the new .yml file. Defaults to "output.yml".
 
-        Raises:
-            NotImplementedError: Raised when not implemented.
+        """
+        nodes = self.nodes.tolist()
+        labels = self.label_code.tolist()
+        weights = self._weights()
+        conditions = self._conditions()
+        cond_ptr = self.cond_ptr.tolist()
+
+        content = {
+            "nodes" : nodes,
+            "edges" : [
+                [nodes[u],nodes[v],a]
+                for u,v,a in zip(self.edge_src.tolist(),self.edge_dst.tolist(),self.edge_attack.tolist())
+            ],
+            "attr_graph" : {
+                "label_list" : self.label_list
+            },
+            "attr_node":{
+                "label" : {node:self.label_list[labels[i]] for i,node in enumerate(nodes)},
+                "skew_type":{node:('neutral','L1','L2')[code] for node,code in zip(nodes,self.skew_code.tolist())},
+                "use_subset_cond":bool(self.cond_has_subset.any()),
+                "conditions":{
+                    node:[list(c[:3]) + ([list(c[3])] if len(c) == 4 else []) for c in conditions[cond_ptr[i]:cond_ptr[i+1]]]
+                    for i,node in enumerate(nodes)
+                },
+                "weights":dict(zip(nodes,weights))
+            }
+        }
+
+        if self.opinions:
+            content["attr_node"]["opinion"] = {nodes[i]:opinion for i,opinion in self.opinions.items()}
+
+        with open(path,"w") as file:
+            yaml.dump(content,file,Dumper=_YAML_DUMPER)
+
+        return
+
+    def read_npz(self,path:str) -> None:
+        """
+        Read the .npz file saved by save_npz (MAModel.save_npz writes the same format).
+
+        Args:
+            path (str): the path to the .npz file
+
+        """
+        with np.load(path,allow_pickle=False) as data:
+            arrays = {key:data[key] for key in data.files}
+
+        self.__init__()
+
+        self.label_list = json.loads(str(arrays["label_list"]))
+        self.nodes = arrays["nodes"].astype(np.int64)
+        self.label_code = arrays["label_codes"].astype(np.int8)
+        self.skew_code = arrays["skew_codes"].astype(np.int8)
+        self.weight = arrays["weights"].astype(np.float64)
+        self.integer_weights = arrays["weights"].dtype.kind == 'i'
+
+        # vertices are saved as themselves, not positions.
+        position = self._positions(arrays["edge_src"])
+        self.edge_src = position.astype(np.int32)
+        self.edge_dst = self._positions(arrays["edge_dst"]).astype(np.int32)
+        self.edge_attack = arrays["edge_attack"].astype(bool)
+
+        self.cond_ptr = arrays["cond_ptr"].astype(np.int64)
+        self.cond_sign = arrays["cond_sign"].astype(bool)
+        self.cond_lo = arrays["cond_lo"].astype(np.float64)
+        self.cond_hi = arrays["cond_hi"].astype(np.float64)
+        self.integer_bounds = arrays["cond_lo"].dtype.kind == 'i' and arrays["cond_hi"].dtype.kind == 'i'
+        self.cond_has_subset = arrays["cond_has_subset"].astype(bool)
+
+        # vertices in the subsets which are not in the graph are dropped.
+        members = arrays["subset_members"]
+        member_cond = np.repeat(np.arange(len(self.cond_sign)),np.diff(arrays["subset_ptr"]))
+        position = self._positions(members)
+        known = position >= 0
+        self.subset_members = position[known].astype(np.int32)
+        self.subset_ptr = np.zeros(len(self.cond_sign)+1,dtype=np.int64)
+        self.subset_ptr[1:] = np.cumsum(np.bincount(member_cond[known],minlength=len(self.cond_sign)))
+
+        if "opinions" in arrays:
+            opinions = json.loads(str(arrays["opinions"]))
+            position = self._positions(np.array([node for node,_ in opinions],dtype=np.int64)).tolist()
+            self.opinions = {i:opinion for i,(_,opinion) in zip(position,opinions)}
+
+        return
+
+    def save_npz(self,path:str = "output.npz"):
+        """
+        save the model in the .npz format of MAModel.save_npz.
+
+        Args:
+            path (str, optional): path to the new .npz file. Defaults to "output.npz".
+
+        """
+        arrays = {
+            "label_list" : np.array(json.dumps(self.label_list)),
+            "nodes" : self.nodes,
+            "label_codes" : self.label_code,
+            "skew_codes" : self.skew_code,
+            "weights" : self.weight.astype(np.int64) if self.integer_weights else self.weight,
+            "edge_src" : self.nodes[self.edge_src],
+            "edge_dst" : self.nodes[self.edge_dst],
+            "edge_attack" : self.edge_attack,
+            "cond_ptr" : self.cond_ptr,
+            "cond_sign" : self.cond_sign,
+            "cond_lo" : self.cond_lo.astype(np.int64) if self.integer_bounds else self.cond_lo,
+            "cond_hi" : self.cond_hi.astype(np.int64) if self.integer_bounds else self.cond_hi,
+            "cond_has_subset" : self.cond_has_subset,
+            "subset_ptr" : self.subset_ptr,
+            "subset_members" : self.nodes[self.subset_members],
+        }
+
+        if self.opinions:
+            nodes = self.nodes.tolist()
+            arrays["opinions"] = np.array(json.dumps([[nodes[i],opinion] for i,opinion in self.opinions.items()]))
+
+        with open(path,"wb") as file:
+            np.savez(file,**arrays)
+
+        return
+
+    def to_model(self)->MAModel:
+        """
+        Convert to MAModel (networkx). predicted_labels, judges and scc_id are also attached if they have been computed.
 
         Returns:
-            _Judge: Result of _Judge addition performed. 
+            MAModel: converted model
         """
-        
-        assert(self.skew_type == other.skew_type)
-        
-        skew_type = self.skew_type
-        
-        assert(isinstance(other,_Judge))
-        assert(skew_type in ["neutral","L1","L2"])
-        
-        
-        # Addition table of decisions when neutral.
-        table_neutral = [
-        #          S1   S2   S3   S4   S5   S6   S7   S8
-            [None,None,None,None,None,None,None,None,None],
-            [None,'S1','S3','S3','S5','S5','S3','S5','S1'],#S1
-            [None,'S3','S2','S3','S6','S3','S3','S6','S2'],#S2
-            [None,'S3','S3','S3','S3','S3','S3','S3','S3'],#S3
-            [None,'S5','S6','S3','S7','S5','S6','S7','S4'],#S4
-            [None,'S5','S3','S3','S5','S5','S3','S5','S5'],#S5
-            [None,'S3','S3','S3','S6','S3','S3','S6','S6'],#S6
-            [None,'S5','S6','S3','S7','S5','S6','S7','S7'],#S7
-            [None,'S1','S2','S3','S4','S5','S6','S7','S8'],#S8
-        ]
-        
-        # Addition table of decisions when L1 skew.
-        
-        table_L1 =[
-        #          S1   S2   S3   S4   S5   S6   S7   S8
-            [None,None,None,None,None,None,None,None,None],
-            [None,"S1","S1",None,"S1",None,None,None,"S1"],#S1
-            [None,"S1","S2",None,"S4",None,None,None,"S2"],#S2
-            [None,None,None,None,None,None,None,None,None],#S3
-            [None,"S1","S4",None,"S4",None,None,None,"S4"],#S4
-            [None,None,None,None,None,None,None,None,None],#S5
-            [None,None,None,None,None,None,None,None,None],#S6
-            [None,None,None,None,None,None,None,None,None],#S7
-            [None,"S1","S2",None,"S4",None,None,None,"S8"],#S8
-        ]
-        
-        # Addition table of decisions when L2 skew.
-        
-        table_L2 = [
-        #          S1   S2   S3   S4   S5   S6   S7   S8
-            [None,None,None,None,None,None,None,None,None],
-            [None,"S1","S2",None,"S4",None,None,None,"S1"],#S1
-            [None,"S2","S2",None,"S2",None,None,None,"S2"],#S2
-            [None,None,None,None,None,None,None,None,None],#S3
-            [None,"S4","S2",None,"S4",None,None,None,"S4"],#S4
-            [None,None,None,None,None,None,None,None,None],#S5
-            [None,None,None,None,None,None,None,None,None],#S6
-            [None,None,None,None,None,None,None,None,None],#S7
-            [None,"S1","S2",None,"S4",None,None,None,"S8"],#S8
-        ]
-        
- 
-        # get the number to use the addition table.
-        to_int = lambda judge:int(judge[1])
-        
-        if skew_type == 'neutral':
-            
-            # print(f"{to_int(self.judge)},{to_int(other.judge)}")
-            # print(table_neutral[to_int(self.judge)][to_int(other.judge)])
+        with _gc_paused():
+            model = MAModel()
+            model.graph = nx.MultiDiGraph()
+            G = model.graph
+
+            G.graph['label_list'] = list(self.label_list)
+
+            nodes = self.nodes.tolist()
+            labels = self.label_code.tolist()
+            skew_codes = self.skew_code.tolist()
+            weights = self._weights()
+            conditions = self._conditions()
+            cond_ptr = self.cond_ptr.tolist()
+
+            def node_attributes(i):
+                attributes = {
+                    'label' : self.label_list[labels[i]],
+                    'skew_type' : ('neutral','L1','L2')[skew_codes[i]],
+                    'conditions' : conditions[cond_ptr[i]:cond_ptr[i+1]],
+                    'weight' : weights[i],
+                }
+                if i in self.opinions:
+                    attributes['opinion'] = self.opinions[i]
+                return attributes
+
+            G.add_nodes_from((node,node_attributes(i)) for i,node in enumerate(nodes))
+
+            # the keys are 0,1,... for the edges of each (tail,head) in order, the same as add_edge gives without a key.
+            # They are found with numpy, so that add_edges_from does not search a new key for each edge.
+            attack = self.edge_attack.tolist()
+            G.add_edges_from(
+                (nodes[u],nodes[v],key,{'attack':a,'color':("red" if a else "blue")})
+                for u,v,key,a in zip(self.edge_src.tolist(),self.edge_dst.tolist(),self._edge_keys().tolist(),attack)
+            )
+            model.only_attack = all(attack)
+
+            if self.scc_id is not None:
+                for node,scc_id in zip(nodes,self.scc_id.tolist()):
+                    G.nodes[node]['scc_id'] = scc_id
+
+            if self.predicted_code is not None:
+                to_list = model._judge_to_labels()
+                for i,node in enumerate(nodes):
+                    G.nodes[node]['predicted_labels'] = list(to_list[self.predicted_code[i]])
+
+                # the judges are already in arrays in the order of the trace.
+                trace = model.judge_trace = JudgeTrace(G)
+                trace.A_weight[:],trace.B_weight[:],trace.no_weight[:] = self._condition_weights
+                trace.code[:] = self._condition_judges
+
+        return model
+
+    def predict_all(self)->np.ndarray:
+        """
+        Predict the labels of all the vertices (the same result as MAModel.predict_all).
 
-            res_judge = _Judge(judge=table_neutral[to_int(self.judge)][to_int(other.judge)])
-        
-        if skew_type == 'L1':
-            
-            res_judge = _Judge(judge=table_L1[to_int(self.judge)][to_int(other.judge)])
-            
-        if skew_type == 'L2':
-            
-            res_judge = _Judge(judge=table_L2[to_int(self.judge)][to_int(other.judge)])
-        
-        res_judge.skew_type = skew_type
-        
-        return res_judge
-    
-    def __str__(self):
-        return f"<judge:{self.judge}>"
-    
-    def __repr__(self) -> str:
-        return f"<judge:{self.judge}>"
+        Returns:
+            np.ndarray: code of the overall judge of each vertex (1 for S1, ..., 8 for S8). See get_predicted_labels for the labels.
+        """
+        arrays = _ModelArrays.from_compact(self)
+
+        A_weight,B_weight,no_weight = arrays.condition_weights()
+        judges = arrays.condition_judges(A_weight,B_weight)
+
+        self._condition_weights = (A_weight,B_weight,no_weight)
+        self._condition_judges = judges
+        self.predicted_code = arrays.fold_judges(judges)
+
+        return self.predicted_code
+
+    def get_predicted_labels(self,i:int)->list:
+        """
+        Return the predicted labels of the vertex at position i. predict_all must have been called.
+
+        Args:
+            i (int): position of the vertex in self.nodes
+
+        Returns:
+            list: list of predicted labels
+        """
+        label_list = self.label_list
+
+        return [label_list[code] for code in sorted(_JUDGE_TO_LABEL_CODES[int(self.predicted_code[i])])]
+
+    def attach_scc_id(self)->tuple[CompactMAModel,int]:
+        """
+        Apply the scc algorithm to the graph and attach scc_id (1 for the largest SCC, 2 for the next, ...) to self.scc_id.
+
+        Returns:
+            tuple[CompactMAModel,int]: model after assignment, number of SCCs.
+        """
+        component = _strongly_connected_components(len(self.nodes),self.edge_src.astype(np.int64),self.edge_dst.astype(np.int64))
+
+        if len(component) == 0:
+            self.scc_id = np.zeros(0,dtype=np.int32)
+            return self,0
+
+        sizes = np.bincount(component)
+        # larger SCC first
+        order = np.argsort(-sizes,kind='stable')
+        rank = np.empty(len(sizes),dtype=np.int64)
+        rank[order] = np.arange(1,len(sizes)+1)
+
+        self.scc_id = rank[component].astype(np.int32)
+
+        return self,len(sizes)
+
+    def visualize(self,**kwargs)->str:
+        """
+        Convert to MAModel and call MAModel.visualize. The arguments are the same.
+
+        Returns:
+            str: path of the file written
+        """
+        return self.to_model().visualize(**kwargs)
+
+    def _positions(self,vertices:np.ndarray)->np.ndarray:
+        """Positions in self.nodes of the vertices. -1 for the vertices not in the model.
+        """
+        order = np.argsort(self.nodes,kind='stable')
+        sorted_nodes = self.nodes[order]
+        pos = np.searchsorted(sorted_nodes,vertices)
+        pos_clipped = np.minimum(pos,max(len(sorted_nodes)-1,0))
+
+        if len(sorted_nodes) == 0:
+            return np.full(len(vertices),-1,dtype=np.int64)
+
+        found = (pos < len(sorted_nodes)) & (sorted_nodes[pos_clipped] == vertices)
+
+        return np.where(found,order[pos_clipped],-1)
+
+    def _edge_keys(self)->np.ndarray:
+        """Key of each edge in a networkx.MultiDiGraph: k for the k-th edge of the same (tail,head)."""
+        num_edges = len(self.edge_src)
+        pair = self.edge_src.astype(np.int64) * max(len(self.nodes),1) + self.edge_dst.astype(np.int64)
+
+        order = np.argsort(pair,kind='stable')
+        sorted_pair = pair[order]
+        first = np.ones(num_edges,dtype=bool)
+        first[1:] = sorted_pair[1:] != sorted_pair[:-1]
+
+        # position of the first edge of the same pair in the sorted order.
+        start = np.maximum.accumulate(np.where(first,np.arange(num_edges),0)) if num_edges else np.zeros(0,dtype=np.int64)
+        keys = np.empty(num_edges,dtype=np.int64)
+        keys[order] = np.arange(num_edges) - start
+
+        return keys
+
+    def _weights(self)->list:
+        """Weights as python numbers."""
+        if self.integer_weights:
+            return self.weight.astype(np.int64).tolist()
+        return self.weight.tolist()
+
+    def _conditions(self)->list:
+        """Conditions of all the vertices as tuples, in the same form as MAModel."""
+        nodes = self.nodes.tolist()
+        signs = ['+' if sign else '-' for sign in self.cond_sign.tolist()]
+        if self.integer_bounds:
+            lo = self.cond_lo.astype(np.int64).tolist()
+            hi = self.cond_hi.astype(np.int64).tolist()
+        else:
+            lo = self.cond_lo.tolist()
+            hi = self.cond_hi.tolist()
+        has_subset = self.cond_has_subset.tolist()
+        subset_ptr = self.subset_ptr.tolist()
+        members = [nodes[i] for i in self.subset_members.tolist()]
+
+        return [
+            (signs[c],lo[c],hi[c],tuple(members[subset_ptr[c]:subset_ptr[c+1]])) if has_subset[c]
+            else (signs[c],lo[c],hi[c])
+            for c in range(len(signs))
+        ]
 
 
 if __name__ == "__main__":
+    import settings
+
     # Confirmation of IO operation
     model = MAModel()
     path = settings.MODEL_YAML_PATH
     model.read_yaml(path)
 
+    vis_features = settings.INFORMATION_TO_VISUALIZE
+
+    # the judges are recorded only if they are visualized.
+    model.trace_judges = 'judges' in vis_features
+
     for node in model.graph.nodes():
         model.predict_labels(node)
 
-    
-    vis_features = settings.INFORMATION_TO_VISUALIZE
-
-    model.visualize(title = "predicted",form = "",add_description=False)
+    model.visualize(title = "predicted",vis_features = vis_features,form = "",add_description=False)
 
     
     model.save_yaml(path = "saved.yml")
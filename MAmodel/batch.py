@@ -0,0 +1,190 @@
+"""Batch prediction of many model files.
+
+The .yml models given as directories or glob patterns are read, predicted (predict_all) and saved
+by a pool of worker processes. The predicted labels of each model are written as a line of JSON (JSON Lines),
+and the throughput and the failures are reported at the end. settings.py is not used.
+
+Usage:
+    python MAmodel/batch.py models/ --workers 8 --no-pdf --predictions predictions.jsonl
+    python MAmodel/batch.py "models/**/*.yml" --save-dir saved --pdf-dir pdf
+"""
+from __future__ import annotations
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from typing import Optional
+
+from MAmodel import MAModel
+
+
+MODEL_EXTENSIONS = (".yml",".yaml")
+
+
+def find_models(inputs:list[str])->list[str]:
+    """Expand the directories (their .yml/.yaml files, recursively) and the glob patterns.
+
+    Args:
+        inputs (list[str]): directories, files or glob patterns
+
+    Returns:
+        list[str]: sorted paths of the models without duplicates
+    """
+    paths = []
+
+    for item in inputs:
+        if os.path.isdir(item):
+            for root,_,files in os.walk(item):
+                paths.extend(os.path.join(root,f) for f in files if f.endswith(MODEL_EXTENSIONS))
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            paths.extend(p for p in glob.glob(item,recursive=True) if os.path.isfile(p))
+
+    return sorted(set(paths))
+
+
+def output_names(paths:list[str])->list[str]:
+    """Names of the output files of the models (file name without the extension), made unique.
+
+    Args:
+        paths (list[str]): paths of the models
+
+    Returns:
+        list[str]: names
+    """
+    names = []
+    used = set()
+
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = stem
+        k = 1
+        while name in used:
+            name = f"{stem}_{k}"
+            k += 1
+        used.add(name)
+        names.append(name)
+
+    return names
+
+
+def process_model(path:str,name:str,save_dir:Optional[str],pdf_dir:Optional[str],with_judges:bool)->dict:
+    """Read, predict, save and render one model. Exceptions are returned as the error of the record.
+
+    Args:
+        path (str): path to the .yml file
+        name (str): name of the output files
+        save_dir (Optional[str]): directory for the saved .yml (None not to save)
+        pdf_dir (Optional[str]): directory for the rendered .pdf (None not to render)
+        with_judges (bool): whether the judges are also in the record
+
+    Returns:
+        dict: record of the model, written as a line of JSON
+    """
+    record = {"path" : path}
+    start = time.perf_counter()
+
+    try:
+        model = MAModel()
+        model.trace_judges = with_judges
+        model.read_yaml(path)
+        predicted = model.predict_all()
+
+        if save_dir is not None:
+            model.save_yaml(os.path.join(save_dir,f"{name}.yml"))
+
+        if pdf_dir is not None:
+            model.visualize(title=name,path_to_save_dir=os.path.join(pdf_dir,""),add_description=False)
+
+        G = model.graph
+        record["num_vertex"] = G.number_of_nodes()
+        record["num_edges"] = G.number_of_edges()
+        record["predicted_labels"] = {str(node):labels for node,labels in predicted.items()}
+        if with_judges:
+            record["judges"] = {str(node):model.get_judges(node) for node in G.nodes}
+
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        record["traceback"] = traceback.format_exc()
+
+    record["seconds"] = time.perf_counter() - start
+
+    return record
+
+
+def _process_task(task:tuple)->dict:
+    """process_model with the arguments packed, for the worker processes."""
+    return process_model(*task)
+
+
+def main(argv:Optional[list[str]] = None)->int:
+
+    parser = argparse.ArgumentParser(description="Predict the labels of many MA models.")
+    parser.add_argument("inputs",nargs="+",help="directories, .yml files or glob patterns (quote them) of the models")
+    parser.add_argument("--workers",type=int,default=os.cpu_count(),help="number of worker processes (1 to run in this process)")
+    parser.add_argument("--predictions",default="predictions.jsonl",help="path of the JSON Lines of the predicted labels")
+    parser.add_argument("--save-dir",default="saved",help="directory for the saved .yml models")
+    parser.add_argument("--no-save",action="store_true",help="do not save the .yml models")
+    parser.add_argument("--pdf-dir",default="pdf",help="directory for the rendered .pdf files")
+    parser.add_argument("--no-pdf",action="store_true",help="do not render the .pdf files")
+    parser.add_argument("--judges",action="store_true",help="also write the judges of each vertex")
+    args = parser.parse_args(argv)
+
+    paths = find_models(args.inputs)
+    if not paths:
+        print("no model found",file=sys.stderr)
+        return 1
+
+    save_dir = None if args.no_save else args.save_dir
+    pdf_dir = None if args.no_pdf else args.pdf_dir
+    for directory in (save_dir,pdf_dir):
+        if directory is not None:
+            os.makedirs(directory,exist_ok=True)
+
+    tasks = [(path,name,save_dir,pdf_dir,args.judges) for path,name in zip(paths,output_names(paths))]
+
+    start = time.perf_counter()
+    failures = []
+    num_vertex = 0
+
+    with open(args.predictions,"w") as f:
+
+        if args.workers is None or args.workers <= 1:
+            records = map(_process_task,tasks)
+            executor = None
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=args.workers)
+            records = executor.map(_process_task,tasks,chunksize=max(1,len(tasks) // (args.workers * 8)))
+
+        try:
+            # the records are written in the order of the paths as soon as they are ready.
+            for record in records:
+                if "error" in record:
+                    failures.append(record)
+                    print(f"failed: {record['path']}: {record['error']}",file=sys.stderr)
+                    print(record.pop("traceback"),file=sys.stderr)
+                else:
+                    num_vertex += record["num_vertex"]
+                f.write(json.dumps(record,default=str) + "\n")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    seconds = time.perf_counter() - start
+
+    print(
+        f"{len(paths)} models ({len(failures)} failed) in {seconds:.2f}s: "
+        f"{len(paths)/seconds:.1f} models/s, {num_vertex/seconds:.0f} vertices/s",
+        file=sys.stderr
+    )
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""Benchmark of the stages of the MAModel pipeline.
+
+Synthetic models are generated at several scales (with simple and extended conditions) and each stage
+(save_yaml, read_yaml, predict_labels over all the vertices, predict_all, attach_scc_id, visualize, save_npz, read_npz)
+is timed separately. The results are written as JSON so that they can be compared with a previous run.
+
+Usage:
+    python MAmodel/benchmark.py --scales 100 1000 10000 --output bench.json
+    python MAmodel/benchmark.py --compare bench.json   # exit with 1 if a stage is slower than the baseline
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import contextlib
+from typing import Callable, Optional
+
+from MAmodel import MAModel
+
+
+STAGES = ["save_yaml","read_yaml","predict_labels","predict_all","attach_scc_id","visualize","save_npz","read_npz"]
+
+
+def generate_model(num_vertex:int,use_extended_conditions:bool,seed:int = 0,max_degree:int = 4)->MAModel:
+    """Generate a random model with the seeded generators.
+
+    Args:
+        num_vertex (int): number of vertices
+        use_extended_conditions (bool): whether extended conditions are used
+        seed (int, optional): seed. Defaults to 0.
+        max_degree (int, optional): max indegree and outdegree. Defaults to 4.
+
+    Returns:
+        MAModel: generated model
+    """
+    model = MAModel()
+    model.generate_graph(num_vertex=num_vertex,max_indegree=max_degree,max_outdegree=max_degree,num_edges=num_vertex * max_degree // 2,seed=seed)
+    model.attach_label_randomly(seed=seed+1)
+    model.attach_skew_types(only='any',seed=seed+2)
+    model.attach_conditions(use_extended_conditions=use_extended_conditions,seed=seed+3)
+
+    return model
+
+
+def measure(stage:Callable[[],None],trace_memory:bool,profiled:Optional[MAModel] = None)->dict:
+    """Run a stage and measure it.
+
+    Args:
+        stage (Callable[[],None]): stage to run
+        trace_memory (bool): whether the peak of the python allocations of the stage is traced (tracemalloc). This slows the stage down.
+        profiled (MAModel, optional): model whose MAModel.profile statistics are recorded. Defaults to None.
+
+    Returns:
+        dict: seconds, process_peak_rss_kb, peak_traced_kb if traced and profile if profiled.
+            process_peak_rss_kb is the peak resident set size of the process so far (ru_maxrss), which never goes down:
+            it is not the memory of the stage. peak_traced_kb is the peak of the python allocations during the stage.
+    """
+    if trace_memory:
+        tracemalloc.start()
+
+    profile = profiled.profile() if profiled is not None else contextlib.nullcontext()
+
+    start = time.perf_counter()
+    with profile as prof:
+        stage()
+    seconds = time.perf_counter() - start
+
+    res = {
+        "seconds" : seconds,
+        "process_peak_rss_kb" : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+    if trace_memory:
+        res["peak_traced_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+
+    if profiled is not None:
+        res["profile"] = prof.as_dict()
+
+    return res
+
+
+def run_scale(num_vertex:int,use_extended_conditions:bool,args:argparse.Namespace)->list[dict]:
+    """Run all the stages for a model of the scale.
+
+    Args:
+        num_vertex (int): number of vertices
+        use_extended_conditions (bool): whether extended conditions are used
+        args (argparse.Namespace): command line arguments
+
+    Returns:
+        list[dict]: a result for each stage
+    """
+    results = []
+
+    model = generate_model(num_vertex,use_extended_conditions,seed=args.seed)
+    num_edges = model.graph.number_of_edges()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yaml_path = os.path.join(tmpdir,"model.yml")
+        npz_path = os.path.join(tmpdir,"model.npz")
+        loaded = MAModel()
+        loaded_npz = MAModel()
+
+        # the stages after read_yaml work on the model read back, as the command line tool does,
+        # and the stages before it on the generated model. subject is switched when read_yaml has run.
+        subject = model
+
+        def predict_labels():
+            for node in subject.graph.nodes():
+                subject.predict_labels(node)
+
+        stages = {
+            "save_yaml" : lambda: model.save_yaml(yaml_path),
+            "read_yaml" : lambda: loaded.read_yaml(yaml_path),
+            "predict_labels" : predict_labels,
+            "predict_all" : lambda: subject.predict_all(),
+            "attach_scc_id" : lambda: subject.attach_scc_id(),
+            "visualize" : lambda: subject.visualize(title="benchmark",path_to_save_dir=tmpdir+"/",add_description=False),
+            "save_npz" : lambda: subject.save_npz(npz_path),
+            "read_npz" : lambda: loaded_npz.read_npz(npz_path),
+        }
+
+        # model profiled in each stage (--profile). subject for the others.
+        stage_models = {
+            "save_yaml" : model,
+            "read_yaml" : loaded,
+            "read_npz" : loaded_npz,
+        }
+
+        # files needed by the reading stages when the writing stages are not selected (not timed).
+        prerequisites = {
+            "read_yaml" : (yaml_path,lambda: model.save_yaml(yaml_path)),
+            "read_npz" : (npz_path,lambda: model.save_npz(npz_path)),
+        }
+
+        limits = {
+            "predict_labels" : args.max_serial_nodes,
+            "visualize" : args.max_visualize_nodes,
+        }
+
+        for name in args.stages:
+            result = {
+                "stage" : name,
+                "num_vertex" : num_vertex,
+                "num_edges" : num_edges,
+                "extended_conditions" : use_extended_conditions,
+            }
+
+            if name in limits and limits[name] is not None and num_vertex > limits[name]:
+                result["skipped"] = True
+            else:
+                if name in prerequisites and not os.path.exists(prerequisites[name][0]):
+                    prerequisites[name][1]()
+                result.update(measure(stages[name],args.trace_memory,stage_models.get(name,subject) if args.profile else None))
+                if name == "read_yaml":
+                    subject = loaded
+
+            results.append(result)
+            print(format_result(result),flush=True)
+
+    return results
+
+
+def format_result(result:dict)->str:
+    """One line of the report."""
+    head = f"{result['num_vertex']:>9} {'ext' if result['extended_conditions'] else 'simple':<6} {result['stage']:<15}"
+    if result.get("skipped"):
+        return head + "   skipped"
+    line = head + f" {result['seconds']:>10.4f}s"
+    if "peak_traced_kb" in result:
+        line += f"  peak {result['peak_traced_kb']/1024:>9.1f}MB"
+    return line + f"  process peak so far {result['process_peak_rss_kb']/1024:>9.1f}MB"
+
+
+def compare(results:list[dict],baseline_path:str,threshold:float)->list[str]:
+    """Find the stages slower than the baseline.
+
+    Args:
+        results (list[dict]): results of this run
+        baseline_path (str): path to the JSON written by a previous run
+        threshold (float): allowed ratio of slowdown, e.g. 0.2 for 20%
+
+    Returns:
+        list[str]: descriptions of the regressions
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    key = lambda r:(r["stage"],r["num_vertex"],r["extended_conditions"])
+    base = {key(r):r for r in baseline["results"] if not r.get("skipped")}
+
+    regressions = []
+    for r in results:
+        if r.get("skipped") or key(r) not in base:
+            continue
+        old = base[key(r)]["seconds"]
+        if r["seconds"] > old * (1 + threshold):
+            regressions.append(f"{r['stage']} ({r['num_vertex']} vertices, {'ext' if r['extended_conditions'] else 'simple'}): {old:.4f}s -> {r['seconds']:.4f}s")
+
+    return regressions
+
+
+def main(argv:Optional[list[str]] = None)->int:
+
+    parser = argparse.ArgumentParser(description="Benchmark of the MAModel pipeline stages.")
+    parser.add_argument("--scales",type=int,nargs="+",default=[100,1000,10000,100000,1000000],help="numbers of vertices")
+    parser.add_argument("--conditions",choices=["simple","extended","both"],default="both",help="kind of conditions")
+    parser.add_argument("--stages",nargs="+",choices=STAGES,default=STAGES,help="stages to run")
+    parser.add_argument("--max-serial-nodes",type=int,default=None,help="skip predict_labels (per-vertex loop) above this number of vertices")
+    parser.add_argument("--max-visualize-nodes",type=int,default=200,help="skip visualize above this number of vertices (graphviz layout of the whole graph)")
+    parser.add_argument("--trace-memory",action="store_true",help="also record the peak of the python allocations of each stage, the memory of the stage (slower)")
+    parser.add_argument("--profile",action="store_true",help="also record the MAModel.profile statistics of each stage (slower)")
+    parser.add_argument("--seed",type=int,default=0,help="seed of the generated models")
+    parser.add_argument("--output",default="bench_output.json",help="path of the JSON results")
+    parser.add_argument("--compare",default=None,help="JSON results of a previous run to compare with")
+    parser.add_argument("--threshold",type=float,default=0.2,help="allowed slowdown ratio for --compare")
+    args = parser.parse_args(argv)
+
+    conditions = {"simple":[False],"extended":[True],"both":[False,True]}[args.conditions]
+
+    results = []
+    for num_vertex in args.scales:
+        for use_extended_conditions in conditions:
+            results.extend(run_scale(num_vertex,use_extended_conditions,args))
+
+    report = {
+        "created" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python" : sys.version,
+        "platform" : platform.platform(),
+        "args" : vars(args),
+        "results" : results,
+    }
+
+    with open(args.output,"w") as f:
+        json.dump(report,f,indent=2)
+
+    if args.compare is not None:
+        regressions = compare(results,args.compare,args.threshold)
+        for regression in regressions:
+            print("regression:",regression,file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
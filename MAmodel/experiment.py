@@ -0,0 +1,369 @@
+"""Monte Carlo experiment on random models.
+
+Each trial generates a random model (graph, labels, skew types, conditions), predicts the labels of all the vertices
+and checks whether the random labeling is self-consistent (the label of every vertex is in its own predicted_labels).
+The trials run in a pool of worker processes. Trial k draws its random numbers from its own seed stream
+(numpy SeedSequence(seed,spawn_key=(k,))), so a trial gives the same result whatever the number of workers or the order of the trials.
+
+The record of each trial is appended to a JSON Lines file as soon as it is ready, and the statistics
+(consistency rate, distribution of the predicted labels by skew type) are aggregated incrementally and written to a summary JSON.
+An interrupted run continues with --resume: the trials already in the JSON Lines file are aggregated again and not run.
+
+Usage:
+    python MAmodel/experiment.py --trials 10000 --num-vertex 8 --workers 8 --output trials.jsonl --summary summary.json
+    python MAmodel/experiment.py --trials 10000 --num-vertex 8 --workers 8 --output trials.jsonl --summary summary.json --resume
+"""
+from __future__ import annotations
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import sys
+import time
+import traceback
+from typing import Optional
+
+import numpy as np
+
+from MAmodel import MAModel
+
+
+# arguments which change the results of the trials. --resume requires them to be the same as in the output.
+CONFIG_KEYS = ["seed","num_vertex","max_indegree","max_outdegree","only_attack","avoid_self_loop","skew","extended_conditions","generator"]
+
+
+def trial_seed(seed:int,trial:int)->np.random.SeedSequence:
+    """The seed stream of a trial, independent of the other trials.
+
+    Args:
+        seed (int): seed of the experiment
+        trial (int): index of the trial
+
+    Returns:
+        np.random.SeedSequence: seed sequence of the trial
+    """
+    return np.random.SeedSequence(seed,spawn_key=(trial,))
+
+
+def generate_trial_model(config:dict,seed_seq:np.random.SeedSequence)->MAModel:
+    """Generate the random model of a trial.
+
+    Args:
+        config (dict): the values of CONFIG_KEYS
+        seed_seq (np.random.SeedSequence): seed stream of the trial
+
+    Returns:
+        MAModel: generated model
+    """
+    model = MAModel()
+
+    if config["generator"] == "random":
+        # init_graph and the other generators without seed use the random module, which is seeded for the trial.
+        random.seed(int.from_bytes(seed_seq.generate_state(4).tobytes(),"little"))
+        model.init_graph(
+            num_vertex=config["num_vertex"],
+            max_indegree=config["max_indegree"],
+            max_outdegree=config["max_outdegree"],
+            only_attack=config["only_attack"],
+            avoid_self_loop=config["avoid_self_loop"],
+        )
+        model.attach_label_randomly()
+        model.attach_skew_types(only=config["skew"])
+        model.attach_conditions(use_extended_conditions=config["extended_conditions"])
+    else:
+        rng = np.random.default_rng(seed_seq)
+        model.generate_graph(
+            num_vertex=config["num_vertex"],
+            max_indegree=config["max_indegree"],
+            max_outdegree=config["max_outdegree"],
+            only_attack=config["only_attack"],
+            avoid_self_loop=config["avoid_self_loop"],
+            seed=rng,
+        )
+        model.attach_label_randomly(seed=rng)
+        model.attach_skew_types(only=config["skew"],seed=rng)
+        model.attach_conditions(use_extended_conditions=config["extended_conditions"],seed=rng)
+
+    return model
+
+
+def run_trial(config:dict,trial:int)->dict:
+    """Run a trial. Exceptions are returned as the error of the record.
+
+    Args:
+        config (dict): the values of CONFIG_KEYS
+        trial (int): index of the trial
+
+    Returns:
+        dict: record of the trial, written as a line of JSON
+    """
+    record = {"trial" : trial}
+    start = time.perf_counter()
+
+    try:
+        model = generate_trial_model(config,trial_seed(config["seed"],trial))
+        predicted = model.predict_all()
+
+        G = model.graph
+        by_skew = {}
+        num_consistent = 0
+        for node,data in G.nodes(data=True):
+            labels = predicted[node]
+            if data['label'] in labels:
+                num_consistent += 1
+            key = ",".join(map(str,labels))
+            counts = by_skew.setdefault(data['skew_type'],{})
+            counts[key] = counts.get(key,0) + 1
+
+        record["num_vertex"] = G.number_of_nodes()
+        record["num_edges"] = G.number_of_edges()
+        record["num_consistent"] = num_consistent
+        record["consistent"] = num_consistent == G.number_of_nodes()
+        record["predicted_by_skew"] = by_skew
+
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        record["traceback"] = traceback.format_exc()
+
+    record["seconds"] = time.perf_counter() - start
+
+    return record
+
+
+def _run_trial_task(task:tuple)->dict:
+    """run_trial with the arguments packed, for the worker processes."""
+    return run_trial(*task)
+
+
+class Aggregate:
+    """
+    Statistics of the trials, updated one record at a time.
+
+    Attributes:
+        trials(int): number of the trials aggregated (without the failed ones).
+        failed(int): number of the failed trials.
+        consistent(int): number of the trials whose labeling is self-consistent.
+        vertices(int): number of the vertices of all the trials.
+        consistent_vertices(int): number of the vertices whose label is in their predicted_labels.
+        predicted_by_skew(dict): {skew type : {predicted labels joined by ',' : count}}
+        seconds(float): sum of the time of the trials.
+    """
+
+    def __init__(self):
+        self.trials = 0
+        self.failed = 0
+        self.consistent = 0
+        self.vertices = 0
+        self.consistent_vertices = 0
+        self.predicted_by_skew : dict[str,dict[str,int]] = {}
+        self.seconds = 0.0
+
+        return
+
+    def add(self,record:dict):
+        """Aggregate the record of a trial."""
+        if "error" in record:
+            self.failed += 1
+            return
+
+        self.trials += 1
+        self.consistent += bool(record["consistent"])
+        self.vertices += record["num_vertex"]
+        self.consistent_vertices += record["num_consistent"]
+        self.seconds += record["seconds"]
+
+        for skew_type,counts in record["predicted_by_skew"].items():
+            total = self.predicted_by_skew.setdefault(skew_type,{})
+            for key,count in counts.items():
+                total[key] = total.get(key,0) + count
+
+        return
+
+    def as_dict(self)->dict:
+        """
+        Returns:
+            dict: the statistics, with the consistency rate and its standard error, and the predicted labels by skew type as counts and fractions.
+        """
+        rate = self.consistent / self.trials if self.trials else 0.0
+
+        distribution = {}
+        for skew_type,counts in sorted(self.predicted_by_skew.items()):
+            total = sum(counts.values())
+            distribution[skew_type] = {
+                key:{"count":count,"fraction":count / total}
+                for key,count in sorted(counts.items())
+            }
+
+        return {
+            "trials" : self.trials,
+            "failed" : self.failed,
+            "consistent" : self.consistent,
+            "consistency_rate" : rate,
+            "consistency_rate_stderr" : math.sqrt(rate * (1 - rate) / self.trials) if self.trials else 0.0,
+            "vertex_consistency_rate" : self.consistent_vertices / self.vertices if self.vertices else 0.0,
+            "predicted_by_skew" : distribution,
+            "trial_seconds" : self.seconds,
+        }
+
+
+def load_finished(path:str,config:dict,aggregate:Aggregate)->set[int]:
+    """Read the output of an interrupted run, aggregating its trials.
+    The failed trials and a last line cut by the interruption are not counted as finished, so they run again.
+
+    Args:
+        path (str): path of the JSON Lines of the trials
+        config (dict): the values of CONFIG_KEYS of this run
+        aggregate (Aggregate): statistics to update
+
+    Raises:
+        ValueError: Raised when the output was written with another configuration.
+
+    Returns:
+        set[int]: indices of the finished trials
+    """
+    finished = set()
+
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            if "config" in record:
+                if record["config"] != config:
+                    raise ValueError(f"{path} was written with another configuration: {record['config']}")
+                continue
+
+            if "error" in record or record["trial"] in finished:
+                continue
+
+            finished.add(record["trial"])
+            aggregate.add(record)
+
+    return finished
+
+
+def truncate_partial_line(path:str)->int:
+    """Cut the last line of the output if the interruption left it without a newline, so that the records appended
+    on resume start on a line of their own.
+
+    Args:
+        path (str): path of the JSON Lines of the trials
+
+    Returns:
+        int: size of the file after the cut
+    """
+    with open(path,"rb+") as f:
+        data = f.read()
+        size = data.rfind(b"\n") + 1
+        if size < len(data):
+            f.truncate(size)
+
+    return size
+
+
+def write_summary(path:str,aggregate:Aggregate,config:dict,num_trials:int):
+    """Write the summary JSON, replacing the old one at once so that it is never half written."""
+    summary = {"config" : config,"num_trials" : num_trials,**aggregate.as_dict()}
+
+    with open(path + ".tmp","w") as f:
+        json.dump(summary,f,indent=2)
+    os.replace(path + ".tmp",path)
+
+    return
+
+
+def main(argv:Optional[list[str]] = None)->int:
+
+    parser = argparse.ArgumentParser(description="Monte Carlo experiment on the self-consistency of random MA models.")
+    parser.add_argument("--trials",type=int,default=1000,help="number of trials")
+    parser.add_argument("--seed",type=int,default=0,help="seed of the experiment")
+    parser.add_argument("--num-vertex",type=int,default=10,help="number of vertices of a model")
+    parser.add_argument("--max-indegree",type=int,default=4,help="max indegree")
+    parser.add_argument("--max-outdegree",type=int,default=4,help="max outdegree")
+    parser.add_argument("--only-attack",action="store_true",help="only attack edges")
+    parser.add_argument("--avoid-self-loop",action="store_true",help="no self-loops")
+    parser.add_argument("--skew",choices=["any","neutral","L1","L2"],default="any",help="skew types of the vertices")
+    parser.add_argument("--extended-conditions",action="store_true",help="use extended conditions")
+    parser.add_argument("--generator",choices=["numpy","random"],default="numpy",
+                        help="numpy: generate_graph and the seeded generators. random: init_graph and the generators of the random module, seeded for each trial")
+    parser.add_argument("--workers",type=int,default=os.cpu_count(),help="number of worker processes (1 to run in this process)")
+    parser.add_argument("--output",default="trials.jsonl",help="path of the JSON Lines of the trials")
+    parser.add_argument("--summary",default="summary.json",help="path of the summary JSON")
+    parser.add_argument("--summary-every",type=int,default=100,help="write the summary every this number of trials")
+    parser.add_argument("--resume",action="store_true",help="continue the run in --output, skipping its finished trials")
+    args = parser.parse_args(argv)
+
+    config = {key:getattr(args,key) for key in CONFIG_KEYS}
+
+    aggregate = Aggregate()
+    finished = set()
+
+    if args.resume and os.path.exists(args.output):
+        try:
+            finished = load_finished(args.output,config,aggregate)
+        except ValueError as e:
+            print(e,file=sys.stderr)
+            return 1
+        # the config line is written again if even it was cut.
+        mode = "a" if truncate_partial_line(args.output) > 0 else "w"
+    else:
+        mode = "w"
+
+    tasks = [(config,trial) for trial in range(args.trials) if trial not in finished]
+
+    start = time.perf_counter()
+    done = 0
+
+    with open(args.output,mode) as f:
+
+        if mode == "w":
+            f.write(json.dumps({"config" : config}) + "\n")
+
+        def handle(record:dict):
+            nonlocal done
+            if "error" in record:
+                print(f"failed: trial {record['trial']}: {record['error']}",file=sys.stderr)
+                print(record.pop("traceback"),file=sys.stderr)
+            aggregate.add(record)
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            done += 1
+            if done % args.summary_every == 0:
+                write_summary(args.summary,aggregate,config,args.trials)
+
+        if args.workers is None or args.workers <= 1:
+            for task in tasks:
+                handle(_run_trial_task(task))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+                # a bounded number of trials are in flight, and the records are written as they finish.
+                pending = set()
+                for task in tasks:
+                    pending.add(executor.submit(_run_trial_task,task))
+                    if len(pending) >= args.workers * 4:
+                        finished_futures,pending = concurrent.futures.wait(pending,return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in finished_futures:
+                            handle(future.result())
+                for future in concurrent.futures.as_completed(pending):
+                    handle(future.result())
+
+    write_summary(args.summary,aggregate,config,args.trials)
+
+    seconds = time.perf_counter() - start
+    summary = aggregate.as_dict()
+
+    print(
+        f"{done} trials in {seconds:.2f}s ({len(finished)} resumed, {summary['failed']} failed): "
+        f"consistency rate {summary['consistency_rate']:.4f} +- {summary['consistency_rate_stderr']:.4f}",
+        file=sys.stderr
+    )
+
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
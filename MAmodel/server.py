@@ -0,0 +1,371 @@
+"""Resident prediction server.
+
+The models are read once and kept in memory, and the requests are lines of JSON over a local TCP or Unix socket
+(standard library only: asyncio). A request is a JSON object with "op" and an optional "id", echoed in its response:
+
+    {"id":1,"op":"load","model":"m","path":"models/a.yml"}
+    {"id":2,"op":"set_label","model":"m","node":3,"label":2}
+    {"id":3,"op":"set_weight","model":"m","node":3,"weight":5}
+    {"id":4,"op":"add_edge","model":"m","u":3,"v":4,"attack":true}      (remove_edge likewise)
+    {"id":5,"op":"predict","model":"m","nodes":[4,5]}                    (all the vertices without "nodes")
+    {"id":6,"op":"models"}  {"id":7,"op":"unload","model":"m"}  {"id":8,"op":"stats","model":"m"}
+
+and the response is {"id":...,"ok":true,"result":...} or {"id":...,"ok":false,"error":"..."}.
+A connection may send requests without waiting for the responses; the responses are written as they are ready.
+
+The requests to a model are queued in the order they arrive (from all the connections). The requests arriving within
+--window seconds of each other are taken as a batch: the updates are applied with the mutation API (set_label, set_weight,
+add_edge, remove_edge), which only marks the affected successors as stale, and the predictions following them share
+one update_predictions pass over the stale vertices. A prediction never sees an update queued after it.
+The models are evaluated in a thread, so a slow client or a large batch does not stop the other connections.
+
+Usage:
+    python MAmodel/server.py --model m=models/a.yml --port 8765
+    python MAmodel/server.py --unix /tmp/mamodel.sock --window 0.005
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Optional
+
+from MAmodel import MAModel
+
+
+# operations queued to a model. The other operations are answered by the server at once.
+UPDATE_OPS = ("set_label","set_weight","add_edge","remove_edge")
+MODEL_OPS = UPDATE_OPS + ("predict","stats")
+
+
+class RequestError(Exception):
+    """An invalid request. Its message is returned as the error of the response."""
+
+
+class ModelWorker:
+    """
+    A model in memory and the queue of its requests, evaluated in batches.
+
+    Attributes:
+        name(str): name of the model in the requests.
+        model(MAModel): the model.
+        window(float): seconds to wait for more requests after the first of a batch.
+        max_batch(int): max number of requests of a batch.
+        batches(int): number of the batches evaluated, including the one being evaluated.
+        requests(int): number of the requests evaluated, including the one being evaluated.
+        passes(int): number of the update_predictions passes.
+        recomputed(int): number of the vertices recomputed by the passes.
+    """
+
+    def __init__(self,name:str,model:MAModel,window:float,max_batch:int):
+        self.name = name
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+
+        self.batches = 0
+        self.requests = 0
+        self.passes = 0
+        self.recomputed = 0
+
+        # whether an update was applied after the last pass.
+        self._stale = False
+        self._queue : asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+        return
+
+    def submit(self,request:dict)->asyncio.Future:
+        """Queue a request. The future is set to its result, or to the RequestError or the exception raised by it."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((request,future))
+        return future
+
+    async def close(self):
+        """Stop after the requests queued before."""
+        self._queue.put_nowait(None)
+        await self._task
+
+        return
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        closed = False
+        while not closed:
+            batch = [await self._queue.get()]
+
+            # the requests arriving within the window join the batch.
+            # (the queue is not read with wait_for, whose timeout may drop an item it has just got.)
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            # None is queued by close.
+            if None in batch:
+                closed = True
+                batch = batch[:batch.index(None)]
+                if not batch:
+                    break
+
+            results = await loop.run_in_executor(None,self._evaluate,[request for request,_ in batch])
+
+            for (_,future),(ok,value) in zip(batch,results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _evaluate(self,requests:list[dict])->list[tuple[bool,Any]]:
+        """
+        Evaluate a batch in order, in a thread of the executor (one batch of a model at a time).
+
+        Returns:
+            list[tuple[bool,Any]]: (True,result) or (False,exception) for each request
+        """
+        results = []
+
+        # counted before the requests are evaluated, so that stats includes its own batch and the requests up to itself.
+        self.batches += 1
+
+        for request in requests:
+            self.requests += 1
+            try:
+                op = request["op"]
+                if op in UPDATE_OPS:
+                    results.append((True,self._update(op,request)))
+                    self._stale = True
+                else:
+                    # one pass over the vertices made stale by the updates before this request.
+                    if self._stale:
+                        self.passes += 1
+                        self.recomputed += len(self.model.update_predictions())
+                        self._stale = False
+                    results.append((True,self._predict(request) if op == "predict" else self.stats()))
+            except Exception as e:
+                results.append((False,e))
+
+        return results
+
+    def _node(self,request:dict,key:str = "node")->Any:
+        """The vertex of the request, checked to be in the model."""
+        if key not in request:
+            raise RequestError(f"{key} is required")
+        node = request[key]
+        if not isinstance(node,(int,str)) or not self.model.graph.has_node(node):
+            raise RequestError(f"the vertex {node!r} is not in the model {self.name}")
+        return node
+
+    def _update(self,op:str,request:dict)->None:
+        model = self.model
+
+        if op == "set_label":
+            node = self._node(request)
+            if request.get("label") not in model.graph.graph['label_list']:
+                raise RequestError(f"label must be one of {model.graph.graph['label_list']}")
+            model.set_label(node,request["label"])
+
+        elif op == "set_weight":
+            node = self._node(request)
+            weight = request.get("weight")
+            if isinstance(weight,bool) or not isinstance(weight,(int,float)):
+                raise RequestError("weight must be a number")
+            model.set_weight(node,weight)
+
+        else:
+            u,v = self._node(request,"u"),self._node(request,"v")
+            attack = request.get("attack",True)
+            if op == "add_edge":
+                model.add_edge(u,v,attack)
+            else:
+                model.remove_edge(u,v,attack)
+
+        return None
+
+    def _predict(self,request:dict)->dict:
+        model = self.model
+        G = model.graph
+
+        if request.get("nodes") is None:
+            # the first prediction of all the vertices computes them all.
+            self.recomputed += len(model.update_predictions())
+            return {str(node):G.nodes[node]['predicted_labels'] for node in G.nodes}
+
+        nodes = [self._node({"node":node}) for node in request["nodes"]]
+        return {str(node):model.get_predicted_labels(node) for node in nodes}
+
+    def stats(self)->dict:
+        """Size of the model and the counters of the batches. A stats request counts its own batch and itself."""
+        return {
+            "num_vertex" : self.model.graph.number_of_nodes(),
+            "num_edges" : self.model.graph.number_of_edges(),
+            "batches" : self.batches,
+            "requests" : self.requests,
+            "passes" : self.passes,
+            "recomputed" : self.recomputed,
+        }
+
+
+class PredictionServer:
+    """
+    The models in memory and the connections.
+
+    Attributes:
+        workers(dict): {name : ModelWorker}
+        window(float): see ModelWorker.
+        max_batch(int): see ModelWorker.
+    """
+
+    def __init__(self,window:float = 0.002,max_batch:int = 1024):
+        self.workers : dict[str,ModelWorker] = {}
+        self.window = window
+        self.max_batch = max_batch
+
+        return
+
+    async def load(self,name:str,path:str)->dict:
+        """Read a .yml (or .npz) model and keep it as name, replacing the model of the same name."""
+        model = MAModel()
+        read = model.read_npz if path.endswith(".npz") else model.read_yaml
+        await asyncio.get_running_loop().run_in_executor(None,read,path)
+
+        if name in self.workers:
+            await self.workers.pop(name).close()
+        self.workers[name] = ModelWorker(name,model,self.window,self.max_batch)
+
+        return self.workers[name].stats()
+
+    async def handle_request(self,request:Any)->Any:
+        """
+        Run a request.
+
+        Raises:
+            RequestError: Raised when the request is invalid.
+
+        Returns:
+            Any: result of the request
+        """
+        if not isinstance(request,dict) or "op" not in request:
+            raise RequestError("a request is a JSON object with op")
+
+        op = request["op"]
+
+        if op in MODEL_OPS:
+            return await self._worker(request).submit(request)
+
+        if op == "load":
+            if not isinstance(request.get("model"),str) or not isinstance(request.get("path"),str):
+                raise RequestError("load requires model and path")
+            return await self.load(request["model"],request["path"])
+
+        if op == "unload":
+            await self.workers.pop(self._worker(request).name).close()
+            return None
+
+        if op == "models":
+            return {name:worker.stats() for name,worker in self.workers.items()}
+
+        raise RequestError(f"unknown op {op!r}")
+
+    def _worker(self,request:dict)->ModelWorker:
+        name = request.get("model")
+        if name not in self.workers:
+            raise RequestError(f"the model {name!r} is not loaded")
+        return self.workers[name]
+
+    async def handle_connection(self,reader:asyncio.StreamReader,writer:asyncio.StreamWriter):
+        """Read the requests of a connection, each answered by its own task so that the slow ones do not hold the others."""
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(line:bytes):
+            response = {}
+            try:
+                request = json.loads(line)
+                if isinstance(request,dict) and "id" in request:
+                    response["id"] = request["id"]
+                # the request is queued to its model before this task yields, keeping the order of the connection.
+                result = await self.handle_request(request)
+                response.update(ok=True,result=result)
+            except json.JSONDecodeError as e:
+                response.update(ok=False,error=f"invalid JSON: {e}")
+            except RequestError as e:
+                response.update(ok=False,error=str(e))
+            except Exception as e:
+                response.update(ok=False,error=f"{type(e).__name__}: {e}")
+
+            async with lock:
+                writer.write(json.dumps(response,default=str).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.get_running_loop().create_task(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                # start the task now so that the requests are queued in the order they were read.
+                await asyncio.sleep(0)
+
+            if tasks:
+                await asyncio.gather(*tasks,return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+        return
+
+
+async def serve(args:argparse.Namespace):
+    server = PredictionServer(window=args.window,max_batch=args.max_batch)
+
+    for item in args.model:
+        name,_,path = item.partition("=")
+        if not path:
+            name,path = os.path.splitext(os.path.basename(item))[0],item
+        start = time.perf_counter()
+        stats = await server.load(name,path)
+        print(f"loaded {name} ({stats['num_vertex']} vertices) in {time.perf_counter()-start:.2f}s",file=sys.stderr)
+
+    if args.unix is not None:
+        listener = await asyncio.start_unix_server(server.handle_connection,path=args.unix)
+    else:
+        listener = await asyncio.start_server(server.handle_connection,host=args.host,port=args.port)
+
+    print("listening on",", ".join(str(s.getsockname()) for s in listener.sockets),file=sys.stderr,flush=True)
+
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv:Optional[list[str]] = None)->int:
+
+    parser = argparse.ArgumentParser(description="Serve the predictions of MA models kept in memory.")
+    parser.add_argument("--model",action="append",default=[],help="name=path of a model to load (repeatable). The name defaults to the file name")
+    parser.add_argument("--host",default="127.0.0.1",help="host to listen on")
+    parser.add_argument("--port",type=int,default=8765,help="port to listen on")
+    parser.add_argument("--unix",default=None,help="path of a Unix socket to listen on instead of TCP")
+    parser.add_argument("--window",type=float,default=0.002,help="seconds to wait for more requests to batch with the first")
+    parser.add_argument("--max-batch",type=int,default=1024,help="max number of requests of a batch")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,620 @@
+"""Tests of MAModel: the fast paths give the same predicted labels as the per-vertex predict_labels of a fresh model.
+
+Usage:
+    python -m pytest MAmodel
+"""
+from __future__ import annotations
+import copy
+import itertools
+import math
+import random
+from fractions import Fraction
+from typing import Optional
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from MAmodel import CompactMAModel, MAModel
+
+
+def make_model(num_vertex:int = 60,use_extended_conditions:bool = False,seed:int = 0,max_degree:int = 4)->MAModel:
+    """A random model made with the seeded generators."""
+    model = MAModel()
+    model.generate_graph(num_vertex=num_vertex,max_indegree=max_degree,max_outdegree=max_degree,seed=seed)
+    model.attach_label_randomly(seed=seed+1)
+    model.attach_skew_types(only='any',seed=seed+2)
+    model.attach_conditions(use_extended_conditions=use_extended_conditions,seed=seed+3)
+
+    return model
+
+
+def reference_labels(model:MAModel)->dict:
+    """predict_labels of every vertex of a fresh model with a copy of the graph (nothing cached)."""
+    fresh = MAModel()
+    fresh.graph = copy.deepcopy(model.graph)
+    fresh.only_attack = model.only_attack
+    fresh.exact_arithmetic = model.exact_arithmetic
+
+    return {u:fresh.predict_labels(u) for u in fresh.graph.nodes}
+
+
+def with_decimal_weights(model:MAModel,seed:int)->MAModel:
+    """Weights 0.1-0.9, whose sums in floating point depend on the order of the additions."""
+    rng = random.Random(seed)
+    for u in model.graph.nodes:
+        model.graph.nodes[u]['weight'] = rng.randint(1,9) / 10
+    model.reset_caches()
+
+    return model
+
+
+def shuffle_in_edges(model:MAModel,seed:int)->MAModel:
+    """The same graph with the edges added in a shuffled order, so that the in-edges of every vertex are in another order."""
+    G = model.graph
+    edges = list(G.edges(data=True))
+    random.Random(seed).shuffle(edges)
+
+    H = nx.MultiDiGraph()
+    H.graph.update(G.graph)
+    H.add_nodes_from(G.nodes(data=True))
+    H.add_edges_from(edges)
+    model.graph = H
+    model.reset_caches()
+
+    return model
+
+
+@pytest.mark.parametrize("decimal_weights",[False,True])
+@pytest.mark.parametrize("exact_arithmetic",[False,True])
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+@pytest.mark.parametrize("seed",[0,1,2])
+def test_predict_all_matches_predict_labels(seed,use_extended_conditions,exact_arithmetic,decimal_weights):
+    model = make_model(use_extended_conditions=use_extended_conditions,seed=seed)
+    if decimal_weights:
+        shuffle_in_edges(with_decimal_weights(model,seed),seed)
+    model.exact_arithmetic = exact_arithmetic
+    expected = reference_labels(model)
+
+    assert model.compute_all() == expected
+    assert model.predict_all() == expected
+    assert dict(model.graph.nodes(data='predicted_labels')) == expected
+
+
+@pytest.mark.parametrize("decimal_weights",[False,True])
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+def test_predict_all_workers(use_extended_conditions,decimal_weights):
+    model = make_model(num_vertex=300,use_extended_conditions=use_extended_conditions,seed=11)
+    if decimal_weights:
+        shuffle_in_edges(with_decimal_weights(model,11),11)
+    expected = reference_labels(model)
+
+    assert model.predict_all(workers=2,shards_per_worker=3) == expected
+    assert dict(model.graph.nodes(data='predicted_labels')) == expected
+
+
+@pytest.mark.parametrize("decimal_weights",[False,True])
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+def test_mutation_api_matches_predict_labels(use_extended_conditions,decimal_weights):
+    model = make_model(use_extended_conditions=use_extended_conditions,seed=4)
+    if decimal_weights:
+        with_decimal_weights(model,4)
+    G = model.graph
+    nodes = list(G.nodes)
+    label_list = G.graph['label_list']
+    rng = random.Random(4)
+    model.predict_all()
+
+    for step in range(200):
+        op = rng.choice(["set_label","set_weight","add_edge","remove_edge"])
+        if op == "set_label":
+            model.set_label(rng.choice(nodes),rng.choice(label_list))
+        elif op == "set_weight":
+            model.set_weight(rng.choice(nodes),(rng.randint(1,9) / 10) if decimal_weights else rng.randint(1,5))
+        elif op == "add_edge":
+            model.add_edge(rng.choice(nodes),rng.choice(nodes),rng.random() < 0.7)
+        elif G.number_of_edges() > 0:
+            u,v,attack = rng.choice(list(G.edges(data='attack')))
+            model.remove_edge(u,v,attack)
+
+        if step % 20 == 19:
+            expected = reference_labels(model)
+            if step % 40 == 19:
+                model.update_predictions()
+                assert dict(G.nodes(data='predicted_labels')) == expected
+            assert {u:model.get_predicted_labels(u) for u in nodes} == expected
+
+
+def test_mutation_api_decimal_weights_no_op():
+    model = _decimal_model((1,2,3,4))
+    expected = model.predict_all()
+
+    model.set_weight(4,0.6)
+
+    assert model.get_predicted_labels(0) == expected[0]
+    assert model.predict_labels(0) == expected[0]
+
+
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+def test_compiled_conditions_follow_attack_flips(use_extended_conditions):
+    model = make_model(use_extended_conditions=use_extended_conditions,seed=16)
+    G = model.graph
+    assert {u:model.predict_labels(u) for u in G.nodes} == reference_labels(model)
+
+    # flip the attack of the edges in place, keeping the in-degrees.
+    for u,v,key in list(G.edges(keys=True))[::3]:
+        G.edges[u,v,key]['attack'] = not G.edges[u,v,key]['attack']
+
+    expected = reference_labels(model)
+    assert {u:model.compute_labels(u) for u in G.nodes} == expected
+    assert {u:model.predict_labels(u) for u in G.nodes} == expected
+
+
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+def test_compiled_conditions_follow_rewiring(use_extended_conditions):
+    model = make_model(use_extended_conditions=use_extended_conditions,seed=17)
+    G = model.graph
+    nodes = list(G.nodes)
+    {u:model.predict_labels(u) for u in nodes}
+
+    # move an in-edge of each vertex to another tail, keeping the in-degree: directly, and by the mutation API.
+    for k,v in enumerate(nodes[:len(nodes) // 2]):
+        in_edges = list(G.in_edges(v,keys=True,data='attack'))
+        if not in_edges:
+            continue
+        u,_,key,attack = in_edges[0]
+        w = nodes[(nodes.index(u) + 1 + k) % len(nodes)]
+        if k % 2 == 0:
+            G.remove_edge(u,v,key=key)
+            G.add_edge(w,v,attack=attack,color=("red" if attack else "blue"))
+        else:
+            model.remove_edge(u,v,attack)
+            model.add_edge(w,v,attack)
+
+    expected = reference_labels(model)
+    assert {u:model.compute_labels(u) for u in nodes} == expected
+    assert {u:model.predict_labels(u) for u in nodes} == expected
+
+
+def _decimal_model(order:tuple)->MAModel:
+    """Vertex 0 with the condition ('+',2,3), attacked by 1,2,3 (label 1, weights 0.1,0.3,0.2) and 4 (label 2, weight 0.6) in the order of order."""
+    G = nx.MultiDiGraph()
+    G.graph['label_list'] = [1,2,3]
+    weights = [1,0.1,0.3,0.2,0.6]
+    for u in range(5):
+        G.add_node(u,label=(2 if u == 4 else 1),weight=weights[u],skew_type='neutral',conditions=([('+',2,3)] if u == 0 else []))
+    for u in order:
+        G.add_edge(u,0,attack=True,color="red")
+
+    model = MAModel()
+    model.graph = G
+    model.only_attack = True
+
+    return model
+
+
+@pytest.mark.parametrize("order",list(itertools.permutations([1,2,3,4])))
+def test_compiled_conditions_sum_in_the_order_of_the_vertices(order):
+    model = _decimal_model(order)
+    expected = _decimal_model((1,2,3,4)).compute_all()
+
+    assert model.compute_all() == expected
+    assert model.compute_labels(0) == expected[0]
+    assert model.predict_labels(0) == expected[0]
+    assert model.predict_all() == expected
+
+
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+@pytest.mark.parametrize("seed",[0,1,2])
+def test_compiled_conditions_decimal_weights_shuffled_edges(seed,use_extended_conditions):
+    model = make_model(num_vertex=200,use_extended_conditions=use_extended_conditions,seed=seed,max_degree=6)
+    shuffle_in_edges(with_decimal_weights(model,seed),seed)
+    expected = model.compute_all()
+
+    assert {u:model.compute_labels(u) for u in model.graph.nodes} == expected
+    assert {u:model.predict_labels(u) for u in model.graph.nodes} == expected
+
+
+def test_reset_caches_after_direct_edits():
+    model = make_model(seed=18)
+    G = model.graph
+    model.predict_all()
+
+    for u,v,key in list(G.edges(keys=True))[::2]:
+        G.edges[u,v,key]['attack'] = not G.edges[u,v,key]['attack']
+    model.reset_caches()
+
+    expected = reference_labels(model)
+    assert model.update_predictions() == expected
+    assert {u:model.get_predicted_labels(u) for u in G.nodes} == expected
+
+
+def reference_judges(model:MAModel)->dict:
+    """get_judges of every vertex after predict_labels of a fresh model with a copy of the graph."""
+    fresh = MAModel()
+    fresh.graph = copy.deepcopy(model.graph)
+    fresh.exact_arithmetic = model.exact_arithmetic
+    fresh.trace_judges = True
+    for u in fresh.graph.nodes:
+        fresh.predict_labels(u)
+
+    return {u:fresh.get_judges(u) for u in fresh.graph.nodes}
+
+
+@pytest.mark.parametrize("position",[0,-1])
+def test_judge_trace_follows_direct_edits_of_conditions(position):
+    model = make_model(num_vertex=30,seed=14)
+    model.trace_judges = True
+    model.predict_all()
+    G = model.graph
+    nodes = list(G.nodes)
+
+    # the conditions of a vertex (the first or the last) are edited directly: one more condition.
+    u = nodes[position]
+    G.nodes[u]['conditions'] = list(G.nodes[u]['conditions']) + [('+',0,1),('-',1,2)]
+    model.predict_labels(u)
+
+    expected = reference_judges(model)
+    assert model.get_judges(u) == expected[u]
+    assert len(model.get_judges(u)) == len(G.nodes[u]['conditions'])
+    assert {v:model.get_judges(v) for v in nodes} == expected
+
+    # and one condition less.
+    G.nodes[u]['conditions'] = G.nodes[u]['conditions'][:1]
+    model.predict_labels(u)
+    assert model.get_judges(u) == reference_judges(model)[u]
+
+    model.predict_all()
+    assert {v:model.get_judges(v) for v in nodes} == reference_judges(model)
+
+
+@pytest.mark.parametrize("by_api",[False,True])
+def test_structure_summary_follows_rewiring(by_api):
+    model = make_model(num_vertex=40,seed=21)
+    G = model.graph
+    model._structure_summary()
+
+    # reverse edges by the mutation API, or directly and then reset_caches, keeping the numbers of vertices and edges.
+    for u,v,key,attack in list(G.edges(keys=True,data='attack'))[::4]:
+        if by_api:
+            model.remove_edge(u,v,attack)
+            model.add_edge(v,u,attack)
+        else:
+            G.remove_edge(u,v,key=key)
+            G.add_edge(v,u,attack=attack,color=("red" if attack else "blue"))
+    if not by_api:
+        model.reset_caches()
+
+    summary = model._structure_summary()
+    fresh = MAModel()
+    fresh.graph = copy.deepcopy(G)
+
+    assert summary['num_scc'] == fresh.attach_scc_id()[1]
+    assert summary['max_indegree'] == max(d for _,d in G.in_degree())
+    assert summary['max_outdegree'] == max(d for _,d in G.out_degree())
+    assert dict(G.nodes(data='scc_id')) == dict(fresh.graph.nodes(data='scc_id'))
+
+
+def _is_consistent(model:MAModel,labeling:dict)->bool:
+    """Whether the label of every vertex is in its predicted labels under labeling (the labels of the model are restored)."""
+    G = model.graph
+    saved = dict(G.nodes(data='label'))
+    try:
+        for u,label in labeling.items():
+            G.nodes[u]['label'] = label
+        return all(G.nodes[u]['label'] in model.compute_labels(u) for u in G.nodes)
+    finally:
+        for u,label in saved.items():
+            G.nodes[u]['label'] = label
+
+
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+@pytest.mark.parametrize("seed",range(8))
+def test_enumerate_consistent_labelings_matches_brute_force(seed,use_extended_conditions):
+    model = make_model(num_vertex=3 + seed % 3,use_extended_conditions=use_extended_conditions,seed=seed,max_degree=3)
+    G = model.graph
+    nodes = list(G.nodes)
+    saved = dict(G.nodes(data='label'))
+
+    enumerated = [tuple(labeling[u] for u in nodes) for labeling in model.enumerate_consistent_labelings()]
+    brute_force = [
+        labels for labels in itertools.product(G.graph['label_list'],repeat=len(nodes))
+        if _is_consistent(model,dict(zip(nodes,labels)))
+    ]
+
+    assert len(enumerated) == len(set(enumerated))
+    assert sorted(enumerated) == sorted(brute_force)
+    assert dict(G.nodes(data='label')) == saved
+
+
+def test_enumerate_consistent_labelings_many_sccs():
+    # only the edges to larger vertices are kept: every vertex is an SCC (more than the default recursion limit).
+    model = make_model(num_vertex=3000,seed=13,max_degree=2)
+    G = model.graph
+    G.remove_edges_from([(u,v,key) for u,v,key in G.edges(keys=True) if u >= v])
+    model.attach_conditions(seed=13)
+    model.reset_caches()
+
+    assert model.attach_scc_id()[1] == 3000
+
+    labelings = []
+    for labeling in model.enumerate_consistent_labelings():
+        labelings.append(labeling)
+        if len(labelings) == 3:
+            break
+
+    assert labelings
+    assert all(_is_consistent(model,labeling) for labeling in labelings)
+
+
+def test_enumerate_consistent_labelings_large_scc():
+    # a cycle through all the vertices: one SCC with more vertices than the default recursion limit.
+    model = make_model(num_vertex=3000,seed=14,max_degree=2)
+    G = model.graph
+    G.remove_edges_from(list(G.edges(keys=True)))
+    for u in range(3000):
+        G.add_edge(u,(u+1) % 3000,attack=(u % 3 != 0),color=("red" if u % 3 != 0 else "blue"))
+    model.attach_conditions(seed=14)
+    model.reset_caches()
+
+    assert model.attach_scc_id()[1] == 1
+
+    labelings = []
+    for labeling in model.enumerate_consistent_labelings():
+        labelings.append(labeling)
+        if len(labelings) == 3:
+            break
+
+    assert all(_is_consistent(model,labeling) for labeling in labelings)
+
+
+def _graph_contents(model:MAModel)->tuple:
+    """The vertices, the edges and the attributes read and written by the files, to compare two models."""
+    G = model.graph
+    node_keys = ('label','skew_type','weight','opinion')
+    nodes = [
+        (u,{key:G.nodes[u][key] for key in node_keys if key in G.nodes[u]},[tuple(c) for c in G.nodes[u]['conditions']])
+        for u in G.nodes
+    ]
+    edges = sorted((u,v,key,bool(attack)) for u,v,key,attack in G.edges(keys=True,data='attack'))
+
+    return G.graph['label_list'],nodes,edges,bool(model.only_attack)
+
+
+def _with_multiple_edges(model:MAModel,seed:int)->MAModel:
+    """Add parallel edges (the same tail and head, attack and support) to some of the edges."""
+    G = model.graph
+    rng = random.Random(seed)
+    for u,v,attack in rng.sample(list(G.edges(data='attack')),10):
+        G.add_edge(u,v,attack=not attack,color=("blue" if attack else "red"))
+        G.add_edge(u,v,attack=attack,color=("red" if attack else "blue"))
+    model.only_attack = False
+    model.reset_caches()
+
+    return model
+
+
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+def test_npz_round_trip(tmp_path,use_extended_conditions):
+    model = _with_multiple_edges(with_decimal_weights(make_model(use_extended_conditions=use_extended_conditions,seed=6),6),6)
+    model.save_npz(str(tmp_path / "model.npz"))
+
+    loaded = MAModel()
+    loaded.read_npz(str(tmp_path / "model.npz"))
+    assert _graph_contents(loaded) == _graph_contents(model)
+    assert loaded.predict_all() == model.predict_all()
+
+    compact = CompactMAModel()
+    compact.read_npz(str(tmp_path / "model.npz"))
+    compact.save_npz(str(tmp_path / "compact.npz"))
+    loaded = MAModel()
+    loaded.read_npz(str(tmp_path / "compact.npz"))
+    assert _graph_contents(loaded) == _graph_contents(model)
+
+    assert _graph_contents(CompactMAModel.from_model(model).to_model()) == _graph_contents(model)
+
+
+@pytest.mark.parametrize("decimal_weights",[False,True])
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+def test_compact_predict_all_matches_predict_all(use_extended_conditions,decimal_weights):
+    model = make_model(num_vertex=200,use_extended_conditions=use_extended_conditions,seed=7)
+    if decimal_weights:
+        shuffle_in_edges(with_decimal_weights(model,7),7)
+    _with_multiple_edges(model,7)
+    expected = model.predict_all()
+
+    compact = CompactMAModel.from_model(model)
+    compact.predict_all()
+
+    assert {u:compact.get_predicted_labels(i) for i,u in enumerate(compact.nodes.tolist())} == expected
+    assert dict(compact.to_model().graph.nodes(data='predicted_labels')) == expected
+
+
+def _labels_at(model:MAModel,u,v,weight)->list:
+    """compute_labels of v when the weight of u is weight (the weight is restored)."""
+    G = model.graph
+    saved = G.nodes[u]['weight']
+    G.nodes[u]['weight'] = weight
+    try:
+        return model.compute_labels(v)
+    finally:
+        G.nodes[u]['weight'] = saved
+
+
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+def test_weight_sensitivity_bounds_exact(use_extended_conditions):
+    model = with_decimal_weights(make_model(num_vertex=40,use_extended_conditions=use_extended_conditions,seed=19),19)
+    model.exact_arithmetic = True
+    G = model.graph
+    delta = Fraction(1,10**9)
+
+    checked = 0
+    for u,intervals in model.weight_sensitivity().items():
+        for v,interval in intervals.items():
+            current = model.compute_labels(v)
+            assert Fraction(G.nodes[u]['weight']) in interval
+
+            # the bound itself is in the interval if it is closed, otherwise the labels change at the bound.
+            for bound,closed,side in ((interval.low,interval.low_closed,-1),(interval.high,interval.high_closed,1)):
+                if math.isinf(bound):
+                    continue
+                inside = bound if closed else bound - side * delta
+                outside = bound + side * delta if closed else bound
+                assert _labels_at(model,u,v,Fraction(inside)) == current
+                assert _labels_at(model,u,v,Fraction(outside)) != current
+                checked += 1
+
+    assert checked > 0
+
+
+def test_weight_sensitivity_bounds_float():
+    # the bounds are exact. In floating point, the labels are checked away from the rounding errors at the bounds.
+    model = with_decimal_weights(make_model(num_vertex=40,seed=20),20)
+    delta = 1e-6
+
+    checked = 0
+    for u,intervals in model.weight_sensitivity().items():
+        for v,interval in intervals.items():
+            current = model.compute_labels(v)
+            for bound,closed,side in ((interval.low,interval.low_closed,-1),(interval.high,interval.high_closed,1)):
+                if math.isinf(bound):
+                    continue
+                assert _labels_at(model,u,v,float(bound) - side * delta) == current
+                if closed:
+                    assert _labels_at(model,u,v,float(bound) + side * delta) != current
+                checked += 1
+
+    assert checked > 0
+
+
+@pytest.mark.parametrize("exact_arithmetic",[False,True])
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+def test_predict_scenarios_matches_predict_all(use_extended_conditions,exact_arithmetic):
+    model = shuffle_in_edges(make_model(num_vertex=80,use_extended_conditions=use_extended_conditions,seed=21,max_degree=12),21)
+    model.exact_arithmetic = exact_arithmetic
+    nodes = list(model.graph.nodes)
+    rng = random.Random(21)
+    weights = np.array([[rng.randint(1,9) / 10 for _ in nodes] for _ in range(7)])
+
+    codes = model.predict_scenarios(weights,chunk_size=3)
+
+    assert codes.shape == weights.shape
+    for row,scenario in zip(codes,weights):
+        expected = copy.deepcopy(model)
+        for u,weight in zip(nodes,scenario.tolist()):
+            expected.graph.nodes[u]['weight'] = weight
+        expected.reset_caches()
+        labels = expected.predict_all()
+        assert {u:model.judge_labels(code) for u,code in zip(nodes,row)} == labels
+
+
+@pytest.mark.parametrize("exact_arithmetic",[False,True])
+def test_predict_scenarios_decimal_weights(exact_arithmetic):
+    # the sums of the permuted weights differ in floating point, and the judge is on the border.
+    model = _decimal_model((1,2,3,4))
+    model.exact_arithmetic = exact_arithmetic
+    weights = np.array([[1,*perm] for perm in itertools.permutations([0.1,0.3,0.2,0.6])])
+
+    codes = model.predict_scenarios(weights,chunk_size=5)
+
+    for row,scenario in zip(codes,weights):
+        expected = copy.deepcopy(model)
+        for u,weight in enumerate(scenario.tolist()):
+            expected.graph.nodes[u]['weight'] = weight
+        assert [model.judge_labels(code) for code in row] == list(expected.predict_all().values())
+
+
+def _naive_dynamics(model:MAModel,mode:str,order:Optional[list] = None,max_steps:int = 300)->tuple:
+    """run_dynamics predicting every vertex with a fresh model at every step.
+
+    Returns:
+        tuple: converged, cycle_start, cycle_length and the final labels.
+    """
+    G = copy.deepcopy(model.graph)
+    nodes = list(G.nodes) if order is None else order
+
+    def next_label(u):
+        fresh = MAModel()
+        fresh.graph = G
+        fresh.only_attack = model.only_attack
+        fresh.exact_arithmetic = model.exact_arithmetic
+        label = G.nodes[u]['label']
+        predicted = fresh.predict_labels(u)
+        return label if not predicted or label in predicted else predicted[0]
+
+    states = [dict(G.nodes(data='label'))]
+    while len(states) <= max_steps:
+        if mode == 'sync':
+            labels = {u:next_label(u) for u in nodes}
+            for u,label in labels.items():
+                G.nodes[u]['label'] = label
+        else:
+            for u in nodes:
+                G.nodes[u]['label'] = next_label(u)
+
+        state = dict(G.nodes(data='label'))
+        if state == states[-1]:
+            return True,None,None,state
+        if state in states:
+            start = states.index(state)
+            return False,start,len(states) - start,state
+        states.append(state)
+
+    return False,None,None,states[-1]
+
+
+def _dynamics_outcome(model:MAModel,result)->tuple:
+    return result.converged,result.cycle_start,result.cycle_length,dict(model.graph.nodes(data='label'))
+
+
+# small dense models, about half of which end in a cycle (e.g. seed 6 in a cycle of length 4 in sync).
+@pytest.mark.parametrize("mode",['sync','async'])
+@pytest.mark.parametrize("seed",range(24))
+def test_run_dynamics_matches_naive_loop(seed,mode):
+    model = make_model(num_vertex=10,seed=seed,max_degree=6)
+    expected = _naive_dynamics(model,mode)
+
+    result = model.run_dynamics(mode=mode,max_steps=300)
+
+    assert _dynamics_outcome(model,result) == expected
+    assert result.changes == sum(len(changed) for changed in result.history)
+
+
+@pytest.mark.parametrize("seed",range(8))
+def test_run_dynamics_async_order(seed):
+    model = make_model(num_vertex=20,seed=seed,max_degree=3)
+    order = list(model.graph.nodes)
+    random.Random(seed).shuffle(order)
+    expected = _naive_dynamics(model,'async',order)
+
+    result = model.run_dynamics(mode='async',max_steps=300,order=order)
+
+    assert _dynamics_outcome(model,result) == expected
+
+    with pytest.raises(ValueError):
+        model.run_dynamics(mode='async',order=order[1:])
+
+
+@pytest.mark.parametrize("mode",['sync','async'])
+def test_run_dynamics_frontier(mode):
+    model = make_model(num_vertex=60,seed=0)
+    assert model.run_dynamics(mode=mode).converged
+
+    # after the fixed point, only the changed vertices and their successors can be unstable.
+    G = model.graph
+    rng = random.Random(17)
+    frontier = set()
+    for u in rng.sample(list(G.nodes),3):
+        model.set_label(u,rng.choice([label for label in G.graph['label_list'] if label != G.nodes[u]['label']]))
+        frontier.add(u)
+        frontier.update(G.successors(u))
+    full = copy.deepcopy(model)
+    expected = _naive_dynamics(model,mode)
+
+    result = model.run_dynamics(mode=mode,frontier=frontier)
+    full_result = full.run_dynamics(mode=mode)
+
+    assert _dynamics_outcome(model,result) == expected
+    assert result.history == full_result.history
+    assert result.frontier_sizes[0] == len(frontier)
+    assert result.evaluations < full_result.evaluations
@@ -0,0 +1,80 @@
+"""Tests of the Monte Carlo experiment: a resumed run and the number of workers do not change the results.
+
+Usage:
+    python -m pytest MAmodel
+"""
+from __future__ import annotations
+import json
+
+import pytest
+
+import experiment
+
+
+def _run(tmp_path,name:str,*args:str)->tuple[str,str]:
+    output = str(tmp_path / f"{name}.jsonl")
+    summary = str(tmp_path / f"{name}.json")
+    assert experiment.main(["--trials","40","--num-vertex","8","--seed","3","--summary-every","7",
+                            "--output",output,"--summary",summary,*args]) == 0
+
+    return output,summary
+
+
+def _results(output:str,summary:str)->tuple[dict,dict]:
+    """The records by trial and the summary, without the times. Every line must be a whole JSON object."""
+    with open(output) as f:
+        lines = [json.loads(line) for line in f]
+    assert "config" in lines[0] and all("config" not in line for line in lines[1:])
+
+    records = {}
+    for record in lines[1:]:
+        assert record["trial"] not in records
+        record.pop("seconds")
+        records[record["trial"]] = record
+
+    with open(summary) as f:
+        summary = json.load(f)
+    summary.pop("trial_seconds")
+
+    return records,summary
+
+
+def _cut(output:str,lines:int,fraction:float):
+    """Keep the first lines of the output and a part of the next one, as an interruption would."""
+    with open(output,"rb") as f:
+        data = f.read().splitlines(keepends=True)
+    with open(output,"wb") as f:
+        f.write(b"".join(data[:lines]) + data[lines][:int(len(data[lines]) * fraction)])
+
+    return
+
+
+def test_workers_do_not_change_the_results(tmp_path):
+    expected = _results(*_run(tmp_path,"one","--workers","1"))
+
+    assert _results(*_run(tmp_path,"two","--workers","2")) == expected
+    assert expected[1]["trials"] == 40
+
+
+@pytest.mark.parametrize("lines",[0,1,13])
+@pytest.mark.parametrize("workers",["1","2"])
+def test_resume_after_a_cut_line(tmp_path,workers,lines):
+    expected = _results(*_run(tmp_path,"full","--workers","1"))
+
+    output,summary = _run(tmp_path,"cut","--workers",workers)
+    _cut(output,lines,0.5)
+    with open(output,"rb") as f:
+        kept = f.read()
+    kept = kept[:kept.rfind(b"\n")+1]
+    _run(tmp_path,"cut","--workers",workers,"--resume")
+
+    # the finished trials are not run again.
+    with open(output,"rb") as f:
+        assert f.read().startswith(kept)
+    assert _results(output,summary) == expected
+
+
+def test_resume_with_another_configuration(tmp_path):
+    output,_ = _run(tmp_path,"a","--workers","1")
+
+    assert experiment.main(["--trials","40","--num-vertex","9","--seed","3","--output",output,"--summary",str(tmp_path / "b.json"),"--resume"]) == 1
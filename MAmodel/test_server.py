@@ -0,0 +1,143 @@
+"""Tests of the prediction server: the batched requests give the same predictions as predict_labels on a copy of the model.
+
+Usage:
+    python -m pytest MAmodel
+"""
+from __future__ import annotations
+import asyncio
+import copy
+import random
+
+import networkx as nx
+import pytest
+
+from server import PredictionServer, RequestError
+from test_MAmodel import make_model, reference_labels
+
+
+def _requests_and_expected(model,seed:int,num_requests:int = 120)->tuple[list[dict],list]:
+    """Random updates and predictions, and the result of each request applied in order to a copy of the model."""
+    reference = copy.deepcopy(model)
+    G = reference.graph
+    nodes = list(G.nodes)
+    label_list = G.graph['label_list']
+    rng = random.Random(seed)
+
+    requests,expected = [],[]
+    for i in range(num_requests):
+        op = rng.choice(["set_label","set_weight","add_edge","remove_edge","predict","predict"])
+        request = {"id":i,"op":op,"model":"m"}
+
+        if op == "set_label":
+            request.update(node=rng.choice(nodes),label=rng.choice(label_list))
+            reference.set_label(request["node"],request["label"])
+        elif op == "set_weight":
+            request.update(node=rng.choice(nodes),weight=rng.randint(1,5))
+            reference.set_weight(request["node"],request["weight"])
+        elif op == "add_edge":
+            request.update(u=rng.choice(nodes),v=rng.choice(nodes),attack=rng.random() < 0.7)
+            reference.add_edge(request["u"],request["v"],request["attack"])
+        elif op == "remove_edge" and G.number_of_edges() > 0:
+            u,v,attack = rng.choice(list(G.edges(data='attack')))
+            request.update(u=u,v=v,attack=attack)
+            reference.remove_edge(u,v,attack)
+        else:
+            request["op"] = "predict"
+            if rng.random() < 0.7:
+                request["nodes"] = rng.sample(nodes,5)
+            labels = reference_labels(reference)
+            requests.append(request)
+            expected.append({str(node):labels[node] for node in request.get("nodes",nodes)})
+            continue
+
+        requests.append(request)
+        expected.append(None)
+
+    return requests,expected
+
+
+async def _loaded_server(tmp_path,model,window:float,max_batch:int = 1024)->PredictionServer:
+    path = str(tmp_path / "m.npz")
+    model.save_npz(path)
+    server = PredictionServer(window=window,max_batch=max_batch)
+    await server.handle_request({"op":"load","model":"m","path":path})
+
+    return server
+
+
+@pytest.mark.parametrize("window",[0,0.01])
+@pytest.mark.parametrize("use_extended_conditions",[False,True])
+def test_interleaved_requests_match_predict_labels(tmp_path,use_extended_conditions,window):
+    model = make_model(use_extended_conditions=use_extended_conditions,seed=24)
+    requests,expected = _requests_and_expected(model,24)
+
+    async def run():
+        server = await _loaded_server(tmp_path,model,window)
+        # the requests are queued in the order of the tasks, without waiting for the responses.
+        results = await asyncio.gather(*(server.handle_request(request) for request in requests))
+        stats = await server.handle_request({"op":"stats","model":"m"})
+        await server.handle_request({"op":"unload","model":"m"})
+        return results,stats
+
+    results,stats = asyncio.run(run())
+
+    assert results == expected
+    assert stats["requests"] == len(requests) + 1
+    if window > 0:
+        assert stats["batches"] < len(requests)
+
+
+def test_batches_and_stats(tmp_path):
+    model = make_model(seed=25)
+    nodes = list(model.graph.nodes)
+
+    async def run():
+        server = await _loaded_server(tmp_path,model,window=0.05,max_batch=4)
+        requests = [{"op":"set_weight","model":"m","node":node,"weight":2} for node in nodes[:6]]
+        requests.append({"op":"stats","model":"m"})
+        results = await asyncio.gather(*(server.handle_request(request) for request in requests))
+        stats = await server.handle_request({"op":"stats","model":"m"})
+        return results[-1],stats
+
+    in_batch,stats = asyncio.run(run())
+
+    # 7 requests in batches of 4: the stats request counts its own batch and the requests before it.
+    assert (in_batch["batches"],in_batch["requests"]) == (2,7)
+    assert (stats["batches"],stats["requests"]) == (3,8)
+    assert stats["num_vertex"] == len(nodes)
+
+
+def test_error_responses(tmp_path):
+    model = make_model(seed=26)
+    u = next(iter(model.graph.nodes))
+    label = model.graph.graph['label_list'][0]
+    assert not model.graph.has_edge(u,u)
+
+    async def run():
+        server = await _loaded_server(tmp_path,model,window=0.01)
+        for request,message in (([1,2],"JSON object with op"),({"model":"m"},"JSON object with op"),
+                                ({"op":"no_such_op"},"unknown op"),({"op":"predict","model":"x"},"'x' is not loaded"),
+                                ({"op":"load","model":"m"},"load requires model and path"),
+                                ({"op":"set_label","model":"m","node":"no_such_vertex","label":label},"'no_such_vertex' is not in the model m"),
+                                ({"op":"set_label","model":"m","node":u,"label":"no_such_label"},"label must be one of"),
+                                ({"op":"set_weight","model":"m","node":u,"weight":"heavy"},"weight must be a number"),
+                                ({"op":"predict","model":"m","nodes":[u,"no_such_vertex"]},"'no_such_vertex' is not in the model m")):
+            with pytest.raises(RequestError,match=message):
+                await server.handle_request(request)
+
+        # a failing request in a batch does not stop the requests after it.
+        results = await asyncio.gather(
+            server.handle_request({"op":"set_label","model":"m","node":u,"label":label}),
+            server.handle_request({"op":"remove_edge","model":"m","u":u,"v":u,"attack":True}),
+            server.handle_request({"op":"predict","model":"m","nodes":[u]}),
+            return_exceptions=True,
+        )
+        return results
+
+    results = asyncio.run(run())
+
+    assert results[0] is None
+    assert isinstance(results[1],nx.NetworkXError)
+    expected = copy.deepcopy(model)
+    expected.set_label(u,label)
+    assert results[2] == {str(u):reference_labels(expected)[u]}